@@ -0,0 +1,67 @@
+"""
+Benchmark de concurrencia para /chat y /ingest/list.
+
+Uso (con el backend levantado):
+    python benchmarks/bench_endpoints.py --base-url http://localhost:8000 --requests 200 --concurrency 20
+
+Correrlo antes y después de un cambio sobre el mismo dataset y comparar req/s y p99.
+"""
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_ID = "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11"
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(name, call, total, concurrency):
+    # Pool del cliente del tamaño de la concurrencia: con el default (10) las conexiones de más se
+    # cierran y reabren, y la latencia de cola medida sería la del cliente, no la del servidor
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    latencies, errors = [], 0
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            call(session).raise_for_status()
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, error in pool.map(one, range(total)):
+            latencies.append(latency)
+            errors += error is not None
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{name:<14} {total / elapsed:8.1f} req/s | "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms | "
+        f"p99 {_percentile(latencies, 99) * 1000:7.1f} ms | errores {errors}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--message", default="Hola")
+    args = parser.parse_args()
+
+    base = args.base_url.rstrip("/")
+    run("/ingest/list", lambda s: s.get(f"{base}/ingest/list", params={"user_id": USER_ID}),
+        args.requests, args.concurrency)
+    run("/chat", lambda s: s.post(f"{base}/chat", json={"user_id": USER_ID, "message": args.message}),
+        args.requests, args.concurrency)
@@ -1,5 +1,6 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import os
 from dotenv import load_dotenv
 
@@ -33,4 +34,30 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# --- CAPA ASÍNCRONA (asyncpg) ---
+# Los endpoints async usan esta sesión para no bloquear el event loop.
+# pandas (to_sql) y los agentes que corren en hilos siguen usando el engine síncrono.
+def _to_async_url(url: str) -> str:
+    if "+psycopg2" in url:
+        return url.replace("+psycopg2", "+asyncpg", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _to_async_url(DATABASE_URL))
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=False,
+    pool_pre_ping=True
+)
+
+# expire_on_commit=False: los objetos siguen siendo legibles después del commit (sin lazy-load)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Dependencia Asíncrona
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,5 +1,5 @@
 import asyncio
-from database import engine, Base
+from database import async_engine as engine, Base
 from models import User, DataSource, DataAsset, UserLimits, UsageLog
 
 async def create_tables():
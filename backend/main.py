@@ -1,40 +1,53 @@
-import shutil
 import os
-import io
-import csv 
 import uuid
-import pandas as pd
-import requests
-import PyPDF2
-from decimal import Decimal
-from typing import Union, Optional, List
+import json
+import asyncio
+import datetime
+from typing import Optional
 
 from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import OperationalError
-from sqlalchemy import create_engine, text, inspect
-
-from docx import Document
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, inspect, select
 
 # --- IMPORTS DE SERVICIOS Y BASE DE DATOS ---
-from database import get_db, engine
+from database import get_async_db, engine, async_engine, AsyncSessionLocal
 import models
-import schemas
 
 # Servicios de Inteligencia Artificial (Agentes)
-from services.gemini_service import generate_description
-from services.pinecone_service import upsert_asset_vector, delete_vectors_by_asset_id
-from services.router_service import route_query
+from services.pinecone_service import upsert_asset_vector, delete_vectors_by_asset_ids
+from services.router_service import route_query, get_router_cache_stats
 from services.chart_service import run_chart_agent
-from services.rag_service import run_rag_agent
-from services.sql_service import run_sql_agent
-from services.llm_service import llm 
+from services.rag_service import run_rag_agent, stream_rag_agent
+from services.sql_service import run_sql_agent, prepare_sql_context, stage_timer, get_datasources_with_metadata, invalidate_inventory
+from services.llm_service import llm, astream_text
+from services.engine_service import get_engine, invalidate_engine, dispose_all_engines
+from services.executor_service import run_io, get_executor_stats, shutdown_executors
+from services.schema_service import scan_tables, fetch_samples, build_schema_cache, invalidate_schema
+from services.embedding_service import get_embedding_stats
+from services.bm25_service import invalidate_bm25
+from services.answer_cache_service import invalidate_answers, get_answer_cache_stats
+from services.sql_template_service import invalidate_sql_templates, get_sql_template_stats
+from services.query_service import rows_for_prompt, format_result, records_to_columnar, to_arrow_ipc, RESULT_FORMATS
+from services.job_service import submit_file_job, submit_gsheet_job, retry_job, job_to_dict, start_workers, stop_workers
+from services.cron_service import parse_cron
+from services.dashboard_service import bounded_chart_data, execute_widget_query, apply_execution, refresh_widgets, start_scheduler, stop_scheduler
 
 # Inicializar Base de Datos
 models.Base.metadata.create_all(bind=engine)
+# create_all no agrega índices a tablas que ya existían
+with engine.begin() as _conn:
+    _conn.execute(text("CREATE INDEX IF NOT EXISTS ix_data_assets_data_source_id ON data_assets (data_source_id)"))
+    # ...ni columnas nuevas: refresco programado de widgets
+    for _column in ("data_source_id UUID", "refresh_ttl INTEGER", "refresh_cron VARCHAR", "last_refreshed_at TIMESTAMPTZ",
+                    "refresh_claimed_at TIMESTAMPTZ", "refresh_error TEXT"):
+        _conn.execute(text(f"ALTER TABLE dashboard_widgets ADD COLUMN IF NOT EXISTS {_column}"))
+    _conn.execute(text("CREATE INDEX IF NOT EXISTS ix_dashboard_widgets_data_source_id ON dashboard_widgets (data_source_id)"))
 
 app = FastAPI()
 
@@ -46,6 +59,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_ingest_workers():
+    # Workers de ingesta en segundo plano (retoman los jobs que quedaron pendientes)
+    await start_workers()
+    # Refresco programado de widgets (refresh_ttl / refresh_cron)
+    start_scheduler()
+
+@app.on_event("shutdown")
+async def shutdown_engines():
+    # Cerramos los pools de las fuentes externas al apagar el worker
+    await stop_workers()
+    await stop_scheduler()
+    dispose_all_engines()
+    shutdown_executors()
+    await async_engine.dispose()
+
 # --- MODELOS PYDANTIC ---
 class ConnectionRequest(BaseModel):
     name: str
@@ -60,118 +89,57 @@ class ConnectionRequest(BaseModel):
 class UpdateSourceRequest(BaseModel):
     name: str
 
-# --- DATAFRAME A SQL ---
-async def process_dataframe_to_sql(df, filename, user_id, db):
-    # 1. Limpieza de columnas (Tu lógica original)
-    df.columns = [str(c).replace('"', '').replace("'", "").strip() for c in df.columns]
-    
-    # 2. Normalización de nombres de columnas
-    new_columns = []
-    for c in df.columns:
-        clean_col = str(c).strip().lower().replace('"', '').replace("'", "").replace(" ", "_").replace(".", "").replace("/", "_").replace("$", "")
-        if not clean_col or clean_col == "nan": 
-            clean_col = f"col_{len(new_columns)}"
-        new_columns.append(clean_col)
-    df.columns = new_columns
-    
-    # 3. Nombre de tabla único
-    clean_filename = "".join(e for e in filename.split(".")[0].lower() if e.isalnum() or e == "_")
-    table_name = f"u_{user_id.split('-')[0]}_{clean_filename}"
-    
-    # --- [NUEVO] PERFILADO DE DATOS (Data Profiling) ---
-    stats = {
-        "total_rows": len(df),
-        "total_columns": len(df.columns),
-        "columns_list": list(df.columns),
-        "missing_values": int(df.isnull().sum().sum()), # Total de celdas vacías
-        "memory_usage_kb": round(df.memory_usage(deep=True).sum() / 1024, 2),
-        "preview": df.head(3).to_dict(orient="records") # Pequeña muestra para UI
-    }
-    print(f"📊 [PROFILING] Tabla: '{table_name}' | Filas: {stats['total_rows']} | Nulos: {stats['missing_values']}")
-    # ---------------------------------------------------
+# --- HELPERS DE CONSULTA ---
+def _parse_uuid(value: str, not_found_detail: str):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+
+async def _get_source_or_404(db: AsyncSession, source_id: str, with_assets: bool = False):
+    query = select(models.DataSource).where(models.DataSource.id == _parse_uuid(source_id, "Fuente no encontrada"))
+    if with_assets:
+        query = query.options(selectinload(models.DataSource.assets))
+    source = (await db.execute(query)).scalars().first()
+    if not source: raise HTTPException(status_code=404, detail="Fuente no encontrada")
+    return source
 
-    # 4. Guardar en Postgres
-    df.to_sql(table_name, con=engine, if_exists='replace', index=False)
-    
-    # 5. Generar descripción
-    sample_data = df.head(5).to_markdown(index=False)
-    description = await generate_description(sample_data, "STRUCTURED")
-    
-    # 6. Preparar Metadatos
-    file_ext = os.path.splitext(filename)[1].replace(".", "").upper()
-    name_clean = os.path.splitext(filename)[0]
-    
-    # 7. Guardar en DB
-    ds_id = uuid.uuid4()
-    new_source = models.DataSource(
-        id=ds_id, 
-        user_id=user_id, 
-        name=name_clean, 
-        type=file_ext, 
-        connection_config={"table_name": table_name}
-    )
-    db.add(new_source)
-    
-    asset_id = uuid.uuid4()
-    new_asset = models.DataAsset(
-        id=asset_id, 
-        data_source_id=ds_id, 
-        name=filename, 
-        description=description, 
-        # [MODIFICADO] Guardamos los stats y el sample aquí dentro
-        asset_metadata={
-            "table_name": table_name,
-            "profiling": stats,
-            "sample": sample_data # Mantenemos el sample para el agente
-        }, 
-        is_indexed=True
-    )
-    db.add(new_asset)
-    db.commit()
-    
-    await upsert_asset_vector(asset_id, description, {
-        "filename": filename, 
-        "type": "STRUCTURED",
-        "asset_id": str(asset_id)
-    })
-    
-    return table_name, description
+def _scan_external_schema(engine_test):
+    inspector = inspect(engine_test)
+    tables = inspector.get_table_names()[:50] # Limitamos a 50 tablas
+    scanned = scan_tables(inspector, tables)
+    # Dejamos el esquema completo cacheado para que el agente SQL no re-escanee en cada pregunta
+    return scanned, build_schema_cache(scanned, fetch_samples(engine_test, tables))
+
+def _ping_engine(engine_test):
+    with engine_test.connect() as connection: pass
 
 # ==========================================
 # ENDPOINTS GESTIÓN (DATA HUB)
 # ==========================================
 
 @app.get("/ingest/list")
-async def list_sources(user_id: str = "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11", db: Session = Depends(get_db)):
-    # 1. Traemos las fuentes ordenadas por fecha (para ver las nuevas primero)
-    db_sources = db.query(models.DataSource).filter(models.DataSource.user_id == user_id).order_by(models.DataSource.created_at.desc()).all()
+async def list_sources(user_id: str = "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11"):
+    # Inventario cacheado por usuario (fuentes + assets en una sola pasada, ordenado por fecha)
+    sources = await get_datasources_with_metadata(user_id)
     
     response_list = []
-    for s in db_sources:
-        # --- NUEVO: Buscamos la metadata del Asset asociado ---
-        asset = db.query(models.DataAsset).filter(models.DataAsset.data_source_id == s.id).first()
-        
-        # Extraemos el perfilado de forma segura (si no existe, va vacío)
-        profiling_data = {}
-        if asset and asset.asset_metadata:
-            profiling_data = asset.asset_metadata.get("profiling", {})
-        # -----------------------------------------------------
-
+    for s in sources:
         response_list.append({
-            "id": str(s.id),
-            "name": s.name,
-            "type": s.type,
+            "id": s["id"],
+            "name": s["name"],
+            "type": s["type"],
             "status": "active",
-            "host": s.connection_config.get("host", "File") if s.connection_config else "File",
+            "host": s["host"],
             "lastUpdate": "Live",
             # Agregamos el campo clave para el frontend
-            "profiling": profiling_data 
+            "profiling": s["profiling"]
         })
         
     return {"connections": response_list}
 
 @app.post("/ingest/connection")
-async def create_connection(conn: ConnectionRequest, db: Session = Depends(get_db)):
+async def create_connection(conn: ConnectionRequest, db: AsyncSession = Depends(get_async_db)):
     db_url = ""
     
     # --- ESTRATEGIA GOOGLE SHEETS: INGESTIÓN AUTOMÁTICA (Sin cambios) ---
@@ -182,20 +150,9 @@ async def create_connection(conn: ConnectionRequest, db: Session = Depends(get_d
         base_url = conn.host.split("/edit")[0]
         csv_url = f"{base_url}/export?format=csv"
         
-        try:
-            print(f"📥 Descargando Google Sheet: {csv_url}")
-            response = requests.get(csv_url)
-            response.raise_for_status()
-            
-            df = pd.read_csv(io.BytesIO(response.content))
-            
-            fake_filename = f"{conn.name.replace(' ', '_')}.csv"
-            table_name, description = await process_dataframe_to_sql(df, fake_filename, conn.user_id, db)
-            
-            return {"status": "success", "message": "Google Sheet ingestada correctamente", "table": table_name}
-
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error procesando Google Sheet: {str(e)}")
+        # Descarga + carga + descripción + vectorizado corren en un job: respondemos al instante
+        job = await submit_gsheet_job(db, conn.user_id, conn.name, csv_url)
+        return {"status": "queued", "message": "Google Sheet en cola de ingesta", "job_id": str(job.id), "id": str(job.data_source_id)}
 
     # --- ESTRATEGIA BASES DE DATOS (MySQL / Postgres) ---
     elif conn.type == "mysql":
@@ -208,29 +165,28 @@ async def create_connection(conn: ConnectionRequest, db: Session = Depends(get_d
     # Validación de conexión DB Real + INSPECCIÓN DE SCHEMA
     schema_summary = "Sin información de esquema."
     
+    # --- CORRECCIÓN CLAVE: Generación de ID explícito ---
+    source_id = uuid.uuid4() 
+
     if conn.type in ["mysql", "postgresql"]:
         try:
-            # 1. Probamos conexión
-            engine_test = create_engine(db_url, connect_args={"connect_timeout": 5})
+            # 1. Probamos conexión (el engine queda registrado para el agente SQL)
+            engine_test = get_engine(source_id, db_url)
             
-            # 2. ESCANEO INTELIGENTE
-            inspector = inspect(engine_test)
-            tables = inspector.get_table_names()[:50] # Limitamos a 50 tablas
+            # 2. ESCANEO INTELIGENTE (red bloqueante: pool de I/O)
+            scanned, schema_cache = await run_io(_scan_external_schema, engine_test)
             
             schema_parts = []
-            for table in tables:
-                columns = [col["name"] for col in inspector.get_columns(table)]
-                schema_parts.append(f"{table}({', '.join(columns)})")
+            for table, columns in scanned.items():
+                schema_parts.append(f"{table}({', '.join(name for name, _ in columns)})")
             
             schema_summary = f"Base de datos {conn.type} externa. Contiene tablas: " + "; ".join(schema_parts)
             print(f"✅ Esquema escaneado para router: {schema_summary[:100]}...")
 
         except Exception as e:
+            invalidate_engine(source_id)
             raise HTTPException(status_code=400, detail=f"No se pudo conectar a la DB: {str(e)}")
 
-    # --- CORRECCIÓN CLAVE: Generación de ID explícito ---
-    source_id = uuid.uuid4() 
-
     # Guardamos la conexión externa (DataSource) usando el ID generado
     new_source = models.DataSource(
         id=source_id, # <--- ASIGNADO MANUALMENTE
@@ -242,234 +198,207 @@ async def create_connection(conn: ConnectionRequest, db: Session = Depends(get_d
     )
     db.add(new_source)
     
+    # Vectorizamos el resumen del esquema para la pre-selección de fuentes del agente SQL
+    asset_id = uuid.uuid4()
+    is_indexed = await upsert_asset_vector(asset_id, schema_summary, {
+        "filename": conn.name,
+        "type": "STRUCTURED",
+        "asset_id": str(asset_id)
+    }, user_id=conn.user_id, source_type=conn.type.upper())
+
     # Guardamos el DataAsset vinculado a ese ID seguro
     new_asset = models.DataAsset(
-        id=uuid.uuid4(),
+        id=asset_id,
         data_source_id=source_id, # <--- USAMOS LA VARIABLE SEGURA, NO new_source.id
         name=f"Schema de {conn.name}",
         description=schema_summary,   # La metadata para el Router
-        asset_metadata={"tables": schema_parts if 'schema_parts' in locals() else []},
-        is_indexed=False 
+        asset_metadata={
+            "tables": schema_parts if 'schema_parts' in locals() else [],
+            "schema_cache": schema_cache if 'schema_cache' in locals() else None
+        },
+        is_indexed=is_indexed,
+        last_synced_at=datetime.datetime.now(datetime.timezone.utc)
     )
     db.add(new_asset)
     
-    db.commit()
+    await db.commit()
+    invalidate_inventory(conn.user_id)
+    invalidate_answers(conn.user_id)
     return {"status": "success", "id": str(source_id), "schema_preview": schema_summary[:200]}
 
 @app.put("/ingest/connection/{source_id}")
-async def update_source(source_id: str, payload: UpdateSourceRequest, db: Session = Depends(get_db)):
-    source = db.query(models.DataSource).filter(models.DataSource.id == source_id).first()
-    if not source: raise HTTPException(status_code=404, detail="Fuente no encontrada")
+async def update_source(source_id: str, payload: UpdateSourceRequest, db: AsyncSession = Depends(get_async_db)):
+    source = await _get_source_or_404(db, source_id)
     source.name = payload.name
-    db.commit()
+    await db.commit()
+    invalidate_inventory(source.user_id)
+    invalidate_answers(source.user_id)
+    invalidate_engine(source_id)
+    invalidate_schema(source_id)
+    invalidate_sql_templates(source_id)
     return {"status": "updated", "name": source.name}
 
 @app.delete("/ingest/connection/{source_id}")
-async def delete_connection(source_id: str, db: Session = Depends(get_db)):
-    # Buscamos la fuente como lo hacíamos antes (tu lógica que andaba 10 puntos)
-    source = db.query(models.DataSource).filter(models.DataSource.id == source_id).first()
-    
-    if not source:
-        raise HTTPException(status_code=404, detail="Fuente no encontrada")
+async def delete_connection(source_id: str, db: AsyncSession = Depends(get_async_db)):
+    # Cargamos la fuente junto a sus assets (el cascade del delete los necesita en memoria)
+    source = await _get_source_or_404(db, source_id, with_assets=True)
     
     # --- LO ÚNICO NUEVO: BORRADO DE PINECONE ---
-    # Buscamos los assets de esta fuente para obtener sus IDs y limpiar Pinecone
-    assets = db.query(models.DataAsset).filter(models.DataAsset.data_source_id == source.id).all()
-    for asset in assets:
-        if asset.is_indexed:
-            await delete_vectors_by_asset_id(str(asset.id))
+    # Recorremos los assets de esta fuente para obtener sus IDs y limpiar Pinecone
+    # (un único delete por lote con $in, en vez de uno por asset)
+    await delete_vectors_by_asset_ids([asset.id for asset in source.assets if asset.is_indexed])
     # -------------------------------------------
 
     # Borrado de tabla SQL (si existe)
     table_name = source.connection_config.get("table_name")
     if table_name:
         try:
-            with engine.connect() as conn:
-                conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
-                conn.commit()
+            async with async_engine.begin() as conn:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
         except Exception:
             pass
 
     # Borrado de la DB
-    db.delete(source)
-    db.commit()
+    user_id = source.user_id
+    await db.delete(source)
+    await db.commit()
+    invalidate_inventory(user_id)
+    invalidate_bm25(user_id)  # Los chunks se fueron por el CASCADE de data_assets
+    invalidate_answers(user_id)
+    invalidate_engine(source_id)
+    invalidate_schema(source_id)
+    invalidate_sql_templates(source_id)
     
     return {"status": "deleted"}
 
 @app.post("/ingest/test/{source_id}")
-async def test_existing_connection(source_id: str, db: Session = Depends(get_db)):
-    source = db.query(models.DataSource).filter(models.DataSource.id == source_id).first()
-    if not source: raise HTTPException(status_code=404, detail="Fuente no encontrada")
+async def test_existing_connection(source_id: str, db: AsyncSession = Depends(get_async_db)):
+    source = await _get_source_or_404(db, source_id)
     if source.type in ["GSHEET", "LOCAL_FILE"]: return {"status": "ok", "message": "Fuente accesible."}
     try:
-        engine_test = create_engine(source.connection_string, connect_args={"connect_timeout": 5})
-        with engine_test.connect() as connection: pass 
+        engine_test = get_engine(source.id, source.connection_string)
+        await run_io(_ping_engine, engine_test)
         return {"status": "ok", "message": "Conexión Exitosa"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Falló la conexión: {str(e)}")
 
 
 # ==========================================
-# ENDPOINT UPLOAD (EN MEMORIA -> DB/Pinecone)
+# ENDPOINT UPLOAD (SPOOL -> JOB EN SEGUNDO PLANO)
 # ==========================================
 @app.post("/ingest/upload-file")
 async def upload_file(
     file: UploadFile = File(...), 
     user_id: str = Form(...), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    content = await file.read()
-    filename = file.filename
-    file_ext = os.path.splitext(filename.lower())[1]
-    
-    if file_ext in [".csv", ".xlsx"]:
-        try:
-            if file_ext == ".csv":
-                # Detectar encoding
-                try: 
-                    text_content = content.decode('utf-8-sig')
-                except: 
-                    try:
-                        text_content = content.decode('utf-8')
-                    except:
-                        text_content = content.decode('latin-1', errors='replace')
-                
-                # Limpiar líneas vacías
-                lines = [line.strip() for line in text_content.split('\n') if line.strip()]
-                
-                # PARSING MANUAL ROBUSTO
-                if not lines:
-                    raise HTTPException(status_code=400, detail="El archivo CSV está vacío")
-                
-                # Separar header y data
-                header_line = lines[0]
-                data_lines = lines[1:]
-                
-                # Detectar el separador real contando ocurrencias
-                separators = {',': 0, ';': 0, '\t': 0, '|': 0}
-                for sep in separators:
-                    separators[sep] = header_line.count(sep)
-                
-                # Usar el separador más común
-                detected_sep = max(separators, key=separators.get)
-                
-                print(f"📊 Separadores detectados: {separators}")
-                print(f"✓ Usando separador: '{detected_sep}'")
-                
-                # Parsear con el separador detectado
-                header = [col.strip().strip('"').strip("'") for col in header_line.split(detected_sep)]
+    file_ext = os.path.splitext(file.filename.lower())[1]
+    if file_ext not in [".csv", ".xlsx", ".pdf", ".docx", ".txt"]:
+        return {"status": "error", "message": "Formato no soportado"}
 
-                
-                data_rows = []
-                for line in data_lines:
-                    if line.strip():
-                        row = [cell.strip().strip('"').strip("'") for cell in line.split(detected_sep)]
-                        data_rows.append(row)
-                
-                # Crear DataFrame
-                df = pd.DataFrame(data_rows, columns=header)
-                
-                print(f"✓ CSV parseado: {len(df.columns)} columnas -> {df.columns.tolist()}")
-                print(f"✓ Filas: {len(df)}")
-                print(f"✓ Primeras 2 filas:\n{df.head(2)}")
-                
-            else:
-                df = pd.read_excel(io.BytesIO(content))
-            
-            table_name, description = await process_dataframe_to_sql(df, filename, user_id, db)
-            
-            return {
-                "status": "success", 
-                "table": table_name,
-                "columns": list(df.columns),
-                "rows": len(df),
-                "ai_description": description
-            }
-            
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=str(e))
-    
-    elif file_ext in [".pdf", ".docx", ".txt"]:
-        try:
-            full_text = ""
-            if file_ext == ".pdf":
-                pdf = PyPDF2.PdfReader(io.BytesIO(content))
-                for p in pdf.pages: 
-                    full_text += (p.extract_text() or "") + "\n"
-            elif file_ext == ".docx":
-                doc = Document(io.BytesIO(content))
-                full_text = "\n".join([p.text for p in doc.paragraphs])
-            elif file_ext == ".txt":
-                full_text = content.decode('utf-8', errors='ignore')
-            
-            description = await generate_description(full_text[:1000], "DOCUMENT")
-            name_clean = os.path.splitext(filename)[0]
-            type_clean = file_ext.replace(".", "").upper()
-            ds_id = uuid.uuid4()
-            new_source = models.DataSource(
-                id=ds_id, 
-                user_id=user_id, 
-                name=name_clean, 
-                type=type_clean, 
-                connection_config={}
-            )
-            db.add(new_source)
-            
-            asset_id = uuid.uuid4()
-            new_asset = models.DataAsset(
-                id=asset_id, 
-                data_source_id=ds_id, 
-                name=filename, 
-                description=description, 
-                asset_metadata={"sample": full_text[:200]}, 
-                is_indexed=True
-            )
-            db.add(new_asset)
-            db.commit()
-            
-            await upsert_asset_vector(asset_id, full_text, {
-                "filename": filename, 
-                "type": "DOCUMENT", 
-                "asset_id": str(asset_id)
-            })
-            
-            return {"status": "success", "message": "Documento indexado."}
-            
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error: {str(e)}")
-    
-    return {"status": "error", "message": "Formato no soportado"}
+    try:
+        # Solo copiamos el upload al spool y encolamos: parsing, carga, IA y Pinecone van en el job
+        await file.seek(0)
+        job = await submit_file_job(db, user_id, file.filename, file.file)
+        return {"status": "queued", "job_id": str(job.id), "asset_id": str(job.asset_id)}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error: {str(e)}")
+
+@app.get("/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    # Progreso por etapa, filas cargadas y errores (el frontend lo consulta por polling)
+    job = await db.get(models.IngestJob, _parse_uuid(job_id, "Job no encontrado"))
+    if not job: raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job_to_dict(job)
+
+@app.post("/ingest/jobs/{job_id}/retry")
+async def retry_ingest_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(models.IngestJob, _parse_uuid(job_id, "Job no encontrado"))
+    if not job: raise HTTPException(status_code=404, detail="Job no encontrado")
+    try:
+        await retry_job(db, job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job_to_dict(job)
 
 
 # ==========================================
 # ENDPOINT CHAT (ROUTER + CHAT MODE)
 # ==========================================
+def _start_sql_context(user_message: str, user_id: str):
+    return asyncio.create_task(prepare_sql_context(user_message, user_id))
+
+def _discard_sql_context(task, route_decision: Optional[str]):
+    # Si la ruta no usa datos (o el router falló: route_decision None), el trabajo especulativo se descarta
+    if route_decision not in ["SQL", "DATABASE", "CHART"]:
+        task.cancel()
+        # Se recupera el resultado para que una excepción de la Task no quede "never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+def _result_format(value: str, allowed=RESULT_FORMATS) -> str:
+    # Formato de datos opt-in: "rows" (por defecto, compatible) o "columnar"
+    value = value or "rows"
+    if value not in allowed:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {value}")
+    return value
+
+def _chart_payload(chart_res: dict, result_format: str = "rows") -> dict:
+    points = chart_res.get("result") or []
+    if result_format == "columnar":
+        # Columnar: nombres una sola vez y sin la copia original_data de cada punto
+        points = records_to_columnar(points, ["name", "value"])
+    # --- FIX CRÍTICO DE LLAVES ---
+    data_res = {
+        "result": points, # Los datos (filas o columnas)
+        "chart_type": chart_res.get("chart_config", {}).get("type", "bar"),
+        "sql": chart_res.get("sql_used"), # <--- ESTE ERA EL ERROR (sql vs sql_used)
+        "suggested_title": chart_res.get("chart_config", {}).get("title"),
+        "truncated": chart_res.get("truncated", False),
+        "source_id": chart_res.get("source_id") # El widget fijado se refresca contra esta fuente
+    }
+    
+    # --- DEBUG: IMPRIMIR LO QUE MANDAMOS AL FRONT ---
+    rows = chart_res.get("result") or []
+    print(f"📦 [DEBUG DATA] Enviando al Canvas: {len(rows)} filas ({result_format}).")
+    print(f"📦 [DEBUG SAMPLE] Primera fila: {rows[0] if rows else 'VACIO'}")
+    return data_res
+
 @app.post("/chat")
-async def chat_endpoint(request: Request, db: Session = Depends(get_db)):
+async def chat_endpoint(request: Request, db: AsyncSession = Depends(get_async_db)):
     data = await request.json()
     user_id = str(data.get("user_id", "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11"))
     user_message = data.get("message", "")
+    result_format = _result_format(data.get("format"))
     
     try:
         # Guardar mensaje usuario
         db.add(models.ChatMessage(user_id=user_id, role="user", content=user_message))
-        db.commit()
+        await db.commit()
 
-        route_decision = await route_query(user_message)
+        timings = {}
+        # Especulativo: inventario + elección de fuente + esquema corren mientras el router decide
+        sql_context = _start_sql_context(user_message, user_id)
+        route_decision = None
+        try:
+            with stage_timer(timings, "route"):
+                route_decision = await route_query(user_message)
+        finally:
+            _discard_sql_context(sql_context, route_decision)
         res_text = ""
         data_res = None
 
         if route_decision in ["SQL", "DATABASE"]:
-            sql_res = await run_sql_agent(user_message, user_id=user_id)
+            sql_res = await run_sql_agent(user_message, user_id=user_id, context=sql_context, result_format=result_format)
             if "error" in sql_res:
                 res_text = "No pude procesar los datos."
             else:
-                res_text = await llm.ainvoke({"messages": [("user", f"Datos: {sql_res['result']}. Pregunta: {user_message}")]})
+                with stage_timer(timings, "summary"):
+                    res_text = await llm.ainvoke({"messages": [("user", f"Datos: {rows_for_prompt(sql_res)}. Pregunta: {user_message}")]})
                 data_res = sql_res
+                timings.update(sql_res.get("timings", {}))
 
         elif route_decision == "CHART":
-            from services.chart_service import run_chart_agent
-            chart_res = await run_chart_agent(user_message, user_id=user_id)
+            chart_res = await run_chart_agent(user_message, user_id=user_id, context=sql_context)
             
             if "error" in chart_res:
                 res_text = chart_res["error"]
@@ -477,80 +406,242 @@ async def chat_endpoint(request: Request, db: Session = Depends(get_db)):
             else:
                 res_text = "He generado el gráfico solicitado."
                 
-                # --- FIX CRÍTICO DE LLAVES ---
-                data_res = {
-                    "result": chart_res.get("result"), # Los datos (filas)
-                    "chart_type": chart_res.get("chart_config", {}).get("type", "bar"),
-                    "sql": chart_res.get("sql_used"), # <--- ESTE ERA EL ERROR (sql vs sql_used)
-                    "suggested_title": chart_res.get("chart_config", {}).get("title")
-                }
-                
-                # --- DEBUG: IMPRIMIR LO QUE MANDAMOS AL FRONT ---
-                print(f"📦 [DEBUG DATA] Enviando al Canvas: {len(data_res['result'])} filas.")
-                print(f"📦 [DEBUG SAMPLE] Primera fila: {data_res['result'][0] if data_res['result'] else 'VACIO'}")
+                data_res = _chart_payload(chart_res, result_format)
+                timings.update(chart_res.get("timings", {}))
 
         elif route_decision == "CHAT":
             res_text = await llm.ainvoke({"messages": [("user", user_message)]})
 
         else: # RAG
-            rag = await run_rag_agent(user_message)
+            rag = await run_rag_agent(user_message, user_id=user_id)
             res_text = rag.get("result", "No hay info.")
 
         final_response_string = str(res_text) # Forzamos string limpio
+        print(f"⏱️ [PIPELINE] {route_decision}: {timings}")
         
         # Guardar respuesta IA (Siempre como String)
         db.add(models.ChatMessage(user_id=user_id, role="assistant", content=str(res_text)))
-        db.commit()
+        await db.commit()
 
         return {"response": final_response_string, "tool_used": route_decision, "data": data_res}
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         return {"response": "Error interno.", "tool_used": "ERROR"}
 
+# ==========================================
+# ENDPOINT CHAT STREAMING (SSE)
+# ==========================================
+def _sse(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(payload), ensure_ascii=False)}\n\n"
+
+async def _chat_event_stream(user_id: str, user_message: str, result_format: str = "rows"):
+    """
+    Eventos emitidos:
+      route -> decisión del router apenas está lista
+      data  -> SQL generado + filas (o datos del gráfico)
+      token -> fragmentos de la respuesta final
+      done  -> respuesta completa (ya persistida en ChatMessage)
+    """
+    # Sesión propia: la del Depends se cierra antes de que termine el stream
+    async with AsyncSessionLocal() as db:
+        try:
+            db.add(models.ChatMessage(user_id=user_id, role="user", content=user_message))
+            await db.commit()
+
+            sql_context = _start_sql_context(user_message, user_id)
+            route_decision = None
+            try:
+                route_decision = await route_query(user_message)
+            finally:
+                _discard_sql_context(sql_context, route_decision)
+            yield _sse("route", {"tool_used": route_decision})
+
+            res_text = ""
+            if route_decision in ["SQL", "DATABASE"]:
+                sql_res = await run_sql_agent(user_message, user_id=user_id, context=sql_context, result_format=result_format)
+                if "error" in sql_res:
+                    res_text = "No pude procesar los datos."
+                    yield _sse("token", {"text": res_text})
+                else:
+                    yield _sse("data", sql_res)
+                    async for token in astream_text([("user", f"Datos: {rows_for_prompt(sql_res)}. Pregunta: {user_message}")]):
+                        res_text += token
+                        yield _sse("token", {"text": token})
+
+            elif route_decision == "CHART":
+                chart_res = await run_chart_agent(user_message, user_id=user_id, context=sql_context)
+                if "error" in chart_res:
+                    res_text = chart_res["error"]
+                else:
+                    res_text = "He generado el gráfico solicitado."
+                    yield _sse("data", _chart_payload(chart_res, result_format))
+                yield _sse("token", {"text": res_text})
+
+            elif route_decision == "CHAT":
+                async for token in astream_text([("user", user_message)]):
+                    res_text += token
+                    yield _sse("token", {"text": token})
+
+            else: # RAG
+                async for token in stream_rag_agent(user_message, user_id=user_id):
+                    res_text += token
+                    yield _sse("token", {"text": token})
+
+            # Guardar respuesta IA completa al final del stream
+            db.add(models.ChatMessage(user_id=user_id, role="assistant", content=res_text))
+            await db.commit()
+
+            yield _sse("done", {"response": res_text, "tool_used": route_decision})
+
+        except Exception as e:
+            await db.rollback()
+            print(f"❌ Error en /chat/stream: {e}")
+            yield _sse("error", {"response": "Error interno.", "tool_used": "ERROR"})
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: Request):
+    data = await request.json()
+    user_id = str(data.get("user_id", "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11"))
+    user_message = data.get("message", "")
+    result_format = _result_format(data.get("format"))
+    return StreamingResponse(
+        _chat_event_stream(user_id, user_message, result_format),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ==========================================
 # ENDPOINTS DASHBOARD
 # ==========================================
 
+def _refresh_schedule(data: dict) -> dict:
+    # refresh_ttl en segundos y/o refresh_cron de 5 campos; None desactiva el refresco automático.
+    # El cron se evalúa en UTC: "0 9 * * 1-5" corre a las 09:00 UTC de lunes a viernes
+    schedule = {}
+    if "refresh_ttl" in data:
+        try:
+            ttl = int(data["refresh_ttl"]) if data["refresh_ttl"] not in (None, "") else None
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="refresh_ttl debe ser un número de segundos")
+        if ttl is not None and ttl <= 0:
+            raise HTTPException(status_code=400, detail="refresh_ttl debe ser mayor a 0")
+        schedule["refresh_ttl"] = ttl
+    if "refresh_cron" in data:
+        cron = (data["refresh_cron"] or "").strip() or None
+        if cron:
+            try:
+                parse_cron(cron)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"refresh_cron inválido: {e}")
+        schedule["refresh_cron"] = cron
+    return schedule
+
+def _widget_dict(w) -> dict:
+    return {
+        "id": str(w.id), "title": w.title, "chart_type": w.chart_type, "data": w.chart_data, "sql": w.sql_query,
+        "source_id": str(w.data_source_id) if w.data_source_id else None,
+        "refresh_ttl": w.refresh_ttl, "refresh_cron": w.refresh_cron,
+        "last_refreshed_at": w.last_refreshed_at.isoformat() if w.last_refreshed_at else None,
+        "refresh_error": w.refresh_error,
+    }
+
 @app.post("/dashboard/pin")
-async def pin_widget(request: Request, db: Session = Depends(get_db)):
+async def pin_widget(request: Request, db: AsyncSession = Depends(get_async_db)):
     data = await request.json()
+    source_id = data.get("source_id")
     new_widget = models.DashboardWidget(
         user_id=data.get("user_id"), title=data.get("title"), chart_type=data.get("chart_type"),
-        sql_query=data.get("sql"), chart_data=data.get("data")
+        sql_query=data.get("sql"), chart_data=bounded_chart_data(data.get("data") or [], data.get("chart_type")),
+        data_source_id=_parse_uuid(source_id, "Fuente no encontrada") if source_id else None,
+        **_refresh_schedule(data)
     )
     db.add(new_widget)
-    db.commit()
+    await db.commit()
     return {"status": "success", "id": str(new_widget.id)}
 
 @app.get("/dashboard/list")
-async def get_dashboard(user_id: str, db: Session = Depends(get_db)):
-    widgets = db.query(models.DashboardWidget).filter(models.DashboardWidget.user_id == user_id).order_by(models.DashboardWidget.created_at.desc()).all()
-    return {"widgets": [{"id": str(w.id), "title": w.title, "chart_type": w.chart_type, "data": w.chart_data, "sql": w.sql_query} for w in widgets]}
+async def get_dashboard(user_id: str, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        select(models.DashboardWidget)
+        .where(models.DashboardWidget.user_id == user_id)
+        .order_by(models.DashboardWidget.created_at.desc())
+    )
+    widgets = result.scalars().all()
+    return {"widgets": [_widget_dict(w) for w in widgets]}
 
 @app.delete("/dashboard/widget/{widget_id}")
-async def delete_widget(widget_id: str, db: Session = Depends(get_db)):
-    widget = db.query(models.DashboardWidget).filter(models.DashboardWidget.id == widget_id).first()
+async def delete_widget(widget_id: str, db: AsyncSession = Depends(get_async_db)):
+    widget = await db.get(models.DashboardWidget, _parse_uuid(widget_id, "Widget no encontrado"))
     if widget:
-        db.delete(widget)
-        db.commit()
+        await db.delete(widget)
+        await db.commit()
     return {"status": "deleted"}
 
 @app.put("/dashboard/widget/{widget_id}/refresh")
-async def refresh_widget(widget_id: str, db: Session = Depends(get_db)):
-    widget = db.query(models.DashboardWidget).filter(models.DashboardWidget.id == widget_id).first()
+async def refresh_widget(widget_id: str, format: str = "rows", db: AsyncSession = Depends(get_async_db)):
+    # format: "rows" (por defecto), "columnar" o "arrow" (stream Arrow IPC, requiere pyarrow)
+    result_format = _result_format(format, RESULT_FORMATS + ("arrow",))
+    widget = await db.get(models.DashboardWidget, _parse_uuid(widget_id, "Widget no encontrado"))
     if not widget: raise HTTPException(status_code=404, detail="Widget no encontrado")
     try:
-        from database import engine as local_engine
-        with local_engine.connect() as connection:
-            result = connection.execute(text(widget.sql_query))
-            new_data = [dict(row._mapping) for row in result]
-            for row in new_data:
-                for k, v in row.items():
-                    if isinstance(v, Decimal): row[k] = float(v)
-        widget.chart_data = new_data
-        db.commit()
-        return {"status": "refreshed", "data": new_data}
+        # Ejecución acotada en el engine de la fuente del widget (la DB local si no tiene fuente)
+        execution = await execute_widget_query(widget)
+        apply_execution(widget, execution)
+        await db.commit()
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if result_format == "arrow":
+        try:
+            return Response(content=to_arrow_ipc(execution), media_type="application/vnd.apache.arrow.stream")
+        except ImportError:
+            raise HTTPException(status_code=400, detail="Formato arrow no disponible: pyarrow no está instalado")
+    data = widget.chart_data if result_format == "rows" else format_result(execution, result_format)
+    return {"status": "refreshed", "data": data, "truncated": execution["truncated"]}
+
+@app.post("/dashboard/refresh-all")
+async def refresh_all_widgets(user_id: str, db: AsyncSession = Depends(get_async_db)):
+    # Todas las consultas en paralelo: una por (fuente, SQL), acotadas por fuente
+    widgets = (await db.execute(
+        select(models.DashboardWidget).where(models.DashboardWidget.user_id == user_id)
+    )).scalars().all()
+    results = await refresh_widgets(widgets)
+    await db.commit()
+    return {"widgets": [{**_widget_dict(w), **results[str(w.id)]} for w in widgets]}
+
+@app.put("/dashboard/widget/{widget_id}/schedule")
+async def schedule_widget(widget_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    widget = await db.get(models.DashboardWidget, _parse_uuid(widget_id, "Widget no encontrado"))
+    if not widget: raise HTTPException(status_code=404, detail="Widget no encontrado")
+    for field, value in _refresh_schedule(await request.json()).items():
+        setattr(widget, field, value)
+    await db.commit()
+    return _widget_dict(widget)
+
+# ==========================================
+# MÉTRICAS
+# ==========================================
+
+@app.get("/metrics/executors")
+async def executor_metrics():
+    return get_executor_stats()
+
+@app.get("/metrics/router")
+async def router_metrics():
+    return get_router_cache_stats()
+
+@app.get("/metrics/embeddings")
+async def embedding_metrics():
+    return get_embedding_stats()
+
+@app.get("/metrics/answers")
+async def answer_cache_metrics():
+    return get_answer_cache_stats()
+
+@app.get("/metrics/sql-templates")
+async def sql_template_metrics():
+    return get_sql_template_stats()
@@ -1,6 +1,6 @@
 import uuid
 import datetime
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Float, Boolean, Text
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Float, Boolean, Text, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID, JSONB, ENUM, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -72,7 +72,7 @@ class DataAsset(Base):
     """
     __tablename__ = "data_assets"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    data_source_id = Column(UUID(as_uuid=True), ForeignKey("data_sources.id"))
+    data_source_id = Column(UUID(as_uuid=True), ForeignKey("data_sources.id"), index=True)
     name = Column(String, nullable=False) # Ej: "tabla_clientes", "Capitulo 1"
     description = Column(Text)            # Generado por IA
     # Metadatos específicos (Esquema SQL, Path de API, etc)
@@ -82,6 +82,56 @@ class DataAsset(Base):
     last_synced_at = Column(DateTime(timezone=True))
     source = relationship("DataSource", back_populates="assets")
 
+class IngestJob(Base):
+    """
+    Job de ingesta en segundo plano (upload de archivo o Google Sheet).
+    La tabla ES la cola: los workers toman los PENDING y dejan acá el progreso de cada etapa.
+    """
+    __tablename__ = "ingest_jobs"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(String, index=True)
+    kind = Column(String, nullable=False)    # 'FILE', 'GSHEET'
+    status = Column(String, nullable=False, default="PENDING", index=True)  # PENDING, RUNNING, DONE, FAILED
+    stage = Column(String)                   # Etapa en curso (o la que falló)
+    stages = Column(JSON)                    # {etapa: {"status", "seconds", "error"}}
+    payload = Column(JSON, nullable=False)   # filename, path del spool, url...
+    result = Column(JSON)                    # Salidas de las etapas terminadas (un reintento las reutiliza)
+    # Fijados al crear el job: los reintentos pisan la misma fuente/asset/vectores en vez de duplicarlos
+    data_source_id = Column(UUID(as_uuid=True))
+    asset_id = Column(UUID(as_uuid=True), index=True)
+    rows_loaded = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    heartbeat_at = Column(DateTime(timezone=True))  # Lo renueva el worker mientras el job corre
+    finished_at = Column(DateTime(timezone=True))
+
+class DocumentChunk(Base):
+    """
+    Texto de cada chunk indexado de un documento: alimenta el índice BM25 local
+    (services/bm25_service) que complementa la búsqueda vectorial.
+    """
+    __tablename__ = "document_chunks"
+    id = Column(String, primary_key=True)   # "{asset_id}-{chunk}", igual que el id del vector
+    asset_id = Column(UUID(as_uuid=True), ForeignKey("data_assets.id", ondelete="CASCADE"), index=True)
+    user_id = Column(String, index=True)
+    filename = Column(String)
+    chunk = Column(Integer)
+    page = Column(Integer)
+    content = Column(Text, nullable=False)
+
+class EmbeddingCache(Base):
+    """
+    Caché persistente de embeddings (services/embedding_service).
+    key = sha256(modelo + tarea + texto); vector = float32 serializado (768 dims -> 3 KB).
+    """
+    __tablename__ = "embedding_cache"
+    key = Column(String(64), primary_key=True)
+    model = Column(String, nullable=False)
+    dim = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 # --- LOGS Y AUDITORÍA ---
 
 class UsageLog(Base):
@@ -115,4 +165,11 @@ class DashboardWidget(Base):
     sql_query = Column(String) # "SELECT ..."
     # Guardamos los datos cacheados para no re-consultar SQL cada vez (opcional, pero más rápido)
     chart_data = Column(JSON) 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Fuente de la que salió el SQL: el refresco corre en su engine (NULL = DB local)
+    data_source_id = Column(UUID(as_uuid=True), index=True, nullable=True)
+    refresh_ttl = Column(Integer, nullable=True)   # segundos entre refrescos automáticos
+    refresh_cron = Column(String, nullable=True)   # "*/15 * * * *"
+    last_refreshed_at = Column(DateTime(timezone=True), nullable=True)   # último refresco exitoso
+    refresh_claimed_at = Column(DateTime(timezone=True), nullable=True)  # lease del scheduler (NULL = libre)
+    refresh_error = Column(Text, nullable=True)                          # error del último intento fallido
\ No newline at end of file
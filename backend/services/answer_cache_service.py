@@ -0,0 +1,71 @@
+# Caché de respuestas de los agentes (SQL y RAG) para preguntas repetidas.
+# Clave = usuario + pregunta normalizada + sello de versión de sus fuentes. El sello sale de
+# DataAsset.last_synced_at (se escribe en cada ingesta/actualización): si una fuente cambia,
+# la clave cambia y la respuesta vieja deja de servirse, aunque la haya guardado otro proceso.
+# Además los endpoints de /ingest desalojan explícitamente las entradas del usuario.
+import os
+import re
+import hashlib
+import unicodedata
+from services.cache_service import TTLCache
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_MAX_ROWS = int(os.getenv("ANSWER_CACHE_MAX_ROWS", "5000"))   # resultados más grandes no se cachean
+# TTL por ruta (segundos): los datos estructurados cambian más seguido que los documentos
+ANSWER_CACHE_TTLS = {
+    "SQL": int(os.getenv("ANSWER_CACHE_TTL_SQL", "300")),
+    "RAG": int(os.getenv("ANSWER_CACHE_TTL_RAG", "3600")),
+}
+DOCUMENT_TYPES = ("PDF", "DOCX", "TXT")
+
+_caches = {route: TTLCache(maxsize=ANSWER_CACHE_SIZE, ttl=ttl) for route, ttl in ANSWER_CACHE_TTLS.items()}
+_stats = {route: {"stored": 0, "evicted": 0} for route in ANSWER_CACHE_TTLS}
+
+
+def normalize_question(question: str) -> str:
+    # "¿Cuánto se vendió este mes?" == "cuanto se vendio este mes"
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[¿?¡!.,;:\"']", " ", text)
+    return " ".join(text.split())
+
+
+def source_stamp(route: str, sources: list) -> str:
+    """Versión de las fuentes que puede usar la ruta (documentos para RAG, el resto para SQL)."""
+    relevant = [
+        s for s in sources
+        if (s["type"] in DOCUMENT_TYPES) == (route == "RAG")
+    ]
+    signature = "|".join(sorted(f"{s['asset_id']}@{s.get('last_synced_at')}" for s in relevant))
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest()[:16]
+
+
+def answer_key(route: str, user_id: str, question: str, sources: list) -> tuple:
+    return (str(user_id), normalize_question(question), source_stamp(route, sources))
+
+
+def get_answer(route: str, key: tuple):
+    return _caches[route].get(key)
+
+
+def store_answer(route: str, key: tuple, value: dict):
+    if value.get("row_count", 0) > ANSWER_CACHE_MAX_ROWS:
+        return
+    _caches[route].set(key, value)
+    _stats[route]["stored"] += 1
+
+
+def invalidate_answers(user_id: str):
+    """Desaloja todas las respuestas del usuario (lo llaman los endpoints y jobs de /ingest)."""
+    user_id = str(user_id)
+    for route, cache in _caches.items():
+        before = cache.stats()["size"]
+        cache.invalidate_where(lambda key: key[0] == user_id)
+        _stats[route]["evicted"] += before - cache.stats()["size"]
+
+
+def get_answer_cache_stats() -> dict:
+    return {
+        route: {**cache.stats(), **_stats[route], "ttl": ANSWER_CACHE_TTLS[route]}
+        for route, cache in _caches.items()
+    }
@@ -0,0 +1,146 @@
+# Índice léxico (BM25) sobre los chunks de documentos, para la parte "sparse" del RAG híbrido.
+# Los embeddings capturan el sentido pero fallan con coincidencias exactas (cláusula 4.2.1,
+# SKU-1234, CUIT); BM25 las encuentra. Los chunks se guardan en document_chunks al indexar
+# el documento y el índice invertido se arma en memoria por usuario, perezosamente.
+import os
+import re
+import math
+import unicodedata
+from collections import Counter, defaultdict
+from sqlalchemy import select, delete
+
+import models
+from database import engine
+from services.cache_service import TTLCache
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_CACHE_USERS = int(os.getenv("BM25_CACHE_USERS", "64"))   # índices por usuario en memoria
+CHUNK_INSERT_BATCH = 500
+
+# Tokens alfanuméricos; los compuestos con . - / (4.2.1, SKU-1234) se indexan enteros y por partes
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./\-][a-z0-9]+)*")
+_STOPWORDS = {
+    "a", "al", "como", "con", "de", "del", "el", "en", "es", "esta", "este", "hay", "la", "las", "lo", "los",
+    "me", "mi", "no", "o", "para", "pero", "por", "que", "se", "si", "sin", "sobre", "su", "sus", "un", "una",
+    "y", "ya", "cual", "cuales", "cuanto", "donde", "dice", "the", "of", "and", "to", "in", "is", "what",
+}
+
+_indexes = TTLCache(maxsize=BM25_CACHE_USERS)
+
+
+def tokenize(text: str) -> list:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text):
+        parts = re.split(r"[./\-]", token)
+        if len(parts) > 1:
+            tokens.append(token)
+        tokens.extend(p for p in parts if p and p not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """Índice invertido en memoria: token -> [(doc, frecuencia)]."""
+
+    def __init__(self, records: list):
+        self.records = records
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for n, record in enumerate(records):
+            counts = Counter(tokenize(record["text"]))
+            self.lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                self.postings[token].append((n, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def search(self, query: str, k: int = 20, asset_id: str = None) -> list:
+        total = len(self.records)
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for n, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[n] / self.avg_length)
+                scores[n] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for n, score in ranked:
+            record = self.records[n]
+            if asset_id and record["metadata"].get("asset_id") != str(asset_id):
+                continue
+            results.append((record, score))
+            if len(results) >= k:
+                break
+        return results
+
+
+# --- PERSISTENCIA (sync: corre en el pool de I/O) ---
+
+def persist_chunks(chunks, asset_id, user_id: str, filename: str):
+    """
+    Envuelve el generador de chunks: los deja pasar hacia el indexado vectorial y a la vez
+    los guarda en document_chunks por lotes. Reemplaza los chunks previos del asset (idempotente).
+    """
+    table = models.DocumentChunk.__table__
+    with engine.begin() as conn:
+        conn.execute(delete(table).where(table.c.asset_id == asset_id))
+
+    batch = []
+    for chunk in chunks:
+        batch.append({
+            "id": f"{asset_id}-{chunk['chunk']}",
+            "asset_id": asset_id,
+            "user_id": str(user_id),
+            "filename": filename,
+            "chunk": chunk["chunk"],
+            "page": chunk.get("page"),
+            "content": chunk["text"],
+        })
+        yield chunk
+        if len(batch) >= CHUNK_INSERT_BATCH:
+            with engine.begin() as conn:
+                conn.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        with engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+    invalidate_bm25(user_id)
+
+
+def _load_records(user_id: str) -> list:
+    table = models.DocumentChunk.__table__
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(table.c.asset_id, table.c.filename, table.c.chunk, table.c.page, table.c.content)
+            .where(table.c.user_id == str(user_id))
+        ).all()
+    return [
+        {
+            "text": row.content,
+            # Misma forma que la metadata de los vectores, para fusionar resultados
+            "metadata": {"asset_id": str(row.asset_id), "filename": row.filename, "chunk": row.chunk, "page": row.page},
+        }
+        for row in rows
+    ]
+
+
+def get_index(user_id: str) -> BM25Index:
+    index = _indexes.get(str(user_id))
+    if index is None:
+        index = BM25Index(_load_records(user_id))
+        _indexes.set(str(user_id), index)
+    return index
+
+
+def search_chunks(query: str, user_id: str, k: int = 20, asset_id: str = None) -> list:
+    """Top-k chunks del usuario por BM25. Devuelve [(record, score)]."""
+    return get_index(user_id).search(query, k=k, asset_id=asset_id)
+
+
+def invalidate_bm25(user_id: str):
+    _indexes.pop(str(user_id))
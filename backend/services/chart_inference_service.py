@@ -0,0 +1,167 @@
+# Inferencia determinista de gráficos a partir del resultado SQL (formato columnar).
+# Elige eje X / eje Y y el tipo (bar, line, pie) mirando tipos de columna, cardinalidad y
+# palabras de la pregunta, y arma los puntos directamente desde las filas: sin pasar los
+# datos por el LLM (que escalaba en costo con el tamaño y podía perder o alterar puntos).
+# Si la heurística no puede decidir devuelve None y chart_service usa el camino con LLM.
+import re
+import datetime
+import unicodedata
+
+PIE_MAX_SLICES = 8   # más porciones que esto no se leen: la torta pasa a barras
+
+_DATE_PATTERNS = [
+    re.compile(r"^\d{4}-\d{2}(-\d{2})?([ T]\d{2}:\d{2}(:\d{2})?.*)?$"),   # 2024-03, 2024-03-01, ISO
+    re.compile(r"^\d{4}/\d{2}(/\d{2})?$"),
+    re.compile(r"^\d{1,2}/\d{1,2}/\d{4}$"),                              # 01/03/2024
+    re.compile(r"^\d{4}-?(q|t)[1-4]$", re.IGNORECASE),                     # 2024-Q1
+]
+# Palabras de tiempo en el nombre de la columna (como palabra completa: "venta_media" no es "dia")
+# y, para columnas numéricas, el rango en que deben caer los valores (None = sin rango)
+_TIME_WORDS = {
+    "fecha": None, "date": None, "periodo": None, "period": None, "time": None, "timestamp": None, "datetime": None,
+    "dia": (1, 31), "day": (1, 31), "semana": (1, 53), "week": (1, 53), "mes": (1, 12), "month": (1, 12),
+    "trimestre": (1, 4), "quarter": (1, 4), "hora": (0, 23), "hour": (0, 23),
+    "ano": (1900, 2100), "anio": (1900, 2100), "year": (1900, 2100),
+}
+_ISO_SORTABLE = re.compile(r"^\d{4}[-/]")
+_ID_NAME = re.compile(r"(^id$|_id$|^id_)")
+
+# Palabras de la pregunta que fuerzan un tipo de gráfico
+_TYPE_HINTS = [
+    ("line", re.compile(r"\b(linea|lineas|evolucion|tendencia|historico|a lo largo)\b")),
+    ("pie", re.compile(r"\b(torta|pie|pastel|proporcion|participacion|porcentaje|distribucion|reparto)\b")),
+    ("bar", re.compile(r"\b(barra|barras|ranking|top|compar\w*)\b")),
+]
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _non_null(column: list) -> list:
+    return [v for v in column if v is not None]
+
+
+def _time_word(name: str):
+    """Palabra de tiempo del nombre ("fecha_venta" -> "fecha", "meses" -> "mes") o None."""
+    for token in re.split(r"[_\W]+", _fold(name)):
+        for candidate in (token, token[:-1] if token.endswith("s") else None, token[:-2] if token.endswith("es") else None):
+            if candidate in _TIME_WORDS:
+                return candidate
+    return None
+
+
+def _is_temporal(name: str, kind: str, column: list) -> bool:
+    if kind == "datetime":
+        return True
+    values = _non_null(column)[:200]
+    if not values:
+        return False
+    if kind == "string":
+        matches = sum(1 for v in values if any(p.match(v.strip()) for p in _DATE_PATTERNS))
+        if matches >= 0.9 * len(values):
+            return True
+    # Columnas "mes"/"year"... con valores discretos (números de año/mes o nombres de mes)
+    word = _time_word(name)
+    if word:
+        if kind == "string":
+            return True
+        if kind == "number" and all(float(v).is_integer() for v in values):
+            # "unidades_mes" = [10, 20, 30] es una medida, no un número de mes
+            bounds = _TIME_WORDS[word]
+            return bounds is None or all(bounds[0] <= v <= bounds[1] for v in values)
+    return False
+
+
+def _hinted_types(question: str) -> list:
+    return [kind for kind, pattern in _TYPE_HINTS if pattern.search(question)]
+
+
+def _mentions(question: str, name: str) -> bool:
+    words = [w for w in re.split(r"[_\W]+", _fold(name)) if len(w) > 2]
+    return any(w in question for w in words)
+
+
+def infer_chart(columnar: dict, question: str = ""):
+    """
+    Devuelve {"type", "x", "y", "time_series", "title"} o None si el resultado es ambiguo
+    (sin medida numérica o sin una columna que sirva de eje X).
+    """
+    names, kinds, data = columnar["columns"], columnar["types"], columnar["data"]
+    if not names or not columnar.get("row_count"):
+        return None
+    question = _fold(question)
+
+    temporal = [i for i, name in enumerate(names) if _is_temporal(name, kinds[i], data[i])]
+    measures = [
+        i for i, name in enumerate(names)
+        if kinds[i] == "number" and i not in temporal and not _ID_NAME.search(_fold(name))
+    ]
+    categorical = [i for i, kind in enumerate(kinds) if kind in ("string", "boolean") and i not in temporal]
+
+    # Eje X: tiempo > categoría > (solo si sobra) una numérica discreta
+    if temporal:
+        x = temporal[0]
+    elif categorical:
+        x = next((i for i in categorical if _mentions(question, names[i])), categorical[0])
+    elif len(measures) > 1:
+        x = measures[0]
+    else:
+        return None
+
+    candidates = [i for i in measures if i != x]
+    if not candidates:
+        return None
+    # Eje Y: la medida nombrada en la pregunta; si no, la última (SELECT categoria, SUM(...) ...)
+    y = next((i for i in candidates if _mentions(question, names[i])), candidates[-1])
+
+    distinct = len(set(_non_null(data[x])))
+    chart_type = next(iter(_hinted_types(question)), None)
+    if chart_type is None:
+        chart_type = "line" if temporal and x == temporal[0] else "bar"
+    if chart_type == "pie" and (distinct > PIE_MAX_SLICES or any(v < 0 for v in _non_null(data[y]))):
+        chart_type = "bar"  # una torta con muchas porciones o valores negativos no se lee
+
+    return {
+        "type": chart_type,
+        "x": names[x],
+        "y": names[y],
+        "time_series": bool(temporal) and x == temporal[0],
+        "title": default_title(names[x], names[y]),
+    }
+
+
+def _label(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _pretty(name: str) -> str:
+    return name.replace("_", " ").strip().capitalize()
+
+
+def default_title(x: str, y: str) -> str:
+    return f"{_pretty(y)} por {_pretty(x).lower()}"
+
+
+def build_points(columnar: dict, spec: dict) -> list:
+    """Puntos [{name, value, original_data}] armados directo desde las columnas."""
+    names = columnar["columns"]
+    x, y = names.index(spec["x"]), names.index(spec["y"])
+    rows = list(zip(*columnar["data"]))
+    if spec["time_series"] and all(
+        isinstance(r[x], (datetime.date, datetime.datetime)) or (isinstance(r[x], str) and _ISO_SORTABLE.match(r[x]))
+        for r in rows
+    ):
+        rows.sort(key=lambda r: str(_label(r[x])))
+    return [
+        {
+            "name": _label(row[x]),
+            "value": row[y],
+            "original_data": dict(zip(names, row)),
+        }
+        for row in rows
+        if row[y] is not None
+    ]
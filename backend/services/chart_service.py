@@ -1,11 +1,17 @@
 import os
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from services.sql_service import run_sql_agent
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+from services.sql_service import run_sql_agent, get_source_engine
+from services.query_service import rows_for_prompt, execute_bounded, to_columnar
+from services.chart_inference_service import infer_chart, build_points
+from services.downsample_service import CHART_POINT_BUDGET, downsample_points, bucket_unit, bucketed_sql
+from services.executor_service import run_io
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 MODEL_NAME = os.getenv("MODEL_SMART", "gemini-1.5-pro-001")
+MODEL_FAST = os.getenv("MODEL_FAST", "gemini-1.5-flash")
+CHART_LLM_TITLE = os.getenv("CHART_LLM_TITLE", "1") == "1"   # "0": título heurístico, cero llamadas al LLM
 
 llm = ChatGoogleGenerativeAI(
     model=MODEL_NAME,
@@ -13,69 +19,139 @@ llm = ChatGoogleGenerativeAI(
     google_api_key=GOOGLE_API_KEY
 )
 
-async def run_chart_agent(question: str, user_id: str = None):
-    try:
-        print(f"📊 [CHART] Iniciando generación de gráfico para: '{question}'")
-        
-        # 1. Obtener datos crudos
-        sql_response = await run_sql_agent(question, user_id=user_id)
-        
-        if "error" in sql_response:
-            return {"error": sql_response["error"]}
-            
-        data_str = str(sql_response["result"]) 
-        if not data_str or "[]" in data_str:
-             return {"error": "Sin datos para graficar."}
+# El título solo necesita la pregunta y los nombres de columna: modelo rápido, sin datos
+title_llm = ChatGoogleGenerativeAI(model=MODEL_FAST, temperature=0, google_api_key=GOOGLE_API_KEY)
+
+TITLE_TEMPLATE = """
+Escribe un título corto (máximo 8 palabras) para un gráfico de tipo {type}.
+PREGUNTA DEL USUARIO: {question}
+EJE X: {x}
+EJE Y: {y}
+Responde SOLO el título, sin comillas.
+"""
 
-        # 2. Generar Configuración y Normalizar Datos
-        # Pedimos al LLM que nos identifique explícitamente qué es X y qué es Y
-        template = """
+LLM_CHART_TEMPLATE = """
         Eres un experto en visualización de datos.
         Tus tareas son:
         1. Identificar el mejor tipo de gráfico (bar, line, pie).
         2. Generar las listas de ETIQUETAS (eje X) y VALORES (eje Y) a partir de los datos.
-        
+
         DATOS CRUDOS: {data}
         PREGUNTA: {question}
-        
+
         FORMATO JSON ESPERADO:
         {{
           "type": "bar",
           "title": "Título del gráfico",
           "labels": ["Enero", "Febrero", ...],
-          "values": [100, 200, ...], 
+          "values": [100, 200, ...],
           "series_name": "Ventas"
         }}
         """
-        
-        prompt = ChatPromptTemplate.from_template(template)
-        chain = prompt | llm | JsonOutputParser()
-        config = await chain.ainvoke({"data": data_str, "question": question})
-        
-        # 3. NORMALIZACIÓN CRÍTICA PARA EL FRONTEND
-        # Convertimos los datos dinámicos a formato estándar: [{name: 'Enero', value: 100}, ...]
-        normalized_result = []
-        labels = config.get("labels", [])
-        values = config.get("values", [])
-        
-        # Mapeo seguro asegurando que las listas tengan el mismo largo
-        for i in range(min(len(labels), len(values))):
-            normalized_result.append({
-                "name": labels[i],  # Estandarizado para Eje X
-                "value": values[i], # Estandarizado para Eje Y
-                # Mantenemos las llaves originales por si acaso, usando la primera fila del SQL como referencia
-                "original_data": sql_response["result"][i] if i < len(sql_response["result"]) else {}
-            })
+
+async def _chart_title(question: str, spec: dict) -> str:
+    if not CHART_LLM_TITLE:
+        return spec["title"]
+    try:
+        chain = ChatPromptTemplate.from_template(TITLE_TEMPLATE) | title_llm | StrOutputParser()
+        title = await chain.ainvoke({"type": spec["type"], "question": question, "x": spec["x"], "y": spec["y"]})
+        return title.strip().strip('"') or spec["title"]
+    except Exception as e:
+        print(f"⚠️ [CHART] Título heurístico (falló el LLM): {e}")
+        return spec["title"]
+
+async def _bucket_in_sql(sql_response: dict, spec: dict, user_id: str):
+    """Serie temporal demasiado larga: re-ejecuta agregando por día/semana/mes dentro de la DB."""
+    columnar = sql_response["result"]
+    x = columnar["columns"].index(spec["x"])
+    if columnar["types"][x] != "datetime":
+        return None
+    unit = bucket_unit(columnar["data"][x])
+    engine = await get_source_engine(sql_response["source_id"], user_id) if user_id else None
+    if not unit or engine is None:
+        return None
+    sql = bucketed_sql(sql_response["sql"], engine.dialect.name, engine.dialect.identifier_preparer.quote,
+                       spec["x"], spec["y"], unit)
+    if not sql:
+        return None
+    try:
+        execution = await run_io(execute_bounded, engine, sql)
+    except Exception as e:
+        print(f"⚠️ [CHART] No se pudo agregar en SQL, se muestrea en memoria: {e}")
+        return None
+    print(f"🗜️ [CHART] Serie agregada por {unit} en SQL: {columnar['row_count']} -> {execution['row_count']} puntos")
+    return {**sql_response, "sql": sql, "result": to_columnar(execution), "truncated": execution["truncated"]}
+
+async def _llm_chart(question: str, sql_response: dict):
+    """Camino anterior, solo para resultados que la heurística no sabe graficar."""
+    rows = [dict(zip(sql_response["result"]["columns"], row)) for row in zip(*sql_response["result"]["data"])]
+    prompt = ChatPromptTemplate.from_template(LLM_CHART_TEMPLATE)
+    chain = prompt | llm | JsonOutputParser()
+    config = await chain.ainvoke({"data": rows_for_prompt(sql_response), "question": question})
+
+    # NORMALIZACIÓN CRÍTICA PARA EL FRONTEND
+    # Convertimos los datos dinámicos a formato estándar: [{name: 'Enero', value: 100}, ...]
+    normalized_result = []
+    labels = config.get("labels", [])
+    values = config.get("values", [])
+
+    # Mapeo seguro asegurando que las listas tengan el mismo largo
+    for i in range(min(len(labels), len(values))):
+        normalized_result.append({
+            "name": labels[i],  # Estandarizado para Eje X
+            "value": values[i], # Estandarizado para Eje Y
+            # Mantenemos las llaves originales por si acaso, usando la primera fila del SQL como referencia
+            "original_data": rows[i] if i < len(rows) else {}
+        })
+    return config, normalized_result
+
+async def run_chart_agent(question: str, user_id: str = None, context=None):
+    try:
+        print(f"📊 [CHART] Iniciando generación de gráfico para: '{question}'")
+
+        # 1. Obtener datos crudos (columnar: tipos por columna para la inferencia)
+        sql_response = await run_sql_agent(question, user_id=user_id, context=context, result_format="columnar")
+
+        if "error" in sql_response:
+            return {"error": sql_response["error"]}
+
+        if not sql_response["result"]["row_count"]:
+             return {"error": "Sin datos para graficar."}
+
+        # 2. Ejes y tipo de gráfico por heurística; los puntos salen directo de las filas
+        spec = infer_chart(sql_response["result"], question)
+        if spec:
+            print(f"🧮 [CHART] Inferido sin LLM: {spec['type']} x={spec['x']} y={spec['y']}")
+            columnar = sql_response["result"]
+            if spec["time_series"] and (columnar["row_count"] > CHART_POINT_BUDGET or sql_response.get("truncated")):
+                sql_response = await _bucket_in_sql(sql_response, spec, user_id) or sql_response
+            # Serie temporal: LTTB aunque se dibuje en barras (top-N rompería la secuencia)
+            shape = "line" if spec["time_series"] and spec["type"] != "pie" else spec["type"]
+            normalized_result = downsample_points(build_points(sql_response["result"], spec), shape)
+            config = {
+                "type": spec["type"],
+                "title": await _chart_title(question, spec),
+                "x": spec["x"],
+                "y": spec["y"],
+                "series_name": spec["y"],
+            }
+        else:
+            print("🤔 [CHART] Resultado ambiguo para la heurística, se usa el LLM")
+            config, normalized_result = await _llm_chart(question, sql_response)
+            normalized_result = downsample_points(normalized_result, config.get("type", "bar"))
 
         print(f"✅ [CHART] Datos normalizados para frontend: {normalized_result[0] if normalized_result else 'Vacío'}")
-        
+
         return {
             "chart_config": config,
             "sql_used": sql_response["sql"], # Usamos 'sql_used' para mantener compatibilidad interna si se requiere
             "sql": sql_response["sql"],      # Agregamos 'sql' para que main.py lo encuentre fácil
-            "result": normalized_result      # <--- AQUÍ ESTÁ LA MAGIA (Datos estandarizados)
+            "result": normalized_result,     # <--- AQUÍ ESTÁ LA MAGIA (Datos estandarizados)
+            "source_id": sql_response.get("source_id"),
+            "truncated": sql_response.get("truncated", False),
+            "timings": sql_response.get("timings", {})
         }
 
     except Exception as e:
         print(f"❌ Error en Chart Agent: {e}")
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
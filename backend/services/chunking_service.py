@@ -0,0 +1,106 @@
+# Troceado de documentos (PDF/DOCX/TXT) para indexarlos en Pinecone.
+# Todo es perezoso: las páginas/párrafos se leen y se emiten en chunks a medida que se consumen.
+import io
+import os
+import re
+import PyPDF2
+from docx import Document
+
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1500"))      # caracteres por chunk
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))  # caracteres repetidos entre chunks consecutivos
+
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def _iter_pdf_units(content: bytes):
+    pdf = PyPDF2.PdfReader(io.BytesIO(content))
+    for page_number, page in enumerate(pdf.pages, start=1):
+        yield page_number, page.extract_text() or ""
+
+
+def _iter_docx_units(content: bytes):
+    doc = Document(io.BytesIO(content))
+    for paragraph in doc.paragraphs:
+        yield None, paragraph.text
+
+
+def _iter_txt_units(content: bytes):
+    text = content.decode("utf-8", errors="ignore")
+    for paragraph in _PARAGRAPH_SPLIT.split(text):
+        yield None, paragraph
+
+
+def _split_long(paragraph: str, size: int):
+    """Parte un párrafo más largo que el chunk por oraciones (y por caracteres si hace falta)."""
+    piece = ""
+    for sentence in _SENTENCE_SPLIT.split(paragraph):
+        while len(sentence) > size:
+            if piece:
+                yield piece
+                piece = ""
+            yield sentence[:size]
+            sentence = sentence[size:]
+        if piece and len(piece) + len(sentence) + 1 > size:
+            yield piece
+            piece = ""
+        piece = f"{piece} {sentence}" if piece else sentence
+    if piece:
+        yield piece
+
+
+def _overlap_tail(text: str, overlap: int) -> str:
+    if overlap <= 0 or len(text) <= overlap:
+        return ""
+    tail = text[-overlap:]
+    # Cortamos en un espacio para no arrancar el chunk siguiente a mitad de palabra
+    cut = tail.find(" ")
+    return tail[cut + 1:] if cut != -1 else tail
+
+
+def chunk_units(units, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    """
+    Agrupa (página, texto) en chunks de ~size caracteres respetando párrafos.
+    Un chunk nunca cruza de página, así cada uno se puede citar con su número de página.
+    """
+    ordinal = 0
+    buffer, buffer_page, has_new_text = "", None, False
+
+    def emit():
+        nonlocal ordinal
+        chunk = {"text": buffer.strip(), "chunk": ordinal, "page": buffer_page}
+        ordinal += 1
+        return chunk
+
+    for page, text in units:
+        if page != buffer_page:
+            if has_new_text:
+                yield emit()
+            buffer, buffer_page, has_new_text = "", page, False
+
+        for paragraph in _PARAGRAPH_SPLIT.split(text) if page is not None else [text]:
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            for piece in _split_long(paragraph, size):
+                if has_new_text and len(buffer) + len(piece) + 1 > size:
+                    yield emit()
+                    buffer, has_new_text = _overlap_tail(buffer, overlap), False
+                buffer = f"{buffer}\n{piece}" if buffer else piece
+                has_new_text = True
+
+    if has_new_text:
+        yield emit()
+
+
+def iter_document_chunks(content: bytes, file_ext: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    """Generador de chunks {"text", "chunk", "page"} para un archivo .pdf/.docx/.txt."""
+    if file_ext == ".pdf":
+        units = _iter_pdf_units(content)
+    elif file_ext == ".docx":
+        units = _iter_docx_units(content)
+    elif file_ext == ".txt":
+        units = _iter_txt_units(content)
+    else:
+        raise ValueError(f"Formato de documento no soportado: {file_ext}")
+    return chunk_units(units, size, overlap)
@@ -0,0 +1,71 @@
+# Expresiones cron de 5 campos (minuto hora día mes día-semana) para el refresco de widgets.
+# Sin dependencias: listas, rangos y pasos ("*/15", "1-5", "0,30"), domingo = 0 o 7 y, como en
+# cron estándar, día del mes OR día de la semana cuando ambos están restringidos.
+# Los horarios se evalúan en la zona del datetime recibido (el scheduler pasa UTC).
+import datetime
+
+CRON_SEARCH_DAYS = 5 * 366  # "0 0 29 2 *" puede tardar años; más allá el cron no calza nunca
+
+_MONTH_DAYS = {1: 31, 2: 29, 3: 31, 4: 30, 5: 31, 6: 30, 7: 31, 8: 31, 9: 30, 10: 31, 11: 30, 12: 31}
+
+
+def _cron_field(field: str, low: int, high: int) -> set:
+    values = set()
+    for part in field.split(","):
+        part, _, step = part.partition("/")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = end = int(part)
+            if step:
+                end = high
+        step = int(step) if step else 1
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"'{field}' fuera de rango ({low}-{high})")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expr: str):
+    """
+    "m h dom mon dow" -> (minutos, horas, días, meses, días-semana, días_con_or).
+    ValueError si la expresión no es válida.
+    """
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError("El cron debe tener 5 campos: minuto hora día mes día-semana")
+    bounds = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+    parsed = [_cron_field(f, low, high) for f, (low, high) in zip(fields, bounds)]
+    if 7 in parsed[4]:
+        parsed[4].add(0)  # domingo = 0 o 7
+    # Como en cron estándar: si día del mes y día de la semana están restringidos, basta con uno
+    day_or = not fields[2].startswith("*") and not fields[4].startswith("*")
+    if not day_or and not any(day <= _MONTH_DAYS[month] for month in parsed[3] for day in parsed[2]):
+        raise ValueError("El cron no calza con ninguna fecha (p. ej. 31 de febrero)")
+    return (*parsed, day_or)
+
+
+def _day_matches(parsed, day: datetime.date) -> bool:
+    _, _, days, months, weekdays, day_or = parsed
+    if day.month not in months:
+        return False
+    in_month, in_week = day.day in days, (day.isoweekday() % 7) in weekdays
+    return (in_month or in_week) if day_or else (in_month and in_week)
+
+
+def next_cron_time(parsed, after: datetime.datetime):
+    """Primer minuto estrictamente posterior a `after` que calza con el cron (None si no hay)."""
+    minutes, hours = sorted(parsed[0]), sorted(parsed[1])
+    moment = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    # Se avanza de a días; dentro de un día que calza, la hora y el minuto salen directo de los conjuntos
+    for _ in range(CRON_SEARCH_DAYS):
+        if _day_matches(parsed, moment):
+            for hour in (h for h in hours if h >= moment.hour):
+                first = moment.minute if hour == moment.hour else 0
+                minute = next((m for m in minutes if m >= first), None)
+                if minute is not None:
+                    return moment.replace(hour=hour, minute=minute)
+        moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+    return None
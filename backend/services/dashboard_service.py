@@ -0,0 +1,199 @@
+# Refresco de widgets del dashboard.
+# - Cada widget corre contra el engine (con pool) de la fuente de la que salió su SQL, no
+#   contra la DB local: un gráfico armado sobre un MySQL externo se refresca en ese MySQL.
+# - Widgets con el mismo SQL sobre la misma fuente se ejecutan una sola vez (coalescing).
+# - Un semáforo por fuente acota cuántas consultas de refresco corren a la vez contra ella.
+# - Incremental: chart_data solo se reescribe si los datos cambiaron.
+# - Un loop en segundo plano refresca los widgets con refresh_ttl (segundos) o refresh_cron
+#   ("*/15 * * * *", minuto hora día mes día-semana, siempre en UTC) cuando les toca. La fila se "toma" con
+#   un UPDATE condicional sobre refresh_claimed_at (lease), así varios procesos con el scheduler
+#   no refrescan dos veces. last_refreshed_at solo avanza si el refresco salió bien; si falla,
+#   el error queda en refresh_error y se reintenta cuando vence el lease.
+import os
+import asyncio
+import datetime
+from collections import defaultdict
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, update, or_
+
+import models
+from database import AsyncSessionLocal, engine as local_engine
+from services.executor_service import run_io
+from services.query_service import execute_bounded, to_records
+from services.downsample_service import downsample_points
+from services.sql_service import get_source_engine
+from services.cron_service import parse_cron, next_cron_time
+
+DASHBOARD_REFRESH_TICK = float(os.getenv("DASHBOARD_REFRESH_TICK", "30"))          # cada cuánto se buscan widgets vencidos
+DASHBOARD_SOURCE_CONCURRENCY = int(os.getenv("DASHBOARD_SOURCE_CONCURRENCY", "2"))  # consultas simultáneas por fuente
+DASHBOARD_CLAIM_LEASE = float(os.getenv("DASHBOARD_CLAIM_LEASE", "120"))           # segundos; también es la espera antes de reintentar un fallo
+
+_semaphores = {}
+_scheduler = None
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _semaphore(source_key: str) -> asyncio.Semaphore:
+    if source_key not in _semaphores:
+        _semaphores[source_key] = asyncio.Semaphore(DASHBOARD_SOURCE_CONCURRENCY)
+    return _semaphores[source_key]
+
+
+def bounded_chart_data(rows: list, chart_type: str) -> list:
+    # El canvas grafica las dos primeras llaves de cada fila: se reduce la serie sobre esas
+    keys = list(rows[0].keys())[:2] if rows and isinstance(rows[0], dict) else []
+    if len(keys) < 2:
+        return rows
+    return downsample_points(rows, chart_type or "bar", keys[0], keys[1])
+
+
+def is_due(widget, now: datetime.datetime) -> bool:
+    last = widget.last_refreshed_at or widget.created_at
+    if last is None:
+        return True
+    if widget.refresh_ttl and (now - last).total_seconds() >= widget.refresh_ttl:
+        return True
+    if widget.refresh_cron:
+        try:
+            parsed = parse_cron(widget.refresh_cron)
+        except ValueError:
+            return False
+        # Vence si desde el último refresco ya pasó algún horario del cron (evaluado en UTC:
+        # "0 9 * * 1-5" es a las 09:00 UTC, sin importar la zona de la sesión de la DB)
+        next_run = next_cron_time(parsed, last.astimezone(datetime.timezone.utc))
+        return next_run is not None and next_run <= now
+    return False
+
+
+# --- REFRESCO ---
+
+async def _widget_engine(widget):
+    # Widgets anteriores a data_source_id no saben de qué fuente vienen: DB local, como antes
+    if widget.data_source_id is None:
+        return local_engine
+    return await get_source_engine(widget.data_source_id, widget.user_id)
+
+
+async def execute_widget_query(widget) -> dict:
+    """Ejecución acotada del SQL del widget en el engine de su fuente, respetando el límite por fuente."""
+    engine = await _widget_engine(widget)
+    if engine is None:
+        raise LookupError("La fuente de datos del widget ya no existe")
+    async with _semaphore(str(widget.data_source_id or "local")):
+        return await run_io(execute_bounded, engine, widget.sql_query)
+
+
+def apply_execution(widget, execution: dict, now: datetime.datetime = None) -> bool:
+    """Guarda el resultado en el widget; devuelve True solo si chart_data cambió."""
+    widget.last_refreshed_at = now or _now()
+    widget.refresh_error = None
+    data = jsonable_encoder(bounded_chart_data(to_records(execution), widget.chart_type))
+    if data == widget.chart_data:
+        return False
+    widget.chart_data = data
+    return True
+
+
+async def refresh_widgets(widgets: list) -> dict:
+    """
+    Refresca los widgets (ya cargados en una sesión) en paralelo, una consulta por par
+    (fuente, SQL). Devuelve {widget_id: {"status", "truncated"|"error"}}; no hace commit.
+    """
+    groups = defaultdict(list)
+    for widget in widgets:
+        groups[(str(widget.data_source_id or "local"), " ".join((widget.sql_query or "").split()))].append(widget)
+
+    async def run_group(members):
+        try:
+            return await execute_widget_query(members[0])
+        except Exception as e:
+            return e
+
+    executions = await asyncio.gather(*(run_group(members) for members in groups.values()))
+
+    now, results = _now(), {}
+    for members, execution in zip(groups.values(), executions):
+        for widget in members:
+            if isinstance(execution, Exception):
+                print(f"⚠️ [DASHBOARD] Widget {widget.id} no se pudo refrescar: {execution}")
+                widget.refresh_error = str(execution)
+                results[str(widget.id)] = {"status": "error", "error": str(execution)}
+                continue
+            changed = apply_execution(widget, execution, now)
+            results[str(widget.id)] = {
+                "status": "refreshed" if changed else "unchanged",
+                "truncated": execution["truncated"],
+            }
+    if len(groups) < len(widgets):
+        print(f"🔗 [DASHBOARD] {len(widgets)} widgets refrescados con {len(groups)} consultas")
+    return results
+
+
+# --- SCHEDULER ---
+
+async def _claim(db, widget, now) -> bool:
+    # Solo un proceso gana el UPDATE; un lease vencido (proceso caído o intento fallido) se puede volver a tomar
+    expired = now - datetime.timedelta(seconds=DASHBOARD_CLAIM_LEASE)
+    result = await db.execute(
+        update(models.DashboardWidget)
+        .where(models.DashboardWidget.id == widget.id,
+               or_(models.DashboardWidget.refresh_claimed_at.is_(None),
+                   models.DashboardWidget.refresh_claimed_at < expired))
+        .values(refresh_claimed_at=now)
+    )
+    return result.rowcount == 1
+
+
+async def refresh_due_widgets() -> int:
+    now = _now()
+    async with AsyncSessionLocal() as db:
+        scheduled = (await db.execute(
+            select(models.DashboardWidget).where(or_(
+                models.DashboardWidget.refresh_ttl.isnot(None),
+                models.DashboardWidget.refresh_cron.isnot(None),
+            ))
+        )).scalars().all()
+        due = [w for w in scheduled if is_due(w, now)]
+        claimed = [w for w in due if await _claim(db, w, now)]
+        await db.commit()
+        if not claimed:
+            return 0
+        # La sesión no expira en el commit (expire_on_commit=False): los widgets tomados se usan tal cual
+        results = await refresh_widgets(claimed)
+        for widget in claimed:
+            # Éxito: se libera el lease. Fallo: queda tomado hasta que venza (espera antes del reintento)
+            if results[str(widget.id)]["status"] != "error":
+                widget.refresh_claimed_at = None
+        await db.commit()
+    return len(claimed)
+
+
+async def _scheduler_loop():
+    while True:
+        try:
+            refreshed = await refresh_due_widgets()
+            if refreshed:
+                print(f"🕒 [DASHBOARD] {refreshed} widgets programados refrescados")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ [DASHBOARD] Error en el refresco programado: {e}")
+        await asyncio.sleep(DASHBOARD_REFRESH_TICK)
+
+
+def start_scheduler():
+    global _scheduler
+    if DASHBOARD_REFRESH_TICK > 0 and _scheduler is None:
+        _scheduler = asyncio.create_task(_scheduler_loop())
+
+
+async def stop_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.cancel()
+        await asyncio.gather(_scheduler, return_exceptions=True)
+        _scheduler = None
@@ -0,0 +1,117 @@
+# Reducción de series grandes antes de mandarlas al canvas o guardarlas en un widget.
+# - line: LTTB (Largest-Triangle-Three-Buckets), conserva la forma de la curva con N puntos.
+# - bar/pie: top-N por valor + una categoría "Otros" con la suma del resto.
+# - Series temporales: si el dialecto lo permite, la agregación por día/semana/mes se empuja
+#   al SQL (date_trunc en Postgres, DATE_FORMAT en MySQL) en vez de traer el detalle.
+import os
+import re
+import datetime
+
+CHART_POINT_BUDGET = int(os.getenv("CHART_POINT_BUDGET", "500"))   # puntos máximos de una línea
+CHART_TOP_N = int(os.getenv("CHART_TOP_N", "20"))                  # barras antes de agrupar en "Otros"
+PIE_TOP_N = 7                                                       # + "Otros" = 8 porciones
+OTHERS_LABEL = "Otros"
+
+_AVERAGE_NAMES = re.compile(r"(avg|average|promedio|prom_|media|mean|tasa|rate|ratio|porcentaje|pct|percent)")
+
+
+def _numeric_x(values: list) -> list:
+    # LTTB necesita un eje X numérico: fechas -> timestamp, números tal cual, resto -> posición
+    if all(isinstance(v, datetime.datetime) for v in values):
+        return [v.timestamp() for v in values]
+    if all(isinstance(v, datetime.date) for v in values):
+        return [float(v.toordinal()) for v in values]
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return [float(v) for v in values]
+    return [float(i) for i in range(len(values))]
+
+
+def lttb(points: list, budget: int, x_key: str = "name", y_key: str = "value") -> list:
+    """Largest-Triangle-Three-Buckets: elige `budget` puntos (incluye el primero y el último)."""
+    n = len(points)
+    if budget >= n or budget < 3:
+        return points
+    xs = _numeric_x([p[x_key] for p in points])
+    ys = [float(p[y_key] or 0) for p in points]
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (budget - 2)
+    a = 0
+    for i in range(budget - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        # Promedio del bucket siguiente (el "tercer vértice" del triángulo)
+        next_start, next_end = end, min(int((i + 2) * bucket_size) + 1, n)
+        span = max(next_end - next_start, 1)
+        avg_x = sum(xs[next_start:next_end]) / span if next_end > next_start else xs[-1]
+        avg_y = sum(ys[next_start:next_end]) / span if next_end > next_start else ys[-1]
+
+        best, best_area = start, -1.0
+        for j in range(start, min(end, n - 1)):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def top_n(points: list, n: int, x_key: str = "name", y_key: str = "value") -> list:
+    """Las n categorías de mayor valor (en su orden original) + "Otros" con la suma del resto."""
+    if len(points) <= n + 1:
+        return points
+    ranked = sorted(range(len(points)), key=lambda i: points[i][y_key] or 0, reverse=True)
+    keep = set(ranked[:n])
+    rest = sum(points[i][y_key] or 0 for i in ranked[n:])
+    kept = [p for i, p in enumerate(points) if i in keep]
+    return kept + [{x_key: OTHERS_LABEL, y_key: rest}]
+
+
+def downsample_points(points: list, chart_type: str, x_key: str = "name", y_key: str = "value",
+                      budget: int = CHART_POINT_BUDGET) -> list:
+    if not points:
+        return points
+    if any(not isinstance(p.get(y_key), (int, float, type(None))) for p in points):
+        return points[:budget]  # valores no numéricos: solo se recorta
+    if chart_type == "line":
+        return lttb(points, budget, x_key, y_key)
+    if chart_type == "pie":
+        return top_n(points, PIE_TOP_N, x_key, y_key)
+    return top_n(points, min(CHART_TOP_N, budget), x_key, y_key)
+
+
+def bucket_unit(values: list, budget: int = CHART_POINT_BUDGET):
+    """Unidad de agregación (day/week/month) para que el rango de fechas entre en el presupuesto."""
+    dates = [v for v in values if isinstance(v, datetime.date)]
+    if not dates:
+        return None
+    span_days = (max(dates) - min(dates)).days if not isinstance(dates[0], datetime.datetime) \
+        else (max(dates) - min(dates)).total_seconds() / 86400
+    if span_days <= budget:
+        return "day"
+    if span_days / 7 <= budget:
+        return "week"
+    return "month"
+
+
+def bucketed_sql(sql: str, dialect: str, quote, x: str, y: str, unit: str):
+    """SQL que agrega la serie por unidad de tiempo dentro de la DB (None si el dialecto no lo soporta)."""
+    sql = sql.strip().rstrip(";")
+    col_x, col_y = quote(x), quote(y)
+    if dialect == "postgresql":
+        bucket = f"date_trunc('{unit}', {col_x})"
+    elif dialect == "mysql":
+        bucket = {
+            "day": f"DATE({col_x})",
+            "week": f"DATE_SUB(DATE({col_x}), INTERVAL WEEKDAY({col_x}) DAY)",
+            "month": f"DATE_FORMAT({col_x}, '%Y-%m-01')",
+        }[unit]
+    else:
+        return None
+    # Si la medida es un promedio/tasa, sumarla por bucket no tendría sentido
+    agg = "AVG" if _AVERAGE_NAMES.search(y.lower()) else "SUM"
+    return (
+        f"SELECT {bucket} AS {col_x}, {agg}({col_y}) AS {col_y} "
+        f"FROM (\n{sql}\n) AS chart_source GROUP BY 1 ORDER BY 1"
+    )
@@ -0,0 +1,165 @@
+# Servicio único de embeddings (documentos, descripciones y consultas) con caché en dos niveles:
+#   1. LRU en memoria del proceso
+#   2. Tabla embedding_cache en Postgres (vectores float32 como bytes), compartida entre
+#      procesos y reinicios: re-subir un archivo no vuelve a pagar sus embeddings.
+# Clave = sha256(modelo + tarea + texto). La tarea importa: Gemini embebe distinto una
+# consulta (retrieval_query) que un documento (retrieval_document).
+import os
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from services.cache_service import TTLCache
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+MODEL_EMBEDDING = os.getenv("MODEL_EMBEDDING", "models/text-embedding-004")
+VECTOR_EMBEDDINGS = os.getenv("VECTOR_EMBEDDINGS", "gemini")   # "gemini" | "fake" (vectores deterministas, sin red)
+EMBED_DIM = int(os.getenv("EMBED_DIM", "768"))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))   # vectores en memoria (~3 KB c/u a 768 dims)
+EMBED_CACHE_PERSIST = os.getenv("EMBED_CACHE_PERSIST", "1") == "1"
+DB_LOOKUP_BATCH = 1000
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envuelve un proveedor de embeddings de LangChain. Los textos que no están en ninguna
+    caché se juntan en una sola llamada a embed_documents (el proveedor los agrupa en requests).
+    """
+
+    def __init__(self, base, model_name: str, engine=None, maxsize: int = EMBED_CACHE_SIZE):
+        self._base = base
+        self.model_name = model_name
+        self._engine = engine
+        self._memory = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "api_calls": 0, "db_errors": 0}
+
+    def _key(self, task: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{task}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
+
+    # --- Nivel 2: tabla persistente ---
+    def _load(self, keys: list) -> dict:
+        from models import EmbeddingCache
+        from sqlalchemy import select
+        table = EmbeddingCache.__table__
+        found = {}
+        with self._engine.connect() as conn:
+            for start in range(0, len(keys), DB_LOOKUP_BATCH):
+                batch = keys[start:start + DB_LOOKUP_BATCH]
+                for key, blob in conn.execute(select(table.c.key, table.c.vector).where(table.c.key.in_(batch))):
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _save(self, vectors: dict):
+        from models import EmbeddingCache
+        if self._engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        rows = [
+            {"key": key, "model": self.model_name, "dim": len(vector), "vector": vector.astype(np.float32).tobytes()}
+            for key, vector in vectors.items()
+        ]
+        # Otro proceso pudo haber guardado la misma clave en paralelo: no es error
+        with self._engine.begin() as conn:
+            conn.execute(insert(EmbeddingCache.__table__).on_conflict_do_nothing(index_elements=["key"]), rows)
+
+    def _embed(self, texts: list, task: str) -> list:
+        keys = [self._key(task, text) for text in texts]
+        pending = dict(zip(keys, texts))  # únicos, en orden
+        vectors = {}
+
+        for key in list(pending):
+            vector = self._memory.get(key)
+            if vector is not None:
+                vectors[key] = vector
+                del pending[key]
+        self._count(memory_hits=len(vectors))
+
+        if pending and self._engine is not None:
+            try:
+                found = self._load(list(pending))
+                for key, vector in found.items():
+                    vectors[key] = vector
+                    self._memory.set(key, vector)
+                    del pending[key]
+                self._count(db_hits=len(found))
+            except Exception as e:
+                self._count(db_errors=1)
+                print(f"⚠️ [EMBEDDINGS] Caché persistente no disponible: {e}")
+
+        if pending:
+            pending_texts = list(pending.values())
+            if task == "query":
+                new_vectors = [self._base.embed_query(text) for text in pending_texts]
+            else:
+                new_vectors = self._base.embed_documents(pending_texts)
+            self._count(misses=len(pending), api_calls=len(pending_texts) if task == "query" else 1)
+
+            fresh = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(pending, new_vectors)}
+            for key, vector in fresh.items():
+                vectors[key] = vector
+                self._memory.set(key, vector)
+            if self._engine is not None:
+                try:
+                    self._save(fresh)
+                except Exception as e:
+                    self._count(db_errors=1)
+                    print(f"⚠️ [EMBEDDINGS] No se pudo persistir la caché: {e}")
+
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_documents(self, texts) -> list:
+        texts = list(texts)
+        return self._embed(texts, "document") if texts else []
+
+    def embed_query(self, text: str) -> list:
+        return self._embed([text], "query")[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        return {
+            **stats,
+            "model": self.model_name,
+            "memory_size": self._memory.stats()["size"],
+            "hit_rate": round((stats["memory_hits"] + stats["db_hits"]) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def _build_embeddings():
+    if VECTOR_EMBEDDINGS == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        base, model_name = DeterministicFakeEmbedding(size=EMBED_DIM), f"fake-{EMBED_DIM}"
+    else:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        base, model_name = GoogleGenerativeAIEmbeddings(model=MODEL_EMBEDDING, google_api_key=GOOGLE_API_KEY), MODEL_EMBEDDING
+
+    engine = None
+    if EMBED_CACHE_PERSIST:
+        from database import engine
+    return CachedEmbeddings(base, model_name, engine)
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """Cliente de embeddings compartido por todos los servicios (lazy, thread-safe)."""
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                _embeddings = _build_embeddings()
+    return _embeddings
+
+
+def get_embedding_stats() -> dict:
+    return get_embeddings().stats()
@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import create_engine
+
+# Configuración del registro de engines externos
+ENGINE_POOL_SIZE = int(os.getenv("ENGINE_POOL_SIZE", "5"))
+ENGINE_MAX_OVERFLOW = int(os.getenv("ENGINE_MAX_OVERFLOW", "5"))
+ENGINE_POOL_RECYCLE = int(os.getenv("ENGINE_POOL_RECYCLE", "1800"))  # segundos
+ENGINE_IDLE_TTL = int(os.getenv("ENGINE_IDLE_TTL", "900"))  # segundos sin uso antes de cerrar
+ENGINE_MAX_LIVE = int(os.getenv("ENGINE_MAX_LIVE", "32"))  # engines vivos como máximo (LRU)
+ENGINE_CONNECT_TIMEOUT = int(os.getenv("ENGINE_CONNECT_TIMEOUT", "5"))
+
+# source_id -> {"engine", "db_url", "last_used"}  (orden = LRU, el más viejo primero)
+_engines = OrderedDict()
+_lock = threading.Lock()
+
+
+def _build_engine(db_url: str):
+    return create_engine(
+        db_url,
+        pool_size=ENGINE_POOL_SIZE,
+        max_overflow=ENGINE_MAX_OVERFLOW,
+        pool_recycle=ENGINE_POOL_RECYCLE,
+        pool_pre_ping=True,  # Reconecta si Docker / el proveedor cortó el enlace
+        connect_args={"connect_timeout": ENGINE_CONNECT_TIMEOUT},
+    )
+
+
+def _evict_idle(now: float):
+    """Cierra los engines que llevan más de ENGINE_IDLE_TTL sin usarse. Requiere _lock."""
+    for source_id in [sid for sid, e in _engines.items() if now - e["last_used"] > ENGINE_IDLE_TTL]:
+        _engines.pop(source_id)["engine"].dispose()
+        print(f"🧹 [ENGINES] Engine inactivo cerrado: {source_id}")
+
+
+def get_engine(source_id: str, db_url: str):
+    """
+    Devuelve el engine (con su pool) de una fuente externa, creándolo solo la primera vez.
+    Si la URL cambió, el engine anterior se descarta.
+    """
+    source_id = str(source_id)
+    now = time.monotonic()
+    with _lock:
+        _evict_idle(now)
+
+        entry = _engines.get(source_id)
+        if entry and entry["db_url"] == db_url:
+            entry["last_used"] = now
+            _engines.move_to_end(source_id)
+            return entry["engine"]
+
+        if entry:
+            _engines.pop(source_id)["engine"].dispose()
+
+        engine = _build_engine(db_url)
+        _engines[source_id] = {"engine": engine, "db_url": db_url, "last_used": now}
+
+        # LRU: si superamos el máximo, cerramos el menos usado
+        while len(_engines) > ENGINE_MAX_LIVE:
+            old_id, old_entry = _engines.popitem(last=False)
+            old_entry["engine"].dispose()
+            print(f"♻️ [ENGINES] Límite alcanzado, engine descartado (LRU): {old_id}")
+
+        return engine
+
+
+def invalidate_engine(source_id: str):
+    """Cierra y olvida el engine de una fuente (al editarla o borrarla)."""
+    with _lock:
+        entry = _engines.pop(str(source_id), None)
+    if entry:
+        entry["engine"].dispose()
+
+
+def dispose_all_engines():
+    with _lock:
+        entries = list(_engines.values())
+        _engines.clear()
+    for entry in entries:
+        entry["engine"].dispose()
+
@@ -0,0 +1,111 @@
+import os
+import time
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Configuración de los pools
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))            # Pinecone, SQL externo, HTTP
+IO_MAX_QUEUE = int(os.getenv("IO_MAX_QUEUE", "256"))       # tareas en espera antes de aplicar backpressure
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))  # Parsing de archivos
+CPU_MAX_QUEUE = int(os.getenv("CPU_MAX_QUEUE", "32"))
+
+
+class _BoundedPool:
+    """
+    Envuelve un executor con un límite de tareas en vuelo (workers + cola) y métricas.
+    Si la cola está llena, el llamador espera (backpressure) en vez de encolar sin fin.
+    """
+
+    def __init__(self, name: str, factory, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._factory = factory
+        self._executor = None
+        self._init_lock = threading.Lock()
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+
+    def _get_executor(self):
+        # Lazy: el pool de procesos solo se crea si alguien lo usa
+        if self._executor is None:
+            with self._init_lock:
+                if self._executor is None:
+                    self._executor = self._factory(max_workers=self.max_workers)
+        return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), partial(func, *args, **kwargs))
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.total_seconds += time.perf_counter() - start
+            self.in_flight -= 1
+            self._slots.release()
+
+    @property
+    def queue_depth(self) -> int:
+        # Tareas aceptadas que todavía no tienen worker + las que esperan lugar en la cola
+        return max(0, self.in_flight - self.max_workers) + self.waiting
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_ms": round(self.total_seconds / finished * 1000, 2) if finished else 0.0,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_io_pool = _BoundedPool("io", partial(ThreadPoolExecutor, thread_name_prefix="fluent-io"), IO_WORKERS, IO_MAX_QUEUE)
+_cpu_pool = _BoundedPool("cpu", ProcessPoolExecutor, CPU_WORKERS, CPU_MAX_QUEUE)
+
+
+async def run_io(func, *args, **kwargs):
+    """Ejecuta una llamada bloqueante de red/DB en el pool de hilos."""
+    return await _io_pool.run(func, *args, **kwargs)
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Ejecuta trabajo pesado de CPU (parsing) en el pool de procesos. func debe ser picklable."""
+    return await _cpu_pool.run(func, *args, **kwargs)
+
+
+def get_executor_stats() -> dict:
+    return {"io": _io_pool.stats(), "cpu": _cpu_pool.stats()}
+
+
+def shutdown_executors():
+    _io_pool.shutdown()
+    _cpu_pool.shutdown()
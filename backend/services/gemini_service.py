@@ -1,18 +1,14 @@
 # backend/services/gemini_service.py
 import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage
+from services.embedding_service import get_embeddings
 
 # Configuración
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-MODEL_EMBEDDING = os.getenv("MODEL_EMBEDDING", "models/text-embedding-004")
 MODEL_FAST = os.getenv("MODEL_FAST", "gemini-1.5-flash")
 
-# 1. Cliente de Embeddings (Genera vectores de 768 dimensiones)
-embeddings_client = GoogleGenerativeAIEmbeddings(
-    model=MODEL_EMBEDDING,
-    google_api_key=GOOGLE_API_KEY
-)
+# 1. Cliente de Embeddings (768 dimensiones): compartido y con caché, ver services/embedding_service
 
 # 2. Cliente de Chat (Gemini Flash para descripciones rápidas)
 chat_client = ChatGoogleGenerativeAI(
@@ -25,7 +21,7 @@ def get_embedding(text: str):
     """Convierte texto en vector de 768 dimensiones"""
     # Gemini prefiere que no haya saltos de línea raros en embeddings
     text = text.replace("\n", " ")
-    return embeddings_client.embed_query(text)
+    return get_embeddings().embed_query(text)
 
 async def generate_description(content_sample: str, asset_type: str) -> str:
     """Usa Gemini para describir qué hay en el archivo"""
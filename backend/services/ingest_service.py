@@ -0,0 +1,259 @@
+# Ingesta de datos tabulares (CSV / Excel / Google Sheets) hacia la DB local.
+# El CSV se lee por bloques desde el stream del upload: la memoria queda acotada
+# al tamaño del bloque, sin importar el tamaño del archivo.
+import io
+import os
+import csv
+import uuid
+import codecs
+import tempfile
+import pandas as pd
+import requests
+from services.schema_service import TIMESTAMP_TYPE
+
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "50000"))   # filas por bloque
+CSV_SNIFF_BYTES = int(os.getenv("CSV_SNIFF_BYTES", str(64 * 1024)))
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # a partir de acá la descarga se vuelca a disco
+PREVIEW_ROWS = 5
+
+_DELIMITERS = [",", ";", "\t", "|"]
+
+# Inferencia de tipos para el COPY (sobre texto). Sin ceros a la izquierda: "007" es un código, no un número
+_INT_PATTERN = r"[-+]?(0|[1-9]\d{0,17})"
+_FLOAT_PATTERN = r"[-+]?((0|[1-9]\d*)(\.\d*)?|\.\d+)([eE][-+]?\d+)?"
+_DATE_PATTERN = r"\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?"
+
+
+def normalize_columns(columns) -> list:
+    new_columns = []
+    for c in columns:
+        # 1. Limpieza de comillas  2. Normalización del nombre
+        clean_col = str(c).replace('"', '').replace("'", "").strip()
+        clean_col = clean_col.lower().replace(" ", "_").replace(".", "").replace("/", "_").replace("$", "")
+        if not clean_col or clean_col == "nan":
+            clean_col = f"col_{len(new_columns)}"
+        new_columns.append(clean_col)
+    return new_columns
+
+
+def build_table_name(filename: str, user_id: str) -> str:
+    clean_filename = "".join(e for e in filename.split(".")[0].lower() if e.isalnum() or e == "_")
+    return f"u_{user_id.split('-')[0]}_{clean_filename}"
+
+
+def sniff_csv(stream) -> dict:
+    """Detecta encoding y dialecto leyendo solo un prefijo acotado del stream."""
+    prefix = stream.read(CSV_SNIFF_BYTES)
+    stream.seek(0)
+    if not prefix.strip():
+        raise ValueError("El archivo CSV está vacío")
+
+    encoding = "latin-1"
+    for candidate in ("utf-8-sig", "utf-8"):
+        try:
+            # Decoder incremental: tolera que el prefijo corte un carácter multibyte a la mitad
+            codecs.getincrementaldecoder(candidate)().decode(prefix, final=False)
+            encoding = candidate
+            break
+        except UnicodeDecodeError:
+            continue
+
+    sample = prefix.decode(encoding, errors="ignore")
+    # Solo líneas completas para el sniffer
+    if len(prefix) == CSV_SNIFF_BYTES and "\n" in sample:
+        sample = sample[:sample.rindex("\n")]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters="".join(_DELIMITERS))
+        sep, quotechar = dialect.delimiter, dialect.quotechar or '"'
+    except csv.Error:
+        # Fallback: el separador más común en el header
+        header = sample.splitlines()[0] if sample else ""
+        sep, quotechar = max(_DELIMITERS, key=header.count), '"'
+
+    print(f"✓ CSV: encoding={encoding} separador='{sep}'")
+    return {"encoding": encoding, "sep": sep, "quotechar": quotechar}
+
+
+def iter_csv_frames(stream, chunk_rows: int = CSV_CHUNK_ROWS):
+    """Parsea el CSV con el motor C de pandas, devolviendo DataFrames de chunk_rows filas."""
+    dialect = sniff_csv(stream)
+    reader = pd.read_csv(
+        stream,
+        sep=dialect["sep"],
+        quotechar=dialect["quotechar"],
+        encoding=dialect["encoding"],
+        dtype=str,
+        skipinitialspace=True,
+        skip_blank_lines=True,
+        chunksize=chunk_rows,
+    )
+    for frame in reader:
+        # Mismo criterio que el parser manual: sin espacios alrededor de cada celda
+        yield frame.apply(lambda col: col.str.strip())
+
+
+def download_to_spool(url: str):
+    """Descarga a un archivo temporal (RAM hasta 8 MB, luego disco) sin cargarlo entero en memoria."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        for block in response.iter_content(chunk_size=1024 * 1024):
+            spool.write(block)
+    spool.seek(0)
+    return spool
+
+
+def _json_safe(df: pd.DataFrame) -> list:
+    # NaN no es JSON válido para JSONB
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def _infer_sql_type(series: pd.Series) -> str:
+    """Tipo Postgres para una columna (nombres tal como los devuelve el inspector)."""
+    if pd.api.types.is_bool_dtype(series):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(series):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(series):
+        return "DOUBLE PRECISION"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return TIMESTAMP_TYPE
+
+    values = series.dropna().astype(str)
+    values = values[values != ""]
+    if values.empty:
+        return "TEXT"
+    for sql_type, pattern in (("BIGINT", _INT_PATTERN), ("DOUBLE PRECISION", _FLOAT_PATTERN)):
+        if values.str.fullmatch(pattern).all():
+            return sql_type
+    # La forma no alcanza: 2024-02-30 o 2024-13-01 harían abortar el COPY entero
+    if values.str.fullmatch(_DATE_PATTERN).all() and pd.to_datetime(values, errors="coerce", format="ISO8601").notna().all():
+        return TIMESTAMP_TYPE
+    return "TEXT"
+
+
+_TYPE_WIDENING = {
+    ("BIGINT", "DOUBLE PRECISION"): "DOUBLE PRECISION",
+    ("DOUBLE PRECISION", "BIGINT"): "DOUBLE PRECISION",
+}
+
+
+def _merge_sql_type(current: str, observed: str, series: pd.Series) -> str:
+    """Tipo que admite tanto lo cargado hasta ahora como el bloque nuevo (BIGINT -> DOUBLE -> TEXT)."""
+    if current in (observed, "TEXT") or series.dropna().astype(str).eq("").all():
+        return current
+    return _TYPE_WIDENING.get((current, observed), "TEXT")
+
+
+def _copy_frames_postgres(frames, table_name: str, engine, on_frame):
+    """
+    Carga masiva con COPY ... FROM STDIN (CSV) bloque a bloque en una tabla de staging,
+    que al final reemplaza a la tabla destino en la misma transacción: quien lea la tabla
+    ve la versión anterior completa o la nueva completa, nunca una carga a medias.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    staging = f"_stg_{uuid.uuid4().hex[:8]}_{table_name}"[:63]
+    column_types = None
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for frame in frames:
+            columns = on_frame(frame)
+            quoted_cols = ", ".join(quote(c) for c in columns)
+
+            if column_types is None:
+                # Tipos reales inferidos del primer bloque, antes de crear la tabla
+                column_types = {c: _infer_sql_type(frame[c]) for c in columns}
+                ddl = ", ".join(f"{quote(c)} {column_types[c]}" for c in columns)
+                cursor.execute(f"CREATE TABLE {quote(staging)} ({ddl})")
+            else:
+                # Si un bloque posterior no encaja en el tipo inferido, ensanchamos la columna
+                for c in columns:
+                    merged = _merge_sql_type(column_types[c], _infer_sql_type(frame[c]), frame[c])
+                    if merged != column_types[c]:
+                        print(f"⚠️ [COPY] Columna '{c}': {column_types[c]} -> {merged}")
+                        cursor.execute(
+                            f"ALTER TABLE {quote(staging)} ALTER COLUMN {quote(c)} TYPE {merged} "
+                            f"USING {quote(c)}::{merged}"
+                        )
+                        column_types[c] = merged
+
+            buffer = io.StringIO()
+            frame.to_csv(buffer, index=False, header=False, na_rep="")
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY {quote(staging)} ({quoted_cols}) FROM STDIN WITH (FORMAT csv, NULL '')", buffer
+            )
+
+        if column_types is not None:
+            # Swap atómico
+            cursor.execute(f"DROP TABLE IF EXISTS {quote(table_name)}")
+            cursor.execute(f"ALTER TABLE {quote(staging)} RENAME TO {quote(table_name)}")
+        raw.commit()
+        return column_types
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def _to_sql_frames(frames, table_name: str, engine, on_frame):
+    """Fallback para motores que no son Postgres/psycopg2: INSERTs multi-fila con pandas."""
+    first = True
+    for frame in frames:
+        on_frame(frame)
+        frame.to_sql(
+            table_name, con=engine, index=False, method="multi", chunksize=1000,
+            if_exists="replace" if first else "append"
+        )
+        first = False
+    # Los tipos los decide pandas (texto -> TEXT)
+    return None
+
+
+def load_frames_to_sql(frames, table_name: str, engine, on_progress=None):
+    """
+    Carga los bloques en table_name y acumula el perfilado.
+    Postgres (psycopg2): COPY a staging + swap atómico. Otros motores: pandas.to_sql.
+    on_progress(filas_leídas) se llama después de cada bloque (corre en el hilo de la carga).
+    Devuelve (stats, head) donde head son las primeras filas.
+    """
+    state = {"columns": None, "head": None, "rows": 0, "missing": 0, "memory": 0}
+
+    def on_frame(frame):
+        # Normaliza columnas y acumula perfilado de cada bloque
+        if state["columns"] is None:
+            state["columns"] = normalize_columns(frame.columns)
+            state["head"] = frame.head(PREVIEW_ROWS).copy()
+            state["head"].columns = state["columns"]
+        frame.columns = state["columns"]
+        state["rows"] += len(frame)
+        state["missing"] += int(frame.isnull().sum().sum())
+        state["memory"] += int(frame.memory_usage(deep=True).sum())
+        if on_progress:
+            on_progress(state["rows"])
+        return state["columns"]
+
+    if engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2":
+        column_types = _copy_frames_postgres(frames, table_name, engine, on_frame)
+    else:
+        column_types = _to_sql_frames(frames, table_name, engine, on_frame)
+
+    columns, head = state["columns"], state["head"]
+    if columns is None:
+        raise ValueError("El archivo no tiene filas")
+
+    # --- PERFILADO DE DATOS (Data Profiling) ---
+    stats = {
+        "total_rows": state["rows"],
+        "total_columns": len(columns),
+        "columns_list": columns,
+        "column_types": column_types,
+        "missing_values": state["missing"], # Total de celdas vacías
+        "memory_usage_kb": round(state["memory"] / 1024, 2),
+        "preview": _json_safe(head.head(3)) # Pequeña muestra para UI
+    }
+    print(f"📊 [PROFILING] Tabla: '{table_name}' | Filas: {stats['total_rows']} | Nulos: {stats['missing_values']}")
+    return stats, head
@@ -0,0 +1,440 @@
+# Jobs de ingesta en segundo plano.
+# El endpoint guarda el archivo en un spool local, registra el job en la tabla ingest_jobs y
+# devuelve el id al instante. Un pool acotado de workers asyncio (en este mismo proceso)
+# corre las etapas y va dejando en la fila el progreso, las filas cargadas y los errores.
+# La cola vive en Postgres: si el proceso se cae, los jobs pendientes se retoman al arrancar.
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import datetime
+import tempfile
+
+from sqlalchemy import select, update, or_
+
+import models
+from database import AsyncSessionLocal, engine
+from services.executor_service import run_io, run_cpu
+from services.parsing_service import parse_excel_bytes
+from services.ingest_service import build_table_name, iter_csv_frames, load_frames_to_sql, download_to_spool
+from services.chunking_service import iter_document_chunks
+from services.gemini_service import generate_description
+from services.pinecone_service import upsert_asset_vector, upsert_asset_chunks
+from services.schema_service import schema_from_dataframe, invalidate_schema
+from services.sql_service import invalidate_inventory
+from services.bm25_service import persist_chunks
+from services.answer_cache_service import invalidate_answers
+from services.sql_template_service import invalidate_sql_templates
+
+# Configuración
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))               # jobs en paralelo por proceso
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_RETRY_BACKOFF = float(os.getenv("INGEST_RETRY_BACKOFF", "5"))  # segundos; se duplica en cada reintento
+INGEST_HEARTBEAT = float(os.getenv("INGEST_HEARTBEAT", "15"))         # un RUNNING sin latido por 4x esto quedó huérfano
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "fluent_ingest"))
+PROGRESS_INTERVAL = 1.0  # cada cuánto se persisten las filas cargadas
+
+STRUCTURED_EXTS = [".csv", ".xlsx"]
+DOCUMENT_EXTS = [".pdf", ".docx", ".txt"]
+
+STRUCTURED_STAGES = ["load", "describe", "register", "index"]
+DOCUMENT_STAGES = ["extract", "describe", "register", "index"]
+
+_queue = None
+_workers = []
+_running = set()  # jobs tomados por los workers de este proceso
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _is_document(job) -> bool:
+    return job.payload.get("file_ext") in DOCUMENT_EXTS
+
+
+def _copy_upload(stream, path: str):
+    with open(path, "wb") as out:
+        shutil.copyfileobj(stream, out, length=1024 * 1024)
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _remove_spool(job):
+    path = (job.payload or {}).get("path")
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def job_to_dict(job) -> dict:
+    stages = job.stages or {}
+    order = DOCUMENT_STAGES if _is_document(job) else STRUCTURED_STAGES
+    return {
+        "id": str(job.id),
+        "status": job.status,
+        "stage": job.stage,
+        "stages": [{"name": name, **stages.get(name, {"status": "pending"})} for name in order],
+        "rows_loaded": job.rows_loaded or 0,
+        "attempts": job.attempts or 0,
+        "error": job.error,
+        "source_id": str(job.data_source_id),
+        "asset_id": str(job.asset_id),
+        "result": {k: v for k, v in (job.result or {}).items() if k in ("table_name", "description", "chunks", "columns")},
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# ==========================================
+# ALTA DE JOBS
+# ==========================================
+
+async def _create_job(db, user_id: str, kind: str, payload: dict, job_id=None):
+    job = models.IngestJob(
+        id=job_id or uuid.uuid4(),
+        user_id=user_id,
+        kind=kind,
+        status="PENDING",
+        stages={},
+        payload=payload,
+        result={},
+        data_source_id=uuid.uuid4(),
+        asset_id=uuid.uuid4(),
+        rows_loaded=0,
+        attempts=0,
+    )
+    db.add(job)
+    await db.commit()
+    _enqueue(job.id)
+    print(f"📥 [JOBS] Job {job.id} encolado ({kind}: {payload.get('filename')})")
+    return job
+
+
+async def submit_file_job(db, user_id: str, filename: str, stream):
+    """Copia el upload al spool (disco, por bloques) y encola su ingesta."""
+    file_ext = os.path.splitext(filename.lower())[1]
+    if file_ext not in STRUCTURED_EXTS + DOCUMENT_EXTS:
+        raise ValueError("Formato no soportado")
+
+    job_id = uuid.uuid4()
+    path = os.path.join(INGEST_SPOOL_DIR, f"{job_id}{file_ext}")
+    await run_io(_copy_upload, stream, path)
+    payload = {"filename": filename, "file_ext": file_ext, "path": path}
+    return await _create_job(db, user_id, "FILE", payload, job_id)
+
+
+async def submit_gsheet_job(db, user_id: str, name: str, csv_url: str):
+    """La descarga del Sheet también es parte del job (etapa load)."""
+    payload = {"filename": f"{name.replace(' ', '_')}.csv", "file_ext": ".csv", "url": csv_url}
+    return await _create_job(db, user_id, "GSHEET", payload)
+
+
+async def retry_job(db, job):
+    """Reintento manual de un job FAILED: mismas fuente/asset, retoma desde la etapa que falló."""
+    if job.status != "FAILED":
+        raise ValueError("Solo se pueden reintentar jobs fallidos")
+    if job.kind == "FILE" and not os.path.exists(job.payload.get("path", "")):
+        raise ValueError("El archivo original ya no está disponible; hay que volver a subirlo")
+    job.status, job.attempts, job.error, job.finished_at = "PENDING", 0, None, None
+    await db.commit()
+    _enqueue(job.id)
+    return job
+
+
+# ==========================================
+# ETAPAS
+# ==========================================
+
+def _load_csv_file(path: str, table_name: str, on_progress):
+    with open(path, "rb") as stream:
+        return load_frames_to_sql(iter_csv_frames(stream), table_name, engine, on_progress)
+
+
+def _load_gsheet(url: str, table_name: str, on_progress):
+    with download_to_spool(url) as spool:
+        return load_frames_to_sql(iter_csv_frames(spool), table_name, engine, on_progress)
+
+
+async def _stage_load(job, progress: dict) -> dict:
+    payload = job.payload
+    table_name = build_table_name(payload["filename"], job.user_id)
+
+    def on_progress(rows):
+        progress["rows"] = rows
+
+    # Todas las variantes reemplazan la tabla completa: repetir la etapa es idempotente
+    if job.kind == "GSHEET":
+        print(f"📥 Descargando Google Sheet: {payload['url']}")
+        stats, head = await run_io(_load_gsheet, payload["url"], table_name, on_progress)
+    elif payload["file_ext"] == ".csv":
+        stats, head = await run_io(_load_csv_file, payload["path"], table_name, on_progress)
+    else:
+        # El parsing de Excel es CPU puro: lo mandamos al pool de procesos
+        content = await run_io(_read_bytes, payload["path"])
+        df = await run_cpu(parse_excel_bytes, content)
+        stats, head = await run_io(load_frames_to_sql, [df], table_name, engine, on_progress)
+
+    progress["rows"] = stats["total_rows"]
+    return {
+        "table_name": table_name,
+        "stats": stats,
+        "columns": stats["columns_list"],
+        "sample": head.to_markdown(index=False),
+        "schema_cache": schema_from_dataframe(table_name, head, stats.get("column_types")),
+    }
+
+
+def _first_chunk(path: str, file_ext: str):
+    return next(iter_document_chunks(_read_bytes(path), file_ext), None)
+
+
+async def _stage_extract(job, progress: dict) -> dict:
+    first_chunk = await run_io(_first_chunk, job.payload["path"], job.payload["file_ext"])
+    if first_chunk is None:
+        raise ValueError("El documento no tiene texto extraíble")
+    return {"head_text": first_chunk["text"][:1000]}
+
+
+async def _stage_describe(job, progress: dict) -> dict:
+    if _is_document(job):
+        description = await generate_description(job.result["head_text"], "DOCUMENT")
+    else:
+        description = await generate_description(job.result["sample"], "STRUCTURED")
+    return {"description": description}
+
+
+async def _stage_register(job, progress: dict) -> dict:
+    payload, result = job.payload, job.result
+    filename = payload["filename"]
+    if _is_document(job):
+        connection_config = {}
+        asset_metadata = {"sample": result["head_text"][:200]}
+    else:
+        connection_config = {"table_name": result["table_name"]}
+        asset_metadata = {
+            "table_name": result["table_name"],
+            "profiling": result["stats"],
+            "sample": result["sample"],  # Mantenemos el sample para el agente
+            "schema_cache": result["schema_cache"],  # Esquema listo para el agente SQL
+        }
+
+    # merge con IDs fijos del job: un reintento actualiza las mismas filas
+    async with AsyncSessionLocal() as db:
+        await db.merge(models.DataSource(
+            id=job.data_source_id,
+            user_id=job.user_id,
+            name=os.path.splitext(filename)[0],
+            type=payload["file_ext"].replace(".", "").upper(),
+            connection_config=connection_config,
+        ))
+        await db.merge(models.DataAsset(
+            id=job.asset_id,
+            data_source_id=job.data_source_id,
+            name=filename,
+            description=result["description"],
+            asset_metadata=asset_metadata,
+            is_indexed=False,  # pasa a True recién cuando los vectores están arriba
+            last_synced_at=_now(),  # versión de la fuente para la caché de respuestas
+        ))
+        await db.commit()
+    invalidate_inventory(job.user_id)
+    invalidate_answers(job.user_id)
+    invalidate_schema(str(job.data_source_id))
+    invalidate_sql_templates(str(job.data_source_id))
+    return {}
+
+
+def _iter_file_chunks(path: str, file_ext: str):
+    return iter_document_chunks(_read_bytes(path), file_ext)
+
+
+async def _stage_index(job, progress: dict) -> dict:
+    payload, result = job.payload, job.result
+    metadata = {"filename": payload["filename"], "asset_id": str(job.asset_id)}
+    tags = {"user_id": job.user_id, "source_type": payload["file_ext"].replace(".", "").upper()}
+    output = {}
+
+    # IDs deterministas (asset_id / asset_id-chunk): re-indexar pisa los vectores existentes
+    if _is_document(job):
+        chunks = await run_io(_iter_file_chunks, payload["path"], payload["file_ext"])
+        # El mismo recorrido guarda el texto de cada chunk para el índice BM25
+        chunks = persist_chunks(chunks, job.asset_id, job.user_id, payload["filename"])
+        total = await upsert_asset_chunks(job.asset_id, chunks, {**metadata, "type": "DOCUMENT"}, **tags)
+        if not total:
+            raise RuntimeError("No se pudieron indexar los chunks en Pinecone")
+        output["chunks"] = total
+    else:
+        if not await upsert_asset_vector(job.asset_id, result["description"], {**metadata, "type": "STRUCTURED"}, **tags):
+            raise RuntimeError("No se pudo vectorizar el asset en Pinecone")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(models.DataAsset).where(models.DataAsset.id == job.asset_id)
+            .values(is_indexed=True, last_synced_at=_now())
+        )
+        await db.commit()
+    invalidate_inventory(job.user_id)
+    invalidate_answers(job.user_id)
+    return output
+
+
+_STAGE_HANDLERS = {
+    "load": _stage_load,
+    "extract": _stage_extract,
+    "describe": _stage_describe,
+    "register": _stage_register,
+    "index": _stage_index,
+}
+
+
+# ==========================================
+# EJECUCIÓN
+# ==========================================
+
+async def _run_stage(db, job, name: str) -> dict:
+    """Corre una etapa persistiendo latido y filas cargadas mientras avanza."""
+    progress = {"rows": job.rows_loaded or 0}
+    task = asyncio.ensure_future(_STAGE_HANDLERS[name](job, progress))
+    last_beat = time.monotonic()
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=PROGRESS_INTERVAL)
+            rows_changed = progress["rows"] != job.rows_loaded
+            if rows_changed or done or time.monotonic() - last_beat >= INGEST_HEARTBEAT:
+                job.rows_loaded = progress["rows"]
+                job.heartbeat_at = _now()
+                last_beat = time.monotonic()
+                if not done:
+                    await db.commit()
+            if done:
+                return task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def _claim(db, job_id):
+    # UPDATE condicional: si otro proceso ya tomó el job, no lo corremos dos veces
+    claimed = await db.execute(
+        update(models.IngestJob)
+        .where(models.IngestJob.id == job_id, models.IngestJob.status == "PENDING")
+        .values(status="RUNNING", attempts=models.IngestJob.attempts + 1, heartbeat_at=_now(), error=None)
+    )
+    await db.commit()
+    if claimed.rowcount != 1:
+        return None
+    return await db.get(models.IngestJob, job_id)
+
+
+async def _execute(job_id):
+    async with AsyncSessionLocal() as db:
+        job = await _claim(db, job_id)
+        if job is None:
+            return
+        print(f"⚙️ [JOBS] Job {job.id} intento {job.attempts}")
+
+        try:
+            for name in DOCUMENT_STAGES if _is_document(job) else STRUCTURED_STAGES:
+                if (job.stages or {}).get(name, {}).get("status") == "done":
+                    continue  # Reintento: la etapa ya quedó hecha en un intento anterior
+
+                job.stage = name
+                job.stages = {**job.stages, name: {"status": "running"}}
+                await db.commit()
+
+                start = time.perf_counter()
+                output = await _run_stage(db, job, name)
+                job.result = {**job.result, **output}
+                job.stages = {**job.stages, name: {"status": "done", "seconds": round(time.perf_counter() - start, 2)}}
+                await db.commit()
+
+            job.status, job.stage, job.finished_at = "DONE", None, _now()
+            await db.commit()
+            await run_io(_remove_spool, job)
+            print(f"✅ [JOBS] Job {job.id} terminado ({job.rows_loaded} filas)")
+
+        except Exception as e:
+            await db.rollback()
+            await db.refresh(job)
+            # Los errores de formato (ValueError, incluye los de parsing) no mejoran reintentando
+            retry = job.attempts < INGEST_MAX_ATTEMPTS and not isinstance(e, ValueError)
+            job.stages = {**job.stages, job.stage: {"status": "failed", "error": str(e)}}
+            job.status = "PENDING" if retry else "FAILED"
+            job.error = str(e)
+            if not retry:
+                job.finished_at = _now()
+            await db.commit()
+
+            if retry:
+                delay = INGEST_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+                print(f"⚠️ [JOBS] Job {job.id} falló en '{job.stage}' ({e}); reintento en {delay:.0f}s")
+                asyncio.get_running_loop().call_later(delay, _enqueue, job.id)
+            else:
+                print(f"❌ [JOBS] Job {job.id} falló en '{job.stage}': {e}")
+
+
+def _enqueue(job_id):
+    if _queue is not None:
+        _queue.put_nowait(job_id)
+
+
+async def _worker(n: int):
+    while True:
+        job_id = await _queue.get()
+        _running.add(job_id)
+        try:
+            await _execute(job_id)
+        except Exception as e:
+            print(f"❌ [JOBS] Worker {n}: error inesperado en job {job_id}: {e}")
+        finally:
+            _running.discard(job_id)
+            _queue.task_done()
+
+
+async def start_workers():
+    """Arranca los workers y retoma los jobs que quedaron pendientes (o huérfanos) de una corrida anterior."""
+    global _queue, _workers
+    os.makedirs(INGEST_SPOOL_DIR, exist_ok=True)
+    _queue = asyncio.Queue()
+
+    stale = _now() - datetime.timedelta(seconds=INGEST_HEARTBEAT * 4)
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(models.IngestJob)
+            .where(models.IngestJob.status == "RUNNING",
+                   or_(models.IngestJob.heartbeat_at.is_(None), models.IngestJob.heartbeat_at < stale))
+            .values(status="PENDING")
+        )
+        await db.commit()
+        pending = (await db.execute(
+            select(models.IngestJob.id)
+            .where(models.IngestJob.status == "PENDING")
+            .order_by(models.IngestJob.created_at)
+        )).scalars().all()
+
+    for job_id in pending:
+        _enqueue(job_id)
+    if pending:
+        print(f"🔁 [JOBS] {len(pending)} jobs pendientes retomados")
+    _workers = [asyncio.create_task(_worker(n)) for n in range(INGEST_WORKERS)]
+
+
+async def stop_workers():
+    # Los jobs cortados a mitad vuelven a PENDING: el próximo arranque los retoma desde su última etapa hecha
+    interrupted = list(_running)
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    if interrupted:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(models.IngestJob)
+                .where(models.IngestJob.id.in_(interrupted), models.IngestJob.status == "RUNNING")
+                .values(status="PENDING")
+            )
+            await db.commit()
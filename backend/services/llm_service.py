@@ -31,4 +31,12 @@ def _extract_text(msg):
             if isinstance(part, dict) and "text" in part: return part["text"]
     return str(msg.content)
 
-llm = prompt | _model | _extract_text
\ No newline at end of file
+llm = prompt | _model | _extract_text
+
+# Versión en streaming (para /chat/stream): mismo prompt, pero emitimos los fragmentos a medida que llegan
+_stream_chain = prompt | _model
+
+async def astream_text(messages):
+    async for chunk in _stream_chain.astream({"messages": messages}):
+        text = _extract_text(chunk)
+        if text: yield text
@@ -0,0 +1,230 @@
+# Backend vectorial local en disco (VECTOR_BACKEND=local), para correr sin Pinecone ni red.
+# Los vectores (float32, normalizados) viven en un np.memmap: el SO pagina la matriz y el
+# proceso no necesita tenerla entera en RAM. ids, texto y metadata van en un SQLite al lado.
+# La búsqueda es exacta (producto punto por bloques sobre el memmap), no aproximada:
+# recall 1.0 y latencia lineal en la cantidad de vectores.
+import os
+import json
+import uuid
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from services.memory_vector_store import match_filter
+
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "vector_data"))
+SCAN_BLOCK_ROWS = 65536          # filas por bloque al recorrer el memmap
+INITIAL_CAPACITY = 1024
+
+_COLUMN_FIELDS = ("asset_id", "user_id")
+
+
+class LocalVectorStore(VectorStore):
+    """Índice exacto sobre un memmap + SQLite. Thread-safe (un RLock por instancia)."""
+
+    def __init__(self, directory: str, embedding, dim: int):
+        os.makedirs(directory, exist_ok=True)
+        self._embedding = embedding
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+
+        self._db = sqlite3.connect(os.path.join(directory, "meta.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE, asset_id TEXT, user_id TEXT, content TEXT, metadata TEXT, deleted INTEGER DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_vectors_asset_id ON vectors (asset_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_vectors_user_id ON vectors (user_id)")
+        self._db.commit()
+
+        self._count = self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+        self._alive = np.zeros(max(self._count, INITIAL_CAPACITY), dtype=bool)
+        for (row,) in self._db.execute("SELECT row FROM vectors WHERE deleted = 0"):
+            self._alive[row] = True
+        self._open_matrix(max(self._count, INITIAL_CAPACITY))
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self):
+        return int(self._alive[:self._count].sum())
+
+    def _open_matrix(self, capacity: int):
+        # El archivo crece por duplicación; el memmap se reabre con la nueva forma
+        needed = capacity * self.dim * 4
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < needed:
+                f.truncate(needed)
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        if len(self._alive) < capacity:
+            self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+
+    def _reserve(self, rows: int):
+        capacity = self._matrix.shape[0]
+        if self._count + rows <= capacity:
+            return
+        while capacity < self._count + rows:
+            capacity *= 2
+        self._matrix.flush()
+        del self._matrix
+        self._open_matrix(capacity)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def add_vectors(self, vectors, texts, metadatas=None, ids=None) -> list:
+        """Upsert de vectores ya calculados (un id existente se pisa en su misma fila)."""
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = [str(i) for i in ids] if ids else [uuid.uuid4().hex for _ in texts]
+        normalized = self._normalize(vectors)
+
+        with self._lock:
+            existing = {}
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                existing.update(self._db.execute(
+                    f"SELECT id, row FROM vectors WHERE id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+
+            self._reserve(len(ids))
+            records = []
+            for n, (vector_id, content, metadata) in enumerate(zip(ids, texts, metadatas)):
+                row = existing.get(vector_id)
+                if row is None:
+                    row = existing[vector_id] = self._count
+                    self._count += 1
+                self._matrix[row] = normalized[n]
+                self._alive[row] = True
+                records.append((row, vector_id, metadata.get("asset_id"), metadata.get("user_id"), content, json.dumps(metadata)))
+
+            self._matrix.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO vectors (row, id, asset_id, user_id, content, metadata, deleted) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                records,
+            )
+            self._db.commit()
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, batch_size: int = 64, **kwargs) -> list:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in texts]
+        for start in range(0, len(texts), batch_size):
+            batch = slice(start, start + batch_size)
+            self.add_vectors(self._embedding.embed_documents(texts[batch]), texts[batch], metadatas[batch], ids[batch])
+        return ids
+
+    def _candidate_rows(self, filter: dict):
+        """Filas vivas que cumplen el filtro (asset_id/user_id resueltos con índice en SQLite)."""
+        where, params, residual = ["deleted = 0"], [], {}
+        for key, condition in filter.items():
+            if key not in _COLUMN_FIELDS:
+                residual[key] = condition
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, expected in condition.items():
+                if op == "$eq":
+                    where.append(f"{key} = ?")
+                    params.append(str(expected))
+                elif op == "$in":
+                    values = [str(v) for v in expected]
+                    where.append(f"{key} IN ({','.join('?' * len(values))})" if values else "0")
+                    params += values
+                else:
+                    residual.setdefault(key, {})[op] = expected
+
+        if not residual:
+            # Filtro resuelto entero por los índices: no hace falta parsear la metadata
+            rows = self._db.execute(f"SELECT row FROM vectors WHERE {' AND '.join(where)}", params)
+            return np.fromiter((row for (row,) in rows), dtype=np.int64)
+        rows = self._db.execute(f"SELECT row, metadata FROM vectors WHERE {' AND '.join(where)}", params)
+        return np.fromiter(
+            (row for row, metadata in rows if match_filter(json.loads(metadata), residual)), dtype=np.int64
+        )
+
+    def delete(self, ids=None, filter: dict = None, **kwargs):
+        with self._lock:
+            rows = set()
+            if ids:
+                ids = [str(i) for i in ids]
+                for start in range(0, len(ids), 500):
+                    batch = ids[start:start + 500]
+                    rows.update(r for (r,) in self._db.execute(
+                        f"SELECT row FROM vectors WHERE id IN ({','.join('?' * len(batch))})", batch
+                    ))
+            if filter:
+                rows.update(int(r) for r in self._candidate_rows(filter))
+            if rows:
+                # Borrado lógico: la fila queda como hueco en el memmap
+                self._db.executemany("UPDATE vectors SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+                self._db.commit()
+                self._alive[list(rows)] = False
+        return True
+
+    def _top_k(self, scores: np.ndarray, rows: np.ndarray, k: int, best_scores, best_rows):
+        # Merge incremental del top-k entre bloques
+        scores = np.concatenate([best_scores, scores])
+        rows = np.concatenate([best_rows, rows])
+        if len(scores) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            scores, rows = scores[keep], rows[keep]
+        return scores, rows
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None):
+        query = self._normalize([embedding])[0]
+        best_scores, best_rows = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        with self._lock:
+            if filter:
+                candidates = self._candidate_rows(filter)
+                for start in range(0, len(candidates), SCAN_BLOCK_ROWS):
+                    block = candidates[start:start + SCAN_BLOCK_ROWS]
+                    best_scores, best_rows = self._top_k(self._matrix[block] @ query, block, k, best_scores, best_rows)
+            else:
+                for start in range(0, self._count, SCAN_BLOCK_ROWS):
+                    stop = min(start + SCAN_BLOCK_ROWS, self._count)
+                    scores = np.asarray(self._matrix[start:stop] @ query)
+                    alive = self._alive[start:stop]
+                    block = np.arange(start, stop)[alive]
+                    best_scores, best_rows = self._top_k(scores[alive], block, k, best_scores, best_rows)
+
+            order = np.argsort(-best_scores)
+            best_scores, best_rows = best_scores[order], best_rows[order]
+            if not len(best_rows):
+                return []
+            placeholders = ",".join("?" * len(best_rows))
+            found = {
+                row: (content, metadata)
+                for row, content, metadata in self._db.execute(
+                    f"SELECT row, content, metadata FROM vectors WHERE row IN ({placeholders})", [int(r) for r in best_rows]
+                )
+            }
+        return [
+            (Document(page_content=found[int(row)][0], metadata=json.loads(found[int(row)][1])), float(score))
+            for row, score in zip(best_rows, best_scores)
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory: str = LOCAL_VECTOR_DIR, dim: int = 768, **kwargs):
+        store = cls(directory, embedding, dim)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,166 @@
+# Stand-in local del índice de Pinecone (VECTOR_BACKEND=memory).
+# Mismo contrato que PineconeVectorStore para lo que usan los servicios: add_texts con ids,
+# búsqueda con filtros de metadata estilo Pinecone ($eq, $ne, $in, $nin, $and, $or) y
+# borrado por ids o por filtro. Búsqueda exacta por coseno con numpy: sirve para tests y
+# benchmarks offline, no para producción.
+import uuid
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+
+def _match_condition(value, condition) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, expected in condition.items():
+        if op == "$eq" and value != expected:
+            return False
+        if op == "$ne" and value == expected:
+            return False
+        if op == "$in" and value not in expected:
+            return False
+        if op == "$nin" and value in expected:
+            return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            if op == "$gt" and not value > expected: return False
+            if op == "$gte" and not value >= expected: return False
+            if op == "$lt" and not value < expected: return False
+            if op == "$lte" and not value <= expected: return False
+    return True
+
+
+def match_filter(metadata: dict, filter: dict) -> bool:
+    """Evalúa un filtro de metadata con la sintaxis de Pinecone."""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(match_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match_filter(metadata, sub) for sub in condition):
+                return False
+        elif not _match_condition(metadata.get(key), condition):
+            return False
+    return True
+
+
+class MemoryVectorStore(VectorStore):
+    """Índice vectorial en memoria, thread-safe (un lock para escrituras y lecturas)."""
+
+    def __init__(self, embedding):
+        self._embedding = embedding
+        self._lock = threading.Lock()
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._positions = {}   # id -> fila de la matriz
+        self._matrix = None    # vectores normalizados (n, dim) float32
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self):
+        return len(self._ids)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def add_vectors(self, vectors, texts, metadatas=None, ids=None) -> list:
+        """Upsert de vectores ya calculados (los ids repetidos se pisan)."""
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = [str(i) for i in ids] if ids else [uuid.uuid4().hex for _ in texts]
+        normalized = self._normalize(vectors)
+
+        # Si un id se repite dentro del mismo lote, gana la última aparición (como en Pinecone)
+        last_row = {vector_id: row for row, vector_id in enumerate(ids)}
+
+        with self._lock:
+            new_rows = []
+            for vector_id, row in last_row.items():
+                position = self._positions.get(vector_id)
+                if position is not None:
+                    self._texts[position], self._metadatas[position] = texts[row], dict(metadatas[row])
+                    self._matrix[position] = normalized[row]
+                else:
+                    self._positions[vector_id] = len(self._ids)
+                    new_rows.append(row)
+                    self._ids.append(vector_id)
+                    self._texts.append(texts[row])
+                    self._metadatas.append(dict(metadatas[row]))
+            if new_rows:
+                block = normalized[new_rows]
+                self._matrix = block if self._matrix is None else np.vstack([self._matrix, block])
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, batch_size: int = 64, **kwargs) -> list:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else None
+        ids = list(ids) if ids is not None else None
+        added = []
+        # Mismo batching que el upsert a Pinecone: un embed_documents por lote
+        for start in range(0, len(texts), batch_size):
+            batch = slice(start, start + batch_size)
+            vectors = self._embedding.embed_documents(texts[batch])
+            added += self.add_vectors(
+                vectors, texts[batch],
+                metadatas[batch] if metadatas else None,
+                ids[batch] if ids else None,
+            )
+        return added
+
+    def delete(self, ids=None, filter: dict = None, **kwargs):
+        with self._lock:
+            drop = set(str(i) for i in ids or [])
+            if filter:
+                drop |= {vid for vid, metadata in zip(self._ids, self._metadatas) if match_filter(metadata, filter)}
+            if not drop:
+                return True
+            keep = [n for n, vid in enumerate(self._ids) if vid not in drop]
+            self._ids = [self._ids[n] for n in keep]
+            self._texts = [self._texts[n] for n in keep]
+            self._metadatas = [self._metadatas[n] for n in keep]
+            self._matrix = self._matrix[keep] if keep else None
+            self._positions = {vid: n for n, vid in enumerate(self._ids)}
+        return True
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None):
+        query = self._normalize([embedding])[0]
+        with self._lock:
+            if self._matrix is None:
+                return []
+            scores = self._matrix @ query
+            if filter:
+                mask = np.fromiter((match_filter(m, filter) for m in self._metadatas), dtype=bool, count=len(self._ids))
+                scores = np.where(mask, scores, -np.inf)
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (Document(page_content=self._texts[n], metadata=dict(self._metadatas[n])), float(scores[n]))
+                for n in top if np.isfinite(scores[n])
+            ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,9 @@
+# Parsers de archivos subidos. Corren en el pool de procesos (executor_service.run_cpu),
+# por eso son funciones de módulo que reciben bytes y devuelven objetos picklables.
+import io
+import pandas as pd
+
+
+def parse_excel_bytes(content: bytes) -> pd.DataFrame:
+    return pd.read_excel(io.BytesIO(content))
+
@@ -0,0 +1,211 @@
+# Backend vectorial sobre el Postgres propio (VECTOR_BACKEND=pgvector).
+# Tabla vector_chunks con índice HNSW (distancia coseno) + columnas indexadas para los
+# filtros frecuentes (asset_id, user_id); el resto de la metadata queda en JSONB.
+# Acepta los mismos filtros estilo Pinecone que usan los servicios ($eq, $in, $and...).
+import os
+import re
+import json
+import threading
+from sqlalchemy import text
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+PGVECTOR_TABLE = os.getenv("PGVECTOR_TABLE", "vector_chunks")
+PGVECTOR_EF_SEARCH = int(os.getenv("PGVECTOR_EF_SEARCH", "64"))   # recall vs latencia de la búsqueda HNSW
+# pgvector >= 0.8: sigue recorriendo el grafo si el filtro descarta candidatos (evita devolver < k).
+# En versiones anteriores el parámetro no existe (y en PG15+ el prefijo hnsw. está reservado): no se envía
+PGVECTOR_ITERATIVE_SCAN = os.getenv("PGVECTOR_ITERATIVE_SCAN", "relaxed_order")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+
+_COLUMN_FIELDS = ("asset_id", "user_id")   # con columna e índice btree propios
+_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_]+$")
+_COMPARISONS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _version_tuple(version) -> tuple:
+    # "0.8.0" -> (0, 8, 0); una versión ilegible cuenta como la más vieja
+    try:
+        return tuple(int(part) for part in str(version).split("."))
+    except ValueError:
+        return (0,)
+
+
+def _vector_literal(vector) -> str:
+    return "[" + ",".join(f"{float(x):.7g}" for x in vector) + "]"
+
+
+def _text_value(value) -> str:
+    # ->> devuelve texto: los booleanos quedan como 'true'/'false'
+    return json.dumps(value) if isinstance(value, bool) else str(value)
+
+
+def _condition_sql(key: str, condition, params: dict) -> str:
+    if not _KEY_PATTERN.match(key):
+        raise ValueError(f"Clave de metadata inválida en el filtro: {key}")
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+
+    clauses = []
+    for op, expected in condition.items():
+        name = f"f{len(params)}"
+        column = key if key in _COLUMN_FIELDS else f"(metadata->>'{key}')"
+        if op in _COMPARISONS:
+            clauses.append(f"{column}::numeric {_COMPARISONS[op]} :{name}")
+            params[name] = expected
+        elif op == "$eq":
+            clauses.append(f"{column} = :{name}")
+            params[name] = _text_value(expected)
+        elif op == "$ne":
+            clauses.append(f"{column} IS DISTINCT FROM :{name}")
+            params[name] = _text_value(expected)
+        elif op == "$in":
+            clauses.append(f"{column} = ANY(:{name})")
+            params[name] = [_text_value(v) for v in expected]
+        elif op == "$nin":
+            clauses.append(f"NOT ({column} = ANY(:{name}))")
+            params[name] = [_text_value(v) for v in expected]
+        else:
+            raise ValueError(f"Operador de filtro no soportado: {op}")
+    return " AND ".join(clauses)
+
+
+def filter_to_sql(filter: dict, params: dict) -> str:
+    """Traduce un filtro estilo Pinecone a un WHERE parametrizado."""
+    clauses = []
+    for key, condition in (filter or {}).items():
+        if key in ("$and", "$or"):
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(f"({filter_to_sql(sub, params)})" for sub in condition) + ")")
+        else:
+            clauses.append(_condition_sql(key, condition, params))
+    return " AND ".join(clauses) or "TRUE"
+
+
+class PgVectorStore(VectorStore):
+    """Vector store sobre pgvector usando el engine síncrono de la app (corre en el pool de I/O)."""
+
+    def __init__(self, engine, embedding, dim: int, table: str = PGVECTOR_TABLE):
+        if not _KEY_PATTERN.match(table):
+            raise ValueError(f"Nombre de tabla inválido: {table}")
+        self._engine = engine
+        self._embedding = embedding
+        self.dim = dim
+        self.table = table
+        self._ready = False
+        self._iterative_scan = None  # se decide en _ensure_schema según la versión instalada
+        self._init_lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def _ensure_schema(self):
+        # Una vez por proceso: extensión, tabla e índices (idempotente)
+        if self._ready:
+            return
+        with self._init_lock:
+            if self._ready:
+                return
+            t = self.table
+            with self._engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {t} ("
+                    f"id TEXT PRIMARY KEY, asset_id TEXT, user_id TEXT, content TEXT, "
+                    f"metadata JSONB, embedding vector({self.dim}))"
+                ))
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{t}_asset_id ON {t} (asset_id)"))
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{t}_user_id ON {t} (user_id)"))
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{t}_embedding ON {t} USING hnsw (embedding vector_cosine_ops) "
+                    f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+                ))
+                version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+            if PGVECTOR_ITERATIVE_SCAN and _version_tuple(version) >= (0, 8):
+                self._iterative_scan = PGVECTOR_ITERATIVE_SCAN
+            elif PGVECTOR_ITERATIVE_SCAN:
+                print(f"⚠️ [PGVECTOR] pgvector {version} no soporta hnsw.iterative_scan: se omite")
+            self._ready = True
+
+    def add_vectors(self, vectors, texts, metadatas=None, ids=None) -> list:
+        """Upsert (INSERT ... ON CONFLICT) de vectores ya calculados."""
+        self._ensure_schema()
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = [str(i) for i in ids]
+        rows = [
+            {
+                "id": vector_id,
+                "asset_id": metadata.get("asset_id"),
+                "user_id": metadata.get("user_id"),
+                "content": content,
+                "metadata": json.dumps(metadata),
+                "embedding": _vector_literal(vector),
+            }
+            for vector_id, content, metadata, vector in zip(ids, texts, metadatas, vectors)
+        ]
+        with self._engine.begin() as conn:
+            conn.execute(text(
+                f"INSERT INTO {self.table} (id, asset_id, user_id, content, metadata, embedding) "
+                f"VALUES (:id, :asset_id, :user_id, :content, CAST(:metadata AS JSONB), CAST(:embedding AS vector)) "
+                f"ON CONFLICT (id) DO UPDATE SET asset_id = EXCLUDED.asset_id, user_id = EXCLUDED.user_id, "
+                f"content = EXCLUDED.content, metadata = EXCLUDED.metadata, embedding = EXCLUDED.embedding"
+            ), rows)
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, batch_size: int = 64, **kwargs) -> list:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [os.urandom(16).hex() for _ in texts]
+        for start in range(0, len(texts), batch_size):
+            batch = slice(start, start + batch_size)
+            vectors = self._embedding.embed_documents(texts[batch])
+            self.add_vectors(vectors, texts[batch], metadatas[batch], ids[batch])
+        return ids
+
+    def delete(self, ids=None, filter: dict = None, **kwargs):
+        self._ensure_schema()
+        params = {}
+        clauses = []
+        if ids:
+            clauses.append("id = ANY(:ids)")
+            params["ids"] = [str(i) for i in ids]
+        if filter:
+            clauses.append(filter_to_sql(filter, params))
+        if not clauses:
+            return True
+        with self._engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {self.table} WHERE " + " OR ".join(f"({c})" for c in clauses)), params)
+        return True
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None):
+        self._ensure_schema()
+        params = {"query": _vector_literal(embedding), "k": k}
+        where = filter_to_sql(filter, params)
+        with self._engine.begin() as conn:
+            # SET LOCAL: solo vale para esta transacción (no contamina la conexión del pool)
+            conn.execute(text(f"SET LOCAL hnsw.ef_search = {max(PGVECTOR_EF_SEARCH, k)}"))
+            if self._iterative_scan:
+                conn.execute(text(f"SET LOCAL hnsw.iterative_scan = {self._iterative_scan}"))
+            rows = conn.execute(text(
+                f"SELECT content, metadata, 1 - (embedding <=> CAST(:query AS vector)) AS score "
+                f"FROM {self.table} WHERE {where} "
+                f"ORDER BY embedding <=> CAST(:query AS vector) LIMIT :k"
+            ), params).all()
+        return [(Document(page_content=row.content, metadata=row.metadata or {}), float(row.score)) for row in rows]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, engine=None, dim: int = 768, **kwargs):
+        store = cls(engine, embedding, dim)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -1,58 +1,187 @@
 import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain_core.documents import Document
+import threading
+from services.executor_service import run_io
+from services.embedding_service import get_embeddings, EMBED_DIM
 # ELIMINADO: from operator import index (Esto causaba conflicto con la lógica de Pinecone)
 
 # Configuración
 PINE_API_KEY = os.getenv("PINECONE_API_KEY")
 INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 
-# Embeddings
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+# "pinecone" (hosted) | "pgvector" (Postgres propio, HNSW) | "local" (memmap en disco) | "memory" (tests/benchmarks)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "8"))  # conexiones HTTP reutilizadas por el cliente
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))  # chunks por llamada a embed_documents / upsert
+DELETE_BATCH_SIZE = 1000  # máximo de ids por delete en Pinecone
 
-async def upsert_asset_vector(asset_id: str, text: str, metadata: dict = None):
+# --- CLIENTE COMPARTIDO ---
+# Un solo vector store por proceso: el describe del índice y el pool de conexiones
+# se pagan una vez, no en cada upsert/búsqueda.
+_store = None
+_store_lock = threading.Lock()
+
+
+def _build_store():
+    # Embeddings con caché (services/embedding_service): re-indexar el mismo texto no vuelve a llamar a Gemini
+    embeddings = get_embeddings()
+    if VECTOR_BACKEND == "memory":
+        from services.memory_vector_store import MemoryVectorStore
+        print("🧪 Vector store en memoria (VECTOR_BACKEND=memory)")
+        return MemoryVectorStore(embeddings)
+    if VECTOR_BACKEND == "pgvector":
+        from database import engine
+        from services.pgvector_store import PgVectorStore
+        print("🐘 Vector store en Postgres (pgvector, HNSW)")
+        return PgVectorStore(engine, embeddings, EMBED_DIM)
+    if VECTOR_BACKEND == "local":
+        from services.local_vector_store import LocalVectorStore, LOCAL_VECTOR_DIR
+        print(f"💾 Vector store local en disco ({LOCAL_VECTOR_DIR})")
+        return LocalVectorStore(LOCAL_VECTOR_DIR, embeddings, EMBED_DIM)
+    if VECTOR_BACKEND != "pinecone":
+        raise ValueError(f"VECTOR_BACKEND desconocido: {VECTOR_BACKEND}")
+
+    from pinecone import Pinecone
+    from langchain_pinecone import PineconeVectorStore
+    client = Pinecone(api_key=PINE_API_KEY, pool_threads=PINECONE_POOL_THREADS)
+    index = client.Index(INDEX_NAME, pool_threads=PINECONE_POOL_THREADS)
+    print(f"🔌 Cliente Pinecone inicializado (índice '{INDEX_NAME}')")
+    return PineconeVectorStore(index=index, embedding=embeddings)
+
+
+def get_vector_store():
+    """Vector store compartido: se crea perezosamente la primera vez y es seguro entre hilos."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _build_store()
+    return _store
+
+
+def set_vector_store(store):
+    """Reemplaza el store compartido (tests/benchmarks con un índice propio)."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+# --- HELPERS POR LOTES (sync: corren en el pool de I/O) ---
+
+def upsert_texts(texts, metadatas, ids, batch_size: int = EMBED_BATCH_SIZE) -> int:
+    """Un embed_documents + un upsert por lote."""
+    if not texts:
+        return 0
+    get_vector_store().add_texts(texts, metadatas=metadatas, ids=ids, batch_size=batch_size, embedding_chunk_size=batch_size)
+    return len(texts)
+
+
+def delete_by_ids(ids, batch_size: int = DELETE_BATCH_SIZE):
+    store = get_vector_store()
+    ids = [str(i) for i in ids]
+    for start in range(0, len(ids), batch_size):
+        store.delete(ids=ids[start:start + batch_size])
+
+
+def search(query: str, k: int = 5, filter: dict = None):
+    return get_vector_store().similarity_search_with_score(query, k=k, filter=filter)
+
+
+def delete_by_filter(filter: dict):
+    # Pinecone requiere que el filtro coincida exactamente con la metadata guardada
+    get_vector_store().delete(filter=filter)
+
+
+def _tag(metadata: dict, asset_id, user_id: str = None, source_type: str = None) -> dict:
+    # asset_id para el borrado; user_id y source_type para filtrar por tenant/tipo en la búsqueda
+    tagged = {**(metadata or {}), "asset_id": str(asset_id)}
+    if user_id:
+        tagged["user_id"] = str(user_id)
+    if source_type:
+        tagged["source_type"] = source_type
+    return tagged
+
+
+async def upsert_asset_vector(asset_id: str, text: str, metadata: dict = None, user_id: str = None, source_type: str = None):
     """
     Sube el texto vectorizado a Pinecone.
     """
     try:
-        if metadata is None:
-            metadata = {}
-            
-        # Aseguramos que el asset_id esté en la metadata para el borrado posterior
-        metadata["asset_id"] = str(asset_id)
-        
-        doc = Document(page_content=text, metadata=metadata)
-        
-        # Conectamos al índice
-        vectorstore = PineconeVectorStore.from_existing_index(
-            index_name=INDEX_NAME,
-            embedding=embeddings
-        )
-        
-        # Subimos el documento
-        vectorstore.add_documents([doc])
-        
+        metadata = _tag(metadata, asset_id, user_id, source_type)
+
+        # Subimos el documento (embedding + upsert son bloqueantes).
+        # ID = asset_id: re-vectorizar el mismo asset pisa el vector en vez de duplicarlo
+        await run_io(upsert_texts, [text], [metadata], [str(asset_id)])
+
         print(f"✅ Asset {asset_id} vectorizado en Pinecone.")
         return True
-        
+
     except Exception as e:
         print(f"❌ Error Pinecone Upsert: {e}")
         return False
 
+def _upsert_chunks_sync(asset_id: str, chunks, metadata: dict, batch_size: int) -> int:
+    texts, metadatas, ids = [], [], []
+    total = 0
+
+    for chunk in chunks:
+        chunk_metadata = {**metadata, "asset_id": str(asset_id), "chunk": chunk["chunk"]}
+        if chunk.get("page") is not None:
+            chunk_metadata["page"] = chunk["page"]
+        texts.append(chunk["text"])
+        metadatas.append(chunk_metadata)
+        # IDs deterministas: re-subir el mismo archivo pisa los vectores en vez de duplicarlos
+        ids.append(f"{asset_id}-{chunk['chunk']}")
+        if len(texts) >= batch_size:
+            total += upsert_texts(texts, metadatas, ids, batch_size)
+            texts, metadatas, ids = [], [], []
+    total += upsert_texts(texts, metadatas, ids, batch_size)
+    return total
+
+async def upsert_asset_chunks(asset_id: str, chunks, metadata: dict = None, batch_size: int = EMBED_BATCH_SIZE,
+                              user_id: str = None, source_type: str = None) -> int:
+    """
+    Indexa un documento troceado. chunks es un iterable perezoso de {"text", "chunk", "page"}:
+    se consume en el pool de I/O por lotes, sin cargar el documento entero en memoria.
+    Devuelve la cantidad de chunks indexados (0 si falló).
+    """
+    try:
+        metadata = _tag(metadata, asset_id, user_id, source_type)
+        total = await run_io(_upsert_chunks_sync, asset_id, chunks, metadata, batch_size)
+        print(f"✅ Asset {asset_id} vectorizado en Pinecone ({total} chunks).")
+        return total
+    except Exception as e:
+        print(f"❌ Error Pinecone Upsert (chunks): {e}")
+        return 0
+
 async def delete_vectors_by_asset_id(asset_id: str):
     """
     Borra quirúrgicamente usando el filtro por asset_id.
     """
+    return await delete_vectors_by_asset_ids([asset_id])
+
+async def delete_vectors_by_asset_ids(asset_ids):
+    """
+    Borra los vectores de varios assets con un único delete ($in sobre asset_id).
+    """
+    asset_ids = [str(a) for a in asset_ids]
+    if not asset_ids:
+        return True
     try:
-        vectorstore = PineconeVectorStore.from_existing_index(
-            index_name=INDEX_NAME,
-            embedding=embeddings
-        )
-        # Pinecone requiere que el filtro coincida exactamente con la metadata guardada
-        vectorstore.delete(filter={"asset_id": {"$eq": str(asset_id)}})
-        print(f"✅ Vectores con asset_id {asset_id} eliminados de Pinecone.")
+        await run_io(delete_by_filter, {"asset_id": {"$in": asset_ids}})
+        print(f"✅ Vectores de {len(asset_ids)} asset(s) eliminados de Pinecone.")
         return True
     except Exception as e:
         print(f"❌ Error en Pinecone al borrar por asset_id: {e}")
-        return False
\ No newline at end of file
+        return False
+
+async def similarity_search(query: str, k: int = 5, filter: dict = None):
+    """Búsqueda top-k sobre el store compartido. Devuelve [Document]."""
+    hits = await run_io(search, query, k, filter)
+    return [doc for doc, _ in hits]
+
+async def search_assets(query: str, k: int = 5, filter: dict = None):
+    """
+    Búsqueda top-k en Pinecone. Devuelve [(metadata, score)] ordenado por score descendente.
+    """
+    hits = await run_io(search, query, k, filter)
+    return [(doc.metadata, float(score)) for doc, score in hits]
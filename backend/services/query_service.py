@@ -0,0 +1,189 @@
+# Ejecución acotada del SQL generado por el agente.
+# - LIMIT inyectado: la consulta se envuelve en SELECT * FROM (...) LIMIT max+1, así la DB corta
+#   antes de mandar la tabla entera (la fila extra solo sirve para saber si hubo recorte).
+#   Si la consulta ya termina en LIMIT no se envuelve, y en MySQL un JOIN con columnas repetidas
+#   (ER_DUP_FIELDNAME al envolver) se reintenta sin envolver, con el LIMIT agregado al final
+#   (cerrar un cursor sin buffer de pymysql lee el resto del resultado: fetchmany no alcanza).
+# - Cursor del lado del servidor (stream_results) leído por lotes con fetchmany, con tope de filas
+#   y de bytes aproximados: un SELECT * sobre una tabla grande no llena la memoria del worker.
+# - Timeout por dialecto: SET LOCAL statement_timeout (Postgres), hint MAX_EXECUTION_TIME (MySQL).
+# - Solo lectura: se rechaza todo lo que no sea SELECT/WITH y la consulta corre en una
+#   transacción READ ONLY que siempre termina en rollback (el SQL viene del LLM o de un widget).
+# - Cada lote se procesa por columnas (Decimal -> float solo en las columnas que lo necesitan).
+# El resultado queda en formato columnar; to_records lo pasa al formato por filas de siempre y
+# to_columnar / to_arrow_ipc lo exponen tal cual (opt-in, ?format=columnar|arrow).
+import io
+import os
+import re
+import datetime
+import itertools
+from decimal import Decimal
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "5000"))
+SQL_MAX_BYTES = int(os.getenv("SQL_MAX_BYTES", str(8 * 1024 * 1024)))   # ~tamaño de los valores, no del JSON final
+SQL_FETCH_BATCH = int(os.getenv("SQL_FETCH_BATCH", "1000"))
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "30000"))
+SQL_PROMPT_ROWS = int(os.getenv("SQL_PROMPT_ROWS", "50"))   # filas que ve el LLM al resumir
+
+RESULT_FORMATS = ("rows", "columnar")
+
+_READ_ONLY = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+_LEADING_SELECT = re.compile(r"^\s*select\b", re.IGNORECASE)
+_TRAILING_LIMIT = re.compile(r"\blimit\s+(\d+|:\w+)(\s*(,|offset)\s*(\d+|:\w+))?\s*$", re.IGNORECASE)
+_MYSQL_DUP_FIELDNAME = 1060
+
+
+def _timeout_hint(sql: str, dialect: str) -> str:
+    # MySQL: el hint va justo después del primer SELECT (un WITH queda sin hint)
+    if dialect == "mysql" and SQL_STATEMENT_TIMEOUT_MS:
+        return _LEADING_SELECT.sub(lambda m: f"{m.group(0)} /*+ MAX_EXECUTION_TIME({SQL_STATEMENT_TIMEOUT_MS}) */", sql, count=1)
+    return sql
+
+
+def bounded_sql(sql: str, dialect: str, limit: int, wrap: bool = True) -> str:
+    """Envuelve un SELECT/WITH con un LIMIT externo (y el hint de timeout en MySQL)."""
+    sql = sql.strip().rstrip(";").strip()
+    if _TRAILING_LIMIT.search(sql):
+        return _timeout_hint(sql, dialect)
+    if not wrap:
+        return _timeout_hint(f"{sql}\nLIMIT {int(limit) + 1}", dialect)
+    return _timeout_hint(f"SELECT * FROM (\n{sql}\n) AS bounded_result LIMIT {int(limit) + 1}", dialect)
+
+
+def _is_duplicate_column(error: DBAPIError) -> bool:
+    args = getattr(error.orig, "args", None)
+    return bool(args) and args[0] == _MYSQL_DUP_FIELDNAME
+
+
+def _column_bytes(column: tuple) -> int:
+    sample = next((v for v in column if v is not None), None)
+    if isinstance(sample, (str, bytes)):
+        return sum(len(v) for v in column if v is not None)
+    return 8 * len(column)
+
+
+def _convert_column(column: tuple) -> list:
+    if any(isinstance(v, Decimal) for v in column):
+        return [float(v) if isinstance(v, Decimal) else v for v in column]
+    return list(column)
+
+
+def execute_bounded(engine, sql: str, params: dict = None, max_rows: int = SQL_MAX_ROWS,
+                    max_bytes: int = SQL_MAX_BYTES) -> dict:
+    """
+    Ejecuta (sync: corre en el pool de I/O) y devuelve
+    {"columns": [...], "data": [[col0...], [col1...]], "row_count", "truncated"}.
+    """
+    if not _READ_ONLY.match(sql):
+        raise ValueError("Solo se permiten consultas de lectura (SELECT / WITH)")
+    dialect = engine.dialect.name
+    columns, data = [], None
+    row_count, size, truncated = 0, 0, False
+
+    with engine.connect() as conn:
+        try:
+            # MySQL: vale para la transacción que abre la consulta; Postgres: para la ya iniciada
+            if dialect in ("postgresql", "mysql"):
+                conn.execute(text("SET TRANSACTION READ ONLY"))
+            if dialect == "postgresql" and SQL_STATEMENT_TIMEOUT_MS:
+                # SET LOCAL: vale solo para esta transacción (no queda en la conexión del pool)
+                conn.execute(text(f"SET LOCAL statement_timeout = {SQL_STATEMENT_TIMEOUT_MS}"))
+            streaming = conn.execution_options(stream_results=True, max_row_buffer=SQL_FETCH_BATCH)
+            try:
+                result = streaming.execute(text(bounded_sql(sql, dialect, max_rows)), params or {})
+            except DBAPIError as e:
+                if dialect != "mysql" or not _is_duplicate_column(e):
+                    raise
+                result = streaming.execute(text(bounded_sql(sql, dialect, max_rows, wrap=False)), params or {})
+            columns = list(result.keys())
+            data = [[] for _ in columns]
+            while True:
+                batch = result.fetchmany(SQL_FETCH_BATCH)
+                if not batch:
+                    break
+                if row_count + len(batch) > max_rows:
+                    batch = batch[:max_rows - row_count]
+                    truncated = True
+                if batch:
+                    for n, column in enumerate(zip(*batch)):
+                        size += _column_bytes(column)
+                        data[n].extend(_convert_column(column))
+                    row_count += len(batch)
+                if size > max_bytes:
+                    truncated = True
+                if truncated:
+                    break
+            result.close()
+        finally:
+            # Nunca se confirma nada: si la consulta escondía una escritura, se descarta
+            conn.rollback()
+
+    return {"columns": columns, "data": data, "row_count": row_count, "truncated": truncated}
+
+
+def to_records(execution: dict) -> list:
+    """Formato por filas ([{columna: valor}]) que usan el frontend y los widgets."""
+    columns = execution["columns"]
+    return [dict(zip(columns, row)) for row in zip(*execution["data"])]
+
+
+def _value_type(column: list) -> str:
+    sample = next((v for v in column if v is not None), None)
+    if sample is None:
+        return "null"
+    if isinstance(sample, bool):
+        return "boolean"
+    if isinstance(sample, (int, float, Decimal)):
+        return "number"
+    if isinstance(sample, (datetime.date, datetime.time)):
+        return "datetime"
+    return "string"
+
+
+def to_columnar(execution: dict) -> dict:
+    """Nombres de columna una sola vez + un array de valores por columna, con su tipo."""
+    return {
+        "columns": execution["columns"],
+        "types": [_value_type(column) for column in execution["data"]],
+        "data": execution["data"],
+        "row_count": execution["row_count"],
+    }
+
+
+def records_to_columnar(records: list, columns: list = None) -> dict:
+    """Columnar a partir de filas ya armadas (p. ej. los puntos normalizados de un gráfico)."""
+    columns = columns or (list(records[0].keys()) if records else [])
+    data = [[row.get(column) for row in records] for column in columns]
+    return to_columnar({"columns": columns, "data": data, "row_count": len(records)})
+
+
+def format_result(execution: dict, result_format: str = "rows"):
+    return to_columnar(execution) if result_format == "columnar" else to_records(execution)
+
+
+def to_arrow_ipc(execution: dict) -> bytes:
+    """Stream Arrow IPC del resultado. pyarrow es opcional: ImportError si no está instalado."""
+    import pyarrow as pa
+    table = pa.table({name: column for name, column in zip(execution["columns"], execution["data"])})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def rows_for_prompt(sql_res: dict, limit: int = SQL_PROMPT_ROWS) -> str:
+    """Muestra acotada del resultado para el prompt del resumen, avisando si hubo recorte."""
+    result = sql_res.get("result") or []
+    if isinstance(result, dict):  # formato columnar
+        total = result["row_count"]
+        rows = [dict(zip(result["columns"], row)) for row in itertools.islice(zip(*result["data"]), limit)]
+    else:
+        total, rows = len(result), result[:limit]
+    notes = []
+    if total > limit:
+        notes.append(f"se muestran {limit} de {total} filas")
+    if sql_res.get("truncated"):
+        notes.append(f"el resultado fue recortado a {total} filas; puede haber más en la base")
+    return str(rows) + (f" ({'; '.join(notes)})" if notes else "")
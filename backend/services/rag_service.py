@@ -1,16 +1,26 @@
 import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_pinecone import PineconeVectorStore
+import asyncio
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.documents import Document
+from services.pinecone_service import similarity_search
+from services.sql_service import get_datasources_with_metadata
+from services.bm25_service import search_chunks, tokenize
+from services.executor_service import run_io
+from services.answer_cache_service import answer_key, get_answer, store_answer
 
 # Configuración
-PINE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 MODEL_NAME = os.getenv("MODEL_SMART", "gemini-1.5-pro-001")
-
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+# Recuperación híbrida: candidatos de cada lado antes de fusionar y reordenar
+RAG_DENSE_K = int(os.getenv("RAG_DENSE_K", "20"))
+RAG_SPARSE_K = int(os.getenv("RAG_SPARSE_K", "20"))
+RRF_K = 60                       # constante estándar de Reciprocal Rank Fusion
+RERANK_WEIGHT = float(os.getenv("RERANK_WEIGHT", "0.05"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "3000"))   # presupuesto del contexto (~4 chars por token)
+MIN_TRUNCATED_TOKENS = 100
 
 llm = ChatGoogleGenerativeAI(
     model=MODEL_NAME,
@@ -18,38 +28,7 @@ llm = ChatGoogleGenerativeAI(
     google_api_key=GOOGLE_API_KEY
 )
 
-async def run_rag_agent(question: str):
-    """
-    Busca contexto en Pinecone con DEBUGGING EXTREMO.
-    """
-    try:
-        print(f"🔍 [RAG] Iniciando búsqueda para: '{question}'")
-        
-        # 1. Conexión a Pinecone
-        vectorstore = PineconeVectorStore.from_existing_index(
-            index_name=INDEX_NAME,
-            embedding=embeddings
-        )
-        
-        # 2. BÚSQUEDA EXPLÍCITA (Para ver qué trae)
-        # k=5 para traer más contexto por si acaso
-        docs = vectorstore.similarity_search(question, k=5)
-        
-        print(f"📄 [DEBUG RAG] Encontré {len(docs)} fragmentos relevantes.")
-        
-        # SI NO ENCUENTRA NADA, ALERTA
-        if not docs:
-            return {"result": "Error: No se encontraron documentos en la base de datos vectorial.", "source_documents": []}
-
-        # IMPRIMIR LO QUE ENCONTRÓ (Esto saldrá en tu terminal)
-        context_text = ""
-        for i, doc in enumerate(docs):
-            clean_content = doc.page_content.replace("\n", " ")[:150] # Primeros 150 chars
-            print(f"   👉 Fragmento {i+1}: {clean_content}...")
-            context_text += f"\n\n---\n{doc.page_content}"
-
-        # 3. Prompt Manual
-        template = """
+RAG_TEMPLATE = """
         Eres un asistente inteligente. Usa los siguientes fragmentos de contexto recuperados para contestar la pregunta del usuario.
         
         CONTEXTO RECUPERADO:
@@ -60,19 +39,180 @@ async def run_rag_agent(question: str):
         REGLAS:
         1. Si la respuesta está en el contexto, responde directamente.
         2. Si el contexto no tiene la respuesta, di "No encuentro esa información en los documentos disponibles".
-        3. Cita el documento si es posible.
+        3. Cita el documento si es posible (archivo y página indicados entre corchetes en cada fragmento).
         
         RESPUESTA:
         """
+
+rag_chain = ChatPromptTemplate.from_template(RAG_TEMPLATE) | llm | StrOutputParser()
+
+NO_DOCS_MESSAGE = "Error: No se encontraron documentos en la base de datos vectorial."
+
+def _citation(metadata: dict) -> str:
+    # Referencia que el LLM puede citar: archivo, página (si es PDF) y número de fragmento
+    parts = [metadata.get("filename", "Documento")]
+    if metadata.get("page") is not None:
+        parts.append(f"pág. {int(metadata['page'])}")
+    if metadata.get("chunk") is not None:
+        parts.append(f"fragmento {int(metadata['chunk']) + 1}")
+    return " | ".join(parts)
+
+def tenant_filter(user_id: str = None, asset_id: str = None) -> dict:
+    """Filtro de metadata que se empuja al índice: solo vectores del usuario (y del asset, si se pide)."""
+    filter = {}
+    if user_id:
+        filter["user_id"] = {"$eq": str(user_id)}
+    if asset_id:
+        filter["asset_id"] = {"$eq": str(asset_id)}
+    return filter or None
+
+async def _legacy_filter(user_id: str):
+    # Vectores subidos antes de etiquetar user_id: los ubicamos por los asset_id del inventario del usuario
+    sources = await get_datasources_with_metadata(user_id)
+    asset_ids = [s["asset_id"] for s in sources if s["asset_id"] and s["is_indexed"]]
+    return {"asset_id": {"$in": asset_ids}} if asset_ids else None
+
+def _doc_key(doc: Document):
+    return (str(doc.metadata.get("asset_id")), doc.metadata.get("chunk"))
+
+def _rrf(rankings: list) -> list:
+    """Reciprocal Rank Fusion: suma 1/(RRF_K + rank) de cada lista. Devuelve [(doc, score)]."""
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            docs.setdefault(key, doc)
+    return sorted(((docs[key], score) for key, score in scores.items()), key=lambda item: item[1], reverse=True)
+
+def _rerank(question: str, fused: list) -> list:
+    """
+    Reordenamiento barato por solapamiento léxico con la pregunta. Los tokens con dígitos
+    (códigos, cláusulas, SKUs) pesan doble: son los que la búsqueda semántica suele errar.
+    """
+    query_tokens = set(tokenize(question))
+    if not query_tokens:
+        return [doc for doc, _ in fused]
+    weights = {t: 2.0 if any(c.isdigit() for c in t) else 1.0 for t in query_tokens}
+    total = sum(weights.values())
+
+    def score(item):
+        doc, rrf_score = item
+        doc_tokens = set(tokenize(doc.page_content))
+        overlap = sum(w for t, w in weights.items() if t in doc_tokens) / total
+        return rrf_score + RERANK_WEIGHT * overlap
+
+    return [doc for doc, _ in sorted(fused, key=score, reverse=True)]
+
+def _fit_budget(docs: list, budget_tokens: int = RAG_CONTEXT_TOKENS) -> list:
+    # Estimación de tokens ~ caracteres / 4; el último fragmento que no entra se recorta
+    selected, remaining = [], budget_tokens * 4
+    for doc in docs:
+        if len(doc.page_content) <= remaining:
+            selected.append(doc)
+            remaining -= len(doc.page_content)
+            continue
+        if remaining >= MIN_TRUNCATED_TOKENS * 4:
+            selected.append(Document(page_content=doc.page_content[:remaining] + "…", metadata=doc.metadata))
+        break
+    return selected
+
+async def _sparse_search(question: str, user_id: str, asset_id: str = None) -> list:
+    if not user_id:
+        return []
+    try:
+        hits = await run_io(search_chunks, question, user_id, RAG_SPARSE_K, asset_id)
+    except Exception as e:
+        # BM25 es un complemento: si falla, seguimos solo con la búsqueda vectorial
+        print(f"⚠️ [RAG] BM25 no disponible: {e}")
+        return []
+    return [Document(page_content=record["text"], metadata=record["metadata"]) for record, _ in hits]
+
+async def retrieve_context(question: str, user_id: str = None, asset_id: str = None):
+    """
+    Recuperación híbrida acotada al tenant: búsqueda vectorial + BM25 en paralelo,
+    fusión RRF, reordenamiento léxico y recorte al presupuesto de tokens.
+    Devuelve (docs, context_text).
+    """
+    # 1. BÚSQUEDA EXPLÍCITA (densa y léxica a la vez) sobre los documentos del usuario
+    dense, sparse = await asyncio.gather(
+        similarity_search(question, k=RAG_DENSE_K, filter=tenant_filter(user_id, asset_id)),
+        _sparse_search(question, user_id, asset_id),
+    )
+    if not dense and user_id and not asset_id:
+        legacy = await _legacy_filter(user_id)
+        if legacy:
+            dense = await similarity_search(question, k=RAG_DENSE_K, filter=legacy)
+
+    # 2. FUSIÓN + REORDENAMIENTO + PRESUPUESTO
+    docs = _fit_budget(_rerank(question, _rrf([dense, sparse]))[:RAG_TOP_K])
+    print(f"📄 [DEBUG RAG] Encontré {len(docs)} fragmentos relevantes ({len(dense)} vectoriales, {len(sparse)} BM25).")
+
+    # IMPRIMIR LO QUE ENCONTRÓ (Esto saldrá en tu terminal)
+    context_text = ""
+    for i, doc in enumerate(docs):
+        clean_content = doc.page_content.replace("\n", " ")[:150] # Primeros 150 chars
+        print(f"   👉 Fragmento {i+1}: {clean_content}...")
+        context_text += f"\n\n---\n[{_citation(doc.metadata)}]\n{doc.page_content}"
+    return docs, context_text
+
+async def _cache_key(question: str, user_id: str = None, asset_id: str = None):
+    # Solo se cachean las preguntas sobre todos los documentos del usuario
+    if not user_id or asset_id:
+        return None
+    return answer_key("RAG", user_id, question, await get_datasources_with_metadata(user_id))
+
+async def run_rag_agent(question: str, user_id: str = None, asset_id: str = None):
+    """
+    Busca contexto en Pinecone con DEBUGGING EXTREMO (solo en los documentos del usuario).
+    """
+    try:
+        print(f"🔍 [RAG] Iniciando búsqueda para: '{question}'")
+        cache_key = await _cache_key(question, user_id, asset_id)
+        cached = get_answer("RAG", cache_key) if cache_key else None
+        if cached is not None:
+            print("⚡ [RAG] Respuesta servida desde caché")
+            return {**cached, "cached": True}
+
+        docs, context_text = await retrieve_context(question, user_id, asset_id)
         
-        prompt = ChatPromptTemplate.from_template(template)
-        chain = prompt | llm | StrOutputParser()
+        # SI NO ENCUENTRA NADA, ALERTA
+        if not docs:
+            return {"result": NO_DOCS_MESSAGE, "source_documents": []}
 
+        # 3. Prompt Manual
         print("🤖 [RAG] Consultando a Gemini con el contexto encontrado...")
-        response = await chain.ainvoke({"context": context_text, "question": question})
+        response = await rag_chain.ainvoke({"context": context_text, "question": question})
         
-        return {"result": response, "source_documents": "Pinecone Index"}
+        answer = {"result": response, "source_documents": "Pinecone Index"}
+        if cache_key:
+            store_answer("RAG", cache_key, answer)
+        return answer
 
     except Exception as e:
         print(f"❌ Error en RAG Service: {e}")
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+async def stream_rag_agent(question: str, user_id: str = None, asset_id: str = None):
+    """
+    Igual que run_rag_agent, pero emite la respuesta de Gemini por fragmentos.
+    Comparte la caché: un acierto se emite como un único fragmento.
+    """
+    print(f"🔍 [RAG] Iniciando búsqueda (stream) para: '{question}'")
+    cache_key = await _cache_key(question, user_id, asset_id)
+    cached = get_answer("RAG", cache_key) if cache_key else None
+    if cached is not None:
+        print("⚡ [RAG] Respuesta servida desde caché")
+        yield cached["result"]
+        return
+
+    docs, context_text = await retrieve_context(question, user_id, asset_id)
+    if not docs:
+        yield NO_DOCS_MESSAGE
+        return
+    response = ""
+    async for chunk in rag_chain.astream({"context": context_text, "question": question}):
+        response += chunk
+        yield chunk
+    if cache_key:
+        store_answer("RAG", cache_key, {"result": response, "source_documents": "Pinecone Index"})
@@ -1,7 +1,14 @@
 import os
+import re
+import unicodedata
+from collections import deque
+import numpy as np
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from services.embedding_service import get_embeddings
+from services.cache_service import TTLCache
+from services.executor_service import run_io
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 MODEL_ROUTER = os.getenv("MODEL_SMART", "gemini-1.5-pro-001")
@@ -12,12 +19,118 @@ llm = ChatGoogleGenerativeAI(
    google_api_key=GOOGLE_API_KEY
 )
 
+# --- CACHÉ DE DECISIONES ---
+ROUTER_CACHE_SIZE = int(os.getenv("ROUTER_CACHE_SIZE", "5000"))
+ROUTER_CACHE_TTL = int(os.getenv("ROUTER_CACHE_TTL", "86400"))
+ROUTER_SEMANTIC_SIZE = int(os.getenv("ROUTER_SEMANTIC_SIZE", "2000"))
+ROUTER_SEMANTIC_THRESHOLD = float(os.getenv("ROUTER_SEMANTIC_THRESHOLD", "0.93"))
+
+VISUAL_WORDS = ["GRAF", "VISUALIZ", "PLOT", "BARRAS", "TORTA", "LINEA", "CHART"]
+# Pre-clasificador local: solo pedidos imperativos al inicio de la pregunta ("grafica las ventas",
+# "haz un gráfico de..."). Una mención suelta ("qué dice el informe sobre la gráfica") la decide el LLM
+_VISUAL_PATTERN = re.compile(
+   r"^(por favor )?("
+   r"grafica(me|r)?|visualiza(me|r)?|plotea(me|r)?|plot"
+   r"|(haz|hazme|crea|creame|genera|generame|dibuja|dibujame|muestrame|arma|armame)( un| una| el| la)? (grafico|grafica|chart|plot|visualizacion)"
+   r")\b"
+)
+_GREETING_WORDS = {
+   "hola", "holi", "buenas", "buen", "buenos", "dia", "dias", "tardes", "noches", "gracias", "muchas",
+   "chau", "adios", "saludos", "hello", "hi", "hey", "thanks", "ok", "okay", "genial", "perfecto", "dale"
+}
+_GREETING_PHRASES = {"quien eres", "que eres", "como estas", "que tal", "que puedes hacer"}
+
+_exact_cache = TTLCache(maxsize=ROUTER_CACHE_SIZE, ttl=ROUTER_CACHE_TTL)
+_semantic_entries = deque(maxlen=ROUTER_SEMANTIC_SIZE)  # (vector normalizado, decisión)
+_stats = {"keyword": 0, "exact": 0, "semantic": 0, "llm": 0}
+
+def normalize_query(query: str) -> str:
+   text = unicodedata.normalize("NFKD", query.lower())
+   text = "".join(c for c in text if not unicodedata.combining(c))
+   text = re.sub(r"[^\w\s]", " ", text)
+   return " ".join(text.split())
+
+def _keyword_route(normalized: str):
+   """Casos obvios que no necesitan LLM: saludos/agradecimientos y pedidos explícitos de gráfico."""
+   words = normalized.split()
+   if not words:
+      return "CHAT"
+   if normalized in _GREETING_PHRASES or (len(words) <= 4 and all(w in _GREETING_WORDS for w in words)):
+      return "CHAT"
+   if _VISUAL_PATTERN.search(normalized):
+      return "CHART"
+   return None
+
+def _semantic_lookup(vector):
+   best_score, best_decision = 0.0, None
+   for cached_vector, decision in list(_semantic_entries):
+      score = float(np.dot(vector, cached_vector))
+      if score > best_score:
+         best_score, best_decision = score, decision
+   return best_decision if best_score >= ROUTER_SEMANTIC_THRESHOLD else None
+
+async def _embed(normalized: str):
+   try:
+      vector = np.asarray(await run_io(get_embeddings().embed_query, normalized), dtype=np.float32)
+      norm = np.linalg.norm(vector)
+      return vector / norm if norm else None
+   except Exception as e:
+      print(f"⚠️ [ROUTER] Sin embedding para caché semántico: {e}")
+      return None
+
+def get_router_cache_stats() -> dict:
+   total = sum(_stats.values())
+   return {
+      **_stats,
+      "total": total,
+      "llm_skipped_rate": round(1 - _stats["llm"] / total, 4) if total else 0.0,
+      "exact_cache": _exact_cache.stats(),
+      "semantic_entries": len(_semantic_entries),
+   }
+
 async def route_query(query: str):
    """
-   Clasifica la intención del usuario con reglas estrictas para evitar falsos positivos de CHART.
+   Clasifica la intención del usuario. Orden: palabras clave -> caché exacto -> caché semántico -> LLM.
    """
    print(f"🚦 [ROUTER] Analizando intención para: '{query}'")
-   
+   normalized = normalize_query(query)
+
+   decision = _keyword_route(normalized)
+   if decision:
+      _stats["keyword"] += 1
+      print(f"🚦 [ROUTER] Decisión por palabras clave: {decision}")
+      return decision
+
+   decision = _exact_cache.get(normalized)
+   if decision:
+      _stats["exact"] += 1
+      print(f"🚦 [ROUTER] Decisión cacheada (exacta): {decision}")
+      return decision
+
+   vector = await _embed(normalized)
+   if vector is not None:
+      decision = _semantic_lookup(vector)
+      if decision:
+         _stats["semantic"] += 1
+         _exact_cache.set(normalized, decision)
+         print(f"🚦 [ROUTER] Decisión cacheada (semántica): {decision}")
+         return decision
+
+   _stats["llm"] += 1
+   decision = await _classify_with_llm(query)
+   if decision is None:
+      return "SQL"
+
+   _exact_cache.set(normalized, decision)
+   if vector is not None:
+      _semantic_entries.append((vector, decision))
+   return decision
+
+async def _classify_with_llm(query: str):
+   """
+   Clasifica la intención del usuario con reglas estrictas para evitar falsos positivos de CHART.
+   Devuelve None si el LLM falla (para no cachear el fallback).
+   """
    template = """
    Eres un clasificador de intenciones experto para Fluent AI. 
    Tu misión es decidir qué herramienta usar según el mensaje del usuario.
@@ -53,8 +166,7 @@ async def route_query(query: str):
       # Mapeo de seguridad
       if "CHART" in intention: 
          # Triple check: si no hay palabras de visualización, lo bajamos a SQL
-         visual_words = ["GRAF", "VISUALIZ", "PLOT", "BARRAS", "TORTA", "LINEA", "CHART"]
-         if not any(word in query.upper() for word in visual_words):
+         if not any(word in query.upper() for word in VISUAL_WORDS):
              intention = "SQL"
          else:
              intention = "CHART"
@@ -72,4 +184,4 @@ async def route_query(query: str):
 
    except Exception as e:
       print(f"❌ Error en Router: {e}")
-      return "SQL"
\ No newline at end of file
+      return None
\ No newline at end of file
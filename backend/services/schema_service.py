@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import postgresql
+
+# Configuración del caché de esquemas
+SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", "600"))  # segundos antes de re-validar el fingerprint
+SCHEMA_SAMPLE_ROWS = int(os.getenv("SCHEMA_SAMPLE_ROWS", "3"))
+SCHEMA_MAX_TABLES = 50
+
+# source_id -> {"entry": {...}, "checked_at": monotonic}
+_schema_cache = {}
+_lock = threading.Lock()
+
+# Nombre del TIMESTAMP tal como lo reporta scan_tables ("TIMESTAMP WITHOUT TIME ZONE" según la
+# versión de SQLAlchemy): si no coincide, el fingerprint cambia y se fuerza un re-escaneo
+TIMESTAMP_TYPE = str(postgresql.TIMESTAMP())
+
+# Tipos de pandas -> nombre de tipo tal como lo devuelve el inspector de Postgres
+_PANDAS_TO_SQL = {
+    "int": "BIGINT",
+    "float": "DOUBLE PRECISION",
+    "bool": "BOOLEAN",
+    "datetime": TIMESTAMP_TYPE,
+}
+
+
+def schema_fingerprint(tables: dict) -> str:
+    """Hash estable de la lista de tablas + columnas (+ tipos)."""
+    payload = json.dumps({t: tables[t] for t in sorted(tables)}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def render_schema(tables: dict, samples: dict = None) -> str:
+    """Genera el texto de esquema (estilo SQLDatabase.get_table_info) que lee el LLM."""
+    samples = samples or {}
+    parts = []
+    for table, columns in tables.items():
+        cols = ",\n\t".join(f"{name} {col_type}" for name, col_type in columns)
+        block = f"CREATE TABLE {table} (\n\t{cols}\n)"
+        rows = samples.get(table)
+        if rows:
+            header = "\t".join(name for name, _ in columns)
+            body = "\n".join("\t".join(str(v) for v in row) for row in rows)
+            block += f"\n\n/*\n{len(rows)} rows from {table} table:\n{header}\n{body}\n*/"
+        parts.append(block)
+    return "\n\n".join(parts)
+
+
+def build_schema_cache(tables: dict, samples: dict = None) -> dict:
+    """Entrada serializable que se guarda en DataAsset.asset_metadata["schema_cache"]."""
+    return {
+        "text": render_schema(tables, samples),
+        "fingerprint": schema_fingerprint(tables),
+        "tables": list(tables.keys()),
+        "cached_at": datetime.datetime.utcnow().isoformat(),
+    }
+
+
+def scan_tables(inspector, table_names: list) -> dict:
+    """Lee columnas y tipos de cada tabla (sin consultar filas)."""
+    return {
+        table: [[col["name"], str(col["type"])] for col in inspector.get_columns(table)]
+        for table in table_names
+    }
+
+
+def fetch_samples(engine, table_names: list, limit: int = SCHEMA_SAMPLE_ROWS) -> dict:
+    samples = {}
+    if limit <= 0:
+        return samples
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.connect() as conn:
+        for table in table_names:
+            try:
+                rows = conn.execute(text(f"SELECT * FROM {quote(table)} LIMIT {int(limit)}")).fetchall()
+                samples[table] = [tuple(r) for r in rows]
+            except Exception as e:
+                print(f"⚠️ [SCHEMA] No se pudieron leer filas de muestra de {table}: {e}")
+    return samples
+
+
+def schema_from_dataframe(table_name: str, df, column_types: dict = None) -> dict:
+    """
+    Esquema de una tabla recién cargada desde un DataFrame (sin tocar la DB).
+    column_types: tipos con los que se creó la tabla (carga por COPY); si falta, se deducen de los dtypes.
+    """
+    column_types = column_types or {}
+    columns = []
+    for col, dtype in df.dtypes.items():
+        kind = next((k for k in _PANDAS_TO_SQL if k in str(dtype)), None)
+        columns.append([str(col), column_types.get(str(col)) or _PANDAS_TO_SQL.get(kind, "TEXT")])
+    head = df.head(SCHEMA_SAMPLE_ROWS)
+    samples = {table_name: [tuple(r) for r in head.itertuples(index=False, name=None)]}
+    return build_schema_cache({table_name: columns}, samples)
+
+
+def _resolve_tables(inspector, table_names: list = None, ignore: list = None) -> list:
+    if table_names:
+        return list(table_names)[:SCHEMA_MAX_TABLES]
+    ignore = set(ignore or [])
+    return [t for t in inspector.get_table_names() if t not in ignore][:SCHEMA_MAX_TABLES]
+
+
+def get_schema_info(source_id: str, stored: dict, engine, table_names: list = None, ignore: list = None):
+    """
+    Devuelve (schema_text, entrada_nueva_o_None).
+    - Dentro del TTL: se sirve desde memoria sin tocar la DB.
+    - TTL vencido: solo se comparan columnas (fingerprint). Si no cambió, se reutiliza el texto.
+    - Si cambió (o no hay caché): escaneo completo; la entrada nueva se devuelve para persistirla.
+    """
+    source_id = str(source_id)
+    now = time.monotonic()
+
+    with _lock:
+        cached = _schema_cache.get(source_id)
+    if cached and now - cached["checked_at"] < SCHEMA_CACHE_TTL:
+        return cached["entry"]["text"], None
+
+    entry = cached["entry"] if cached else stored
+    if entry and not cached and _age_seconds(entry) < SCHEMA_CACHE_TTL:
+        # Recién escaneado en el connect/upload: lo subimos a memoria tal cual
+        _remember(source_id, entry, now)
+        return entry["text"], None
+
+    inspector = inspect(engine)
+    tables = scan_tables(inspector, _resolve_tables(inspector, table_names, ignore))
+    if entry and schema_fingerprint(tables) == entry.get("fingerprint"):
+        _remember(source_id, entry, now)
+        return entry["text"], None
+
+    print(f"🔄 [SCHEMA] Esquema nuevo o modificado para la fuente {source_id}, re-escaneando...")
+    new_entry = build_schema_cache(tables, fetch_samples(engine, list(tables.keys())))
+    _remember(source_id, new_entry, now)
+    return new_entry["text"], new_entry
+
+
+def invalidate_schema(source_id: str):
+    with _lock:
+        _schema_cache.pop(str(source_id), None)
+
+
+def _remember(source_id: str, entry: dict, now: float):
+    with _lock:
+        _schema_cache[source_id] = {"entry": entry, "checked_at": now}
+
+
+def _age_seconds(entry: dict) -> float:
+    try:
+        cached_at = datetime.datetime.fromisoformat(entry["cached_at"])
+        return (datetime.datetime.utcnow() - cached_at).total_seconds()
+    except (KeyError, TypeError, ValueError):
+        return float("inf")
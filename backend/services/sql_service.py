@@ -1,12 +1,26 @@
 import os
-from decimal import Decimal
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+import time
+import uuid
+import inspect
+import hashlib
+import asyncio
+import datetime
+from contextlib import contextmanager
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.utilities import SQLDatabase
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from database import engine as local_engine
+from database import engine as local_engine, AsyncSessionLocal
+from services.engine_service import get_engine
+from services.schema_service import get_schema_info
+from services.cache_service import TTLCache
+from services.executor_service import run_io
+from services.pinecone_service import search_assets
+from services.pgvector_store import PGVECTOR_TABLE
+from services.answer_cache_service import answer_key, get_answer, store_answer
+from services.query_service import execute_bounded, format_result
+from services.sql_template_service import find_template, remember_template, forget_template, render_sql, record_empty_rebind
 import models
 import traceback
 
@@ -14,36 +28,128 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 MODEL_SMART = os.getenv("MODEL_SMART", "gemini-1.5-pro-001")
 
 llm = ChatGoogleGenerativeAI(model=MODEL_SMART, temperature=0, google_api_key=GOOGLE_API_KEY)
-SessionLocal = sessionmaker(bind=local_engine)
+# Inventario de fuentes por usuario (se invalida desde los endpoints de /ingest)
+INVENTORY_CACHE_TTL = int(os.getenv("INVENTORY_CACHE_TTL", "300"))
+_inventory_cache = TTLCache(maxsize=1024, ttl=INVENTORY_CACHE_TTL)
 
-def get_datasources_with_metadata(user_id: str):
+# Pre-selección vectorial de fuentes
+SELECTOR_TOP_K = int(os.getenv("SELECTOR_TOP_K", "5"))
+SELECTOR_DECISIVE_MARGIN = float(os.getenv("SELECTOR_DECISIVE_MARGIN", "0.08"))
+
+async def get_datasources_with_metadata(user_id: str):
     """
     Recupera las fuentes Y sus descripciones (DataAssets) para que el LLM decida.
+    El inventario se cachea por usuario; los endpoints de /ingest lo invalidan.
     """
-    session = SessionLocal()
-    try:
+    cached = _inventory_cache.get(user_id)
+    if cached is not None:
+        return [dict(s) for s in cached]
+
+    async with AsyncSessionLocal() as session:
         results = []
-        # Join entre DataSource y DataAsset para tener la info completa
-        # Buscamos sources del usuario
-        sources = session.query(models.DataSource).filter(models.DataSource.user_id == user_id).all()
+        # Una sola consulta para las fuentes + una (selectinload) para todos sus assets
+        query = await session.execute(
+            select(models.DataSource)
+            .options(selectinload(models.DataSource.assets))
+            .where(models.DataSource.user_id == user_id)
+            .order_by(models.DataSource.created_at.desc())
+        )
+        sources = query.scalars().all()
         
         for src in sources:
-            # Buscamos el asset asociado (que tiene la descripción/schema)
-            asset = session.query(models.DataAsset).filter(models.DataAsset.data_source_id == src.id).first()
+            # El asset asociado (que tiene la descripción/schema)
+            asset = src.assets[0] if src.assets else None
             description = asset.description if asset else "Sin información"
             
+            metadata = (asset.asset_metadata or {}) if asset else {}
+            config = src.connection_config or {}
+            
             results.append({
                 "id": str(src.id),
                 "name": src.name,
                 "type": src.type,
                 "db_url": src.connection_string,
-                "description": description # <--- ESTO ES LO QUE LEE EL LLM
+                "description": description, # <--- ESTO ES LO QUE LEE EL LLM
+                "asset_id": str(asset.id) if asset else None,
+                "is_indexed": bool(asset.is_indexed) if asset else False,
+                "last_synced_at": asset.last_synced_at.isoformat() if asset and asset.last_synced_at else None,
+                "table_name": config.get("table_name"),
+                "host": config.get("host", "File"),
+                "profiling": metadata.get("profiling", {}),
+                "schema_cache": metadata.get("schema_cache")
             })
             
-        return results
-    finally: session.close()
+    _inventory_cache.set(user_id, results)
+    return [dict(s) for s in results]
+
+def invalidate_inventory(user_id: str):
+    _inventory_cache.pop(str(user_id))
+
+async def save_schema_cache(asset_id: str, entry: dict):
+    """Persiste el esquema re-escaneado en DataAsset.asset_metadata para el próximo arranque."""
+    if not asset_id: return
+    async with AsyncSessionLocal() as session:
+        try:
+            asset = await session.get(models.DataAsset, uuid.UUID(asset_id))
+            if asset:
+                # Reasignamos el dict completo para que SQLAlchemy detecte el cambio en JSONB
+                asset.asset_metadata = {**(asset.asset_metadata or {}), "schema_cache": entry}
+                # El esquema cambió: nueva versión de la fuente para la caché de respuestas
+                asset.last_synced_at = datetime.datetime.now(datetime.timezone.utc)
+                await session.commit()
+        except Exception as e:
+            await session.rollback()
+            print(f"⚠️ No se pudo guardar el caché de esquema: {e}")
+
+async def shortlist_datasources(question: str, sources: list):
+    """
+    Pre-selección vectorial: top-k entre los assets STRUCTURED del usuario ya indexados.
+    Devuelve (candidatas, ganadora_o_None). Hay ganadora si el margen del primer hit es decisivo.
+    Las fuentes sin vector (conexiones antiguas) siempre pasan como candidatas.
+    """
+    indexed = {s["asset_id"]: s for s in sources if s.get("is_indexed") and s.get("asset_id")}
+    unindexed = [s for s in sources if s.get("asset_id") not in indexed]
+    if not indexed:
+        return sources, None
+
+    try:
+        hits = await search_assets(question, k=SELECTOR_TOP_K, filter={
+            "type": {"$eq": "STRUCTURED"},
+            "asset_id": {"$in": list(indexed.keys())}
+        })
+    except Exception as e:
+        print(f"⚠️ Pre-selección vectorial no disponible: {e}")
+        return sources, None
+
+    ranked, seen = [], set()
+    for metadata, score in hits:
+        source = indexed.get(metadata.get("asset_id"))
+        if source and source["id"] not in seen:
+            seen.add(source["id"])
+            ranked.append((source, score))
+    print(f"🧭 [SELECTOR] Top-{SELECTOR_TOP_K}: {[(s['name'], round(sc, 3)) for s, sc in ranked]}")
+
+    winner = None
+    if ranked and not unindexed:
+        margin = ranked[0][1] - ranked[1][1] if len(ranked) > 1 else float("inf")
+        if margin >= SELECTOR_DECISIVE_MARGIN:
+            winner = ranked[0][0]
+
+    candidates = [s for s, _ in ranked] + unindexed
+    return candidates or sources, winner
 
 async def select_best_datasource(question: str, sources: list):
+    if len(sources) == 1:
+        return sources[0]["id"]
+
+    # 1. Pre-selección vectorial: al LLM solo le llegan k candidatas (o ninguna si hay ganadora clara)
+    sources, winner = await shortlist_datasources(question, sources)
+    if winner:
+        print(f"🧭 [SELECTOR] Ganadora por margen vectorial, sin LLM: {winner['name']}")
+        return winner["id"]
+    if len(sources) == 1:
+        return sources[0]["id"]
+
     # Generamos un contexto limpio texto
     context_str = ""
     for s in sources:
@@ -78,26 +184,50 @@ async def select_best_datasource(question: str, sources: list):
         print(f"⚠️ Fallo Router: {e}")
         return sources[0]["id"] if sources else None
 
-async def run_sql_agent(question: str, user_id: str = None) -> dict:
+def source_engine(source: dict):
+    """Engine de una fuente del inventario: el pool cacheado si es externa, la DB local si no."""
+    if source.get("db_url"):
+        # Engine cacheado por fuente (pool acotado, pool_pre_ping incluido)
+        return get_engine(source["id"], source["db_url"])
+    return local_engine
+
+async def get_source_engine(source_id: str, user_id: str):
+    """Engine de la fuente source_id del usuario (None si la fuente ya no existe)."""
+    sources = await get_datasources_with_metadata(user_id)
+    source = next((s for s in sources if s["id"] == str(source_id)), None)
+    return source_engine(source) if source else None
+
+@contextmanager
+def stage_timer(timings: dict, name: str):
+    """Mide la duración (ms) de una etapa del pipeline y la guarda en timings[name]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+async def prepare_sql_context(question: str, user_id: str = None) -> dict:
+    """
+    Todo lo que no depende del SQL generado: inventario, elección de fuente, engine y esquema.
+    /chat lo lanza en paralelo al router (especulativo) y lo cancela si la ruta no es SQL/CHART.
+    """
+    timings = {}
     try:
         # 1. Obtener inventario con metadata pre-escaneada
-        sources = get_datasources_with_metadata(user_id)
+        with stage_timer(timings, "inventory"):
+            sources = await get_datasources_with_metadata(user_id)
         if not sources: return {"error": "No hay fuentes de datos conectadas."}
         
         # 2. El Router decide
-        target_id = await select_best_datasource(question, sources)
+        with stage_timer(timings, "select_source"):
+            target_id = await select_best_datasource(question, sources)
         
         target_source = next((s for s in sources if s["id"] == target_id), sources[0])
         print(f"🎯 [ROUTER] Gana: {target_source['name']} ({target_source['type']})")
 
         # 3. Conexión
-        if target_source["db_url"]:
-            print(f"🔌 Intentando conectar a externa: {target_source['name']}")
-            # pool_pre_ping=True ayuda a reconectar si Docker cortó el enlace
-            active_engine = create_engine(target_source["db_url"], pool_pre_ping=True)
-        else:
-            print("🏠 Usando DB Local")
-            active_engine = local_engine
+        print(f"🔌 Conectando a: {target_source['name']}")
+        active_engine = source_engine(target_source)
         
         # --- DEBUG & FIX ---
         print("🕵️ Verificando conexión y esquema...")
@@ -107,59 +237,145 @@ async def run_sql_agent(question: str, user_id: str = None) -> dict:
         # En bases externas, pasamos lista vacía para evitar ValueError de LangChain.
         if target_source.get("db_url"):
             ignore_list = [] 
+            table_names = [target_source["table_name"]] if target_source.get("table_name") else None
         else:
             ignore_list = [
                 "users", 
                 "user_limits",       
                 "data_sources", 
                 "data_assets", 
+                "ingest_jobs",
+                "document_chunks",
+                "embedding_cache",
+                PGVECTOR_TABLE,
                 "usage_logs",        
                 "chat_messages", 
                 "dashboard_widgets"
             ]
+            # En la DB local conviven las tablas de todos los usuarios: solo se escanean las propias
+            own_tables = [s["table_name"] for s in sources if not s.get("db_url") and s.get("table_name")]
+            table_names = [target_source["table_name"]] if target_source.get("table_name") else own_tables
+            table_names = [t for t in table_names if t not in ignore_list]
+            if not table_names:
+                return {"error": "No hay tablas propias para consultar en esta fuente."}
 
         try:
-            db = SQLDatabase(active_engine, ignore_tables=ignore_list)
-            # Forzamos la lectura del esquema aquí
-            schema_info = db.get_table_info()
+            # Esquema cacheado por fuente (solo se re-escanea si venció el TTL y cambió el fingerprint)
+            with stage_timer(timings, "schema"):
+                schema_info, new_schema = await run_io(
+                    get_schema_info, target_source["id"], target_source.get("schema_cache"), active_engine,
+                    table_names=table_names, ignore=ignore_list
+                )
+            if new_schema:
+                await save_schema_cache(target_source.get("asset_id"), new_schema)
             print("✅ Conexión establecida. Esquema leído.")
         except Exception as conn_error:
             print(f"❌ ERROR DE CONEXIÓN DB: {conn_error}")
             raise conn_error 
 
-        # 4. Generación de SQL
-        print("🤖 Generando Query...")
-        template = """
-        Genera SQL para: "{question}"
-        ESQUEMA: {schema}
-        DIALECTO: {dialect}
-        REGLAS:
-        1. Solo SQL limpio.
-        2. CAST(columna AS NUMERIC) para dinero en texto.
-        """
-        prompt = ChatPromptTemplate.from_template(template)
-        chain = prompt | llm | StrOutputParser() 
-        
-        sql = await chain.ainvoke({
-            "question": question, 
-            "schema": schema_info, 
-            "dialect": active_engine.dialect.name
-        })
-        sql = sql.replace("```sql", "").replace("```", "").strip()
-        print(f"🚀 [SQL GENERADO]: {sql}")
-        
-        # 5. Ejecución
-        with active_engine.connect() as conn:
-            res = conn.execute(text(sql))
-            result_dict = [dict(row._mapping) for row in res.fetchall()]
-            for r in result_dict:
-                for k,v in r.items(): 
-                    if isinstance(v, Decimal): r[k] = float(v)
+        # Versión del esquema que ve el LLM: las plantillas de SQL se guardan contra ella
+        fingerprint = hashlib.sha1(schema_info.encode("utf-8")).hexdigest()
+        return {"source": target_source, "engine": active_engine, "schema": schema_info, "fingerprint": fingerprint, "timings": timings}
+
+    except Exception as e:
+        print(f"❌ ERROR PREPARANDO CONTEXTO SQL: {str(e)}")
+        traceback.print_exc() 
+        return {"error": str(e)}
+
+async def _generate_sql(question: str, schema_info: str, dialect: str) -> str:
+    template = """
+    Genera SQL para: "{question}"
+    ESQUEMA: {schema}
+    DIALECTO: {dialect}
+    REGLAS:
+    1. Solo SQL limpio.
+    2. CAST(columna AS NUMERIC) para dinero en texto.
+    """
+    prompt = ChatPromptTemplate.from_template(template)
+    chain = prompt | llm | StrOutputParser()
+    sql = await chain.ainvoke({"question": question, "schema": schema_info, "dialect": dialect})
+    return sql.replace("```sql", "").replace("```", "").strip()
+
+def _present(response: dict, result_format: str) -> dict:
+    # La caché guarda el resultado columnar; el formato de salida se arma al responder
+    execution = response["execution"]
+    return {
+        "sql": response["sql"],
+        "result": format_result(execution, result_format),
+        "truncated": execution["truncated"],
+        "source_id": response["source_id"],
+    }
+
+async def run_sql_agent(question: str, user_id: str = None, context=None, result_format: str = "rows") -> dict:
+    """
+    context: resultado de prepare_sql_context, o la Task especulativa que lo está calculando.
+    result_format: "rows" (lista de dicts, por defecto) o "columnar".
+    Las respuestas se cachean por usuario + pregunta + versión de sus fuentes.
+    """
+    timings = {}
+    try:
+        cache_key = None
+        if user_id:
+            cache_key = answer_key("SQL", user_id, question, await get_datasources_with_metadata(user_id))
+            cached = get_answer("SQL", cache_key)
+            if cached is not None:
+                if isinstance(context, asyncio.Task):
+                    context.cancel()  # El trabajo especulativo ya no hace falta
+                print("⚡ [SQL] Respuesta servida desde caché")
+                return {**_present(cached, result_format), "cached": True, "timings": {}}
+
+        if context is None:
+            context = await prepare_sql_context(question, user_id)
+        elif inspect.isawaitable(context):
+            # Lo que queda de la etapa especulativa cuando el router ya terminó (camino crítico)
+            with stage_timer(timings, "wait_context"):
+                context = await context
+        if "error" in context: return {"error": context["error"]}
+        timings = {**context["timings"], **timings}
+
+        active_engine = context["engine"]
+        schema_info = context["schema"]
+        source_id, fingerprint = context["source"]["id"], context["fingerprint"]
+        execution = None
+
+        # 4a. Plantilla ya validada con la misma forma de pregunta: se re-bindea sin LLM
+        match = find_template(source_id, fingerprint, question)
+        if match:
+            template_sql, params = match
+            sql = render_sql(template_sql, params)
+            print(f"♻️ [SQL PLANTILLA]: {sql}")
+            try:
+                with stage_timer(timings, "execute"):
+                    execution = await run_io(execute_bounded, active_engine, template_sql, params)
+            except Exception as e:
+                print(f"⚠️ [SQL PLANTILLA] Falló con los nuevos valores, se genera de cero: {e}")
+                forget_template(source_id, fingerprint, template_sql)
+            else:
+                if not execution["row_count"]:
+                    # Sin filas puede ser un valor mal re-bindeado: no se responde vacío sin preguntarle al LLM
+                    print("⚠️ [SQL PLANTILLA] Sin resultados con los nuevos valores, se genera de cero")
+                    record_empty_rebind()
+                    execution = None
+
+        if execution is None:
+            # 4b. Generación de SQL
+            print("🤖 Generando Query...")
+            with stage_timer(timings, "generate_sql"):
+                sql = await _generate_sql(question, schema_info, active_engine.dialect.name)
+            print(f"🚀 [SQL GENERADO]: {sql}")
+
+            # 5. Ejecución acotada (filas/bytes/timeout) en el pool de I/O: una query lenta no bloquea al resto
+            with stage_timer(timings, "execute"):
+                execution = await run_io(execute_bounded, active_engine, sql)
+            remember_template(source_id, fingerprint, question, sql)
 
-        print(f"📊 [RESULTADO]: {len(result_dict)} filas obtenidas.")
-        return {"sql": sql, "result": result_dict}
+        print(f"📊 [RESULTADO]: {execution['row_count']} filas obtenidas{' (recortado)' if execution['truncated'] else ''}. ⏱️ {timings}")
+        response = {"sql": sql, "execution": execution, "row_count": execution["row_count"], "source_id": context["source"]["id"]}
+        if cache_key:
+            store_answer("SQL", cache_key, response)
+        return {**_present(response, result_format), "timings": timings}
 
     except Exception as e:
         print(f"❌ ERROR FATAL EN AGENTE SQL: {str(e)}")
         traceback.print_exc() 
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
@@ -0,0 +1,246 @@
+# Caché de SQL generado como plantillas parametrizadas.
+# Cuando el LLM genera una consulta que se ejecuta bien, los literales del SQL que aparecen
+# textualmente en la pregunta ('Argentina', 2024, '%pendiente%') pasan a ser parámetros
+# (:p0, :p1...) y la pregunta queda como "forma" con huecos en esas posiciones.
+# Una pregunta posterior con la misma forma ("ventas de Chile en 2023") reutiliza la
+# plantilla re-bindeando los valores, sin llamar al LLM.
+# Clave: (fuente, fingerprint del esquema) -> forma de la pregunta. Un cambio de esquema cambia
+# el fingerprint, así que las plantillas viejas no se vuelven a usar.
+# Los literales que el LLM dedujo (p. ej. "marzo" -> '2024-03-01') no se parametrizan: quedan
+# como palabra fija de la forma, y una pregunta con otro mes simplemente no coincide.
+# Un hueco de texto solo acepta palabras del mismo tipo que el valor original (mes con mes,
+# código con código...): "ventas de marzo" no se re-bindea con "hoy" ni con "Argentina".
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from services.cache_service import TTLCache
+
+SQL_TEMPLATE_SOURCES = int(os.getenv("SQL_TEMPLATE_SOURCES", "256"))        # fuentes con plantillas en memoria
+SQL_TEMPLATES_PER_SOURCE = int(os.getenv("SQL_TEMPLATES_PER_SOURCE", "200"))
+SQL_TEMPLATE_TTL = int(os.getenv("SQL_TEMPLATE_TTL", "86400"))
+
+_TOKEN_PATTERN = re.compile(r"\w+(?:[\-./]\w+)*")
+_STRING_LITERAL = re.compile(r"'((?:[^']|'')*)'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.:])(\d+(?:\.\d+)?)(?![\w.])")
+_READ_ONLY = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+_MONTHS = {
+    "enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto", "septiembre", "setiembre",
+    "octubre", "noviembre", "diciembre", "january", "february", "march", "april", "may", "june", "july",
+    "august", "september", "october", "november", "december",
+}
+_WEEKDAYS = {
+    "lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+}
+# Referencias relativas: el LLM las traduce a fechas, nunca son un valor literal re-bindeable
+_RELATIVE = {
+    "hoy", "ayer", "manana", "anteayer", "actual", "pasado", "pasada", "ultimo", "ultima", "ultimos",
+    "ultimas", "proximo", "proxima", "este", "esta", "today", "yesterday", "tomorrow", "last", "next", "current",
+}
+_DATE_TOKEN = re.compile(r"^\d{1,4}([\-./])\d{1,2}(\1\d{1,4})?$")
+
+_templates = TTLCache(maxsize=SQL_TEMPLATE_SOURCES, ttl=SQL_TEMPLATE_TTL)
+_stats = {"hits": 0, "misses": 0, "stored": 0, "rejected": 0, "rebind_failures": 0, "empty_rebinds": 0}
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _tokens(text: str) -> list:
+    """Tokens de la pregunta: (original, normalizado)."""
+    return [(token, _fold(token)) for token in _TOKEN_PATTERN.findall(text)]
+
+
+def _is_number(token: str) -> bool:
+    return re.fullmatch(r"\d+(?:\.\d+)?", token) is not None
+
+
+def _word_kind(folded: str) -> str:
+    if folded in _RELATIVE:
+        return "relative"
+    if folded in _MONTHS:
+        return "month"
+    if folded in _WEEKDAYS:
+        return "weekday"
+    if _DATE_TOKEN.match(folded):
+        return "date"
+    if _is_number(folded):
+        return "number"
+    if any(c.isdigit() for c in folded):
+        return "code"
+    return "word"
+
+
+def _occurrences(tokens: list, needle: list) -> list:
+    folded = [t for _, t in tokens]
+    return [i for i in range(len(folded) - len(needle) + 1) if folded[i:i + len(needle)] == needle]
+
+
+def _extract_slots(question_tokens: list, sql: str):
+    """
+    Convierte los literales del SQL que aparecen en la pregunta en parámetros.
+    Devuelve (sql_plantilla, slots) o None si la plantilla no sería segura de reutilizar.
+    """
+    slots, taken, fixed = [], set(), []
+    pieces, last = [], 0
+
+    # Primero strings (así los números dentro de strings no se tocan), luego números sueltos
+    literals = [(m.start(), m.end(), "str", m.group(1)) for m in _STRING_LITERAL.finditer(sql)]
+    masked = _STRING_LITERAL.sub(lambda m: " " * len(m.group(0)), sql)
+    literals += [(m.start(), m.end(), "num", m.group(1)) for m in _NUMBER_LITERAL.finditer(masked)]
+    literals.sort()
+
+    for start, end, kind, value in literals:
+        core, prefix, suffix = value.replace("''", "'"), "", ""
+        if kind == "str":
+            stripped = core.strip("%")
+            prefix, suffix = core[:len(core) - len(core.lstrip("%"))], core[len(core.rstrip("%")):]
+            core = stripped
+        needle = [t for _, t in _tokens(core)]
+        hits = _occurrences(question_tokens, needle) if needle and " ".join(needle) == _fold(core).strip() else []
+        if len(hits) > 1:
+            return None  # la misma palabra aparece dos veces en la pregunta: ambiguo
+        kinds = [_word_kind(word) for word in needle]
+        if not hits or (kind == "str" and len(needle) == 1 and len(needle[0]) < 2) or "relative" in kinds:
+            fixed.append(_fold(core))  # el LLM lo dedujo (o es trivial): queda fijo en el SQL
+            continue
+        span = set(range(hits[0], hits[0] + len(needle)))
+        if span & taken:
+            return None  # dos literales sobre las mismas palabras
+        taken |= span
+        name = f"p{len(slots)}"
+        slots.append({
+            "param": name, "kind": kind, "start": hits[0], "size": len(needle),
+            "prefix": prefix, "suffix": suffix, "value": " ".join(needle), "kinds": kinds,
+        })
+        pieces.append(sql[last:start])
+        pieces.append(f":{name}")
+        last = end
+
+    # Un literal fijo derivado de un valor parametrizado ('2024-12-31' con 2024 como hueco)
+    # quedaría desfasado al re-bindear: esa plantilla no se guarda
+    if any(slot["value"] in literal for slot in slots for literal in fixed):
+        return None
+
+    pieces.append(sql[last:])
+    return "".join(pieces), slots
+
+
+def _shape(question_tokens: list, slots: list) -> tuple:
+    """Forma de la pregunta: palabras fijas + huecos ("{n}" = hueco numérico, "{s2}" = texto de 2 palabras)."""
+    by_start = {slot["start"]: slot for slot in slots}
+    shape, i = [], 0
+    while i < len(question_tokens):
+        slot = by_start.get(i)
+        if slot:
+            shape.append("{n}" if slot["kind"] == "num" else f"{{s{slot['size']}}}")
+            i += slot["size"]
+        else:
+            shape.append(question_tokens[i][1])
+            i += 1
+    return tuple(shape)
+
+
+def _bind(template: dict, question_tokens: list):
+    """Valores de los huecos para una pregunta con la forma de la plantilla (None si no encaja)."""
+    params, i = {}, 0
+    slots = iter(template["slots"])
+    for item in template["shape"]:
+        if i >= len(question_tokens):
+            return None
+        if not item.startswith("{"):
+            if question_tokens[i][1] != item:
+                return None
+            i += 1
+            continue
+        slot = next(slots)
+        words = question_tokens[i:i + slot["size"]]
+        if len(words) < slot["size"]:
+            return None
+        if slot["kind"] == "num":
+            raw = words[0][0]
+            if not _is_number(raw):
+                return None
+            params[slot["param"]] = float(raw) if "." in raw else int(raw)
+        else:
+            if [_word_kind(folded) for _, folded in words] != slot["kinds"]:
+                return None  # otro tipo de valor (p. ej. "hoy" donde había un mes)
+            params[slot["param"]] = slot["prefix"] + " ".join(original for original, _ in words) + slot["suffix"]
+        i += slot["size"]
+    return params if i == len(question_tokens) else None
+
+
+def render_sql(sql: str, params: dict) -> str:
+    """SQL con los valores incrustados, para mostrar/guardar (la ejecución usa binding)."""
+    def literal(match):
+        value = params[match.group(1)]
+        return str(value) if isinstance(value, (int, float)) else "'" + str(value).replace("'", "''") + "'"
+    return re.sub(r"(?<![:\w]):(p\d+)\b", literal, sql)
+
+
+def find_template(source_id: str, fingerprint: str, question: str):
+    """Devuelve (sql_plantilla, params) si alguna plantilla de la fuente encaja con la pregunta."""
+    templates = _templates.get((str(source_id), fingerprint))
+    if templates:
+        question_tokens = _tokens(question)
+        for shape, template in reversed(templates.items()):
+            if len(shape) > len(question_tokens):
+                continue
+            params = _bind(template, question_tokens)
+            if params is not None:
+                _stats["hits"] += 1
+                return template["sql"], params
+    _stats["misses"] += 1
+    return None
+
+
+def remember_template(source_id: str, fingerprint: str, question: str, sql: str):
+    """Guarda el SQL (ya ejecutado con éxito) como plantilla para preguntas con la misma forma."""
+    if not _READ_ONLY.match(sql):
+        return
+    question_tokens = _tokens(question)
+    extracted = _extract_slots(question_tokens, sql)
+    if extracted is None:
+        _stats["rejected"] += 1
+        return
+    template_sql, slots = extracted
+    key = (str(source_id), fingerprint)
+    templates = _templates.get(key)
+    if templates is None:
+        templates = OrderedDict()
+        _templates.set(key, templates)
+    shape = _shape(question_tokens, slots)
+    # Los huecos se recorren en el orden de la pregunta (no del SQL) al re-bindear
+    templates[shape] = {"sql": template_sql, "slots": sorted(slots, key=lambda slot: slot["start"]), "shape": shape}
+    templates.move_to_end(shape)
+    while len(templates) > SQL_TEMPLATES_PER_SOURCE:
+        templates.popitem(last=False)
+    _stats["stored"] += 1
+
+
+def forget_template(source_id: str, fingerprint: str, sql: str):
+    # La plantilla re-bindeada falló al ejecutarse: no la volvemos a ofrecer
+    templates = _templates.get((str(source_id), fingerprint)) or {}
+    for shape in [s for s, t in templates.items() if t["sql"] == sql]:
+        del templates[shape]
+    _stats["rebind_failures"] += 1
+
+
+def record_empty_rebind():
+    # La plantilla re-bindeada no devolvió filas: se cuenta como miss y se regenera con el LLM
+    _stats["hits"] -= 1
+    _stats["misses"] += 1
+    _stats["empty_rebinds"] += 1
+
+
+def invalidate_sql_templates(source_id: str):
+    _templates.invalidate_where(lambda key: key[0] == str(source_id))
+
+
+def get_sql_template_stats() -> dict:
+    total = _stats["hits"] + _stats["misses"]
+    return {**_stats, "hit_rate": round(_stats["hits"] / total, 4) if total else 0.0, "sources": _templates.stats()["size"]}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los tests importan los módulos del backend igual que main.py ("services.x", "models")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+from services.cron_service import parse_cron, next_cron_time
+
+UTC = datetime.timezone.utc
+
+
+def at(*args):
+    return datetime.datetime(*args, tzinfo=UTC)
+
+
+def test_ranges_steps_and_lists():
+    minutes, hours, days, months, weekdays, day_or = parse_cron("*/15 9-17 1,15 * 1-5")
+    assert minutes == {0, 15, 30, 45}
+    assert hours == set(range(9, 18))
+    assert days == {1, 15}
+    assert months == set(range(1, 13))
+    assert weekdays == {1, 2, 3, 4, 5}
+    assert day_or is True
+
+
+def test_step_from_a_start_value():
+    assert parse_cron("5/20 * * * *")[0] == {5, 25, 45}
+
+
+def test_sunday_is_zero_or_seven():
+    assert 0 in parse_cron("0 0 * * 7")[4]
+
+
+@pytest.mark.parametrize("expr", [
+    "99 * * * *",       # minuto fuera de rango
+    "0 24 * * *",       # hora fuera de rango
+    "0 0 32 * *",
+    "5-2 * * * *",      # rango invertido
+    "*/0 * * * *",      # paso cero
+    "0 0 * *",          # faltan campos
+    "0 0 31 2 *",       # 31 de febrero no existe
+    "0 0 30,31 2 *",
+])
+def test_rejects_invalid_expressions(expr):
+    with pytest.raises(ValueError):
+        parse_cron(expr)
+
+
+def test_next_run_within_the_same_day():
+    parsed = parse_cron("*/15 9-17 * * 1-5")
+    # Lunes 19/10/2026 09:16 -> 09:30
+    assert next_cron_time(parsed, at(2026, 10, 19, 9, 16, 30)) == at(2026, 10, 19, 9, 30)
+
+
+def test_next_run_is_strictly_after():
+    parsed = parse_cron("0 9 * * *")
+    assert next_cron_time(parsed, at(2026, 10, 19, 9, 0)) == at(2026, 10, 20, 9, 0)
+
+
+def test_next_run_skips_the_weekend():
+    parsed = parse_cron("0 9 * * 1-5")
+    # Viernes 23/10/2026 10:00 -> lunes 26/10 09:00
+    assert next_cron_time(parsed, at(2026, 10, 23, 10, 0)) == at(2026, 10, 26, 9, 0)
+
+
+def test_day_of_month_or_day_of_week_when_both_restricted():
+    parsed = parse_cron("0 0 1 * 1")
+    # Desde el jueves 1/10/2026: el próximo lunes (5/10) llega antes que el día 1 del mes siguiente
+    assert next_cron_time(parsed, at(2026, 10, 1, 12, 0)) == at(2026, 10, 5, 0, 0)
+    # Desde el sábado 31/10/2026: el domingo 1/11 calza por día del mes
+    assert next_cron_time(parsed, at(2026, 10, 31, 12, 0)) == at(2026, 11, 1, 0, 0)
+
+
+def test_day_of_week_alone_is_not_ored_with_wildcard_day():
+    parsed = parse_cron("0 0 * * 1")
+    assert next_cron_time(parsed, at(2026, 10, 1, 12, 0)) == at(2026, 10, 5, 0, 0)
+
+
+def test_leap_day_waits_for_the_next_leap_year():
+    parsed = parse_cron("0 0 29 2 *")
+    assert next_cron_time(parsed, at(2026, 10, 19, 0, 0)) == at(2028, 2, 29, 0, 0)
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from services.sql_template_service import remember_template, find_template
+
+MONTH_SQL = "SELECT SUM(total) FROM ventas WHERE mes = 'marzo'"
+COUNTRY_SQL = "SELECT SUM(total) FROM ventas WHERE pais = 'Argentina' AND anio = 2024"
+
+
+def test_rebinds_values_of_the_same_kind():
+    remember_template("src-kind", "f", "ventas de marzo", MONTH_SQL)
+    assert find_template("src-kind", "f", "ventas de abril") == (
+        "SELECT SUM(total) FROM ventas WHERE mes = :p0", {"p0": "abril"}
+    )
+
+
+@pytest.mark.parametrize("question", ["ventas de hoy", "ventas de Argentina", "ventas de 2024", "ventas de SKU-12"])
+def test_does_not_rebind_a_different_kind(question):
+    remember_template("src-other", "f", "ventas de marzo", MONTH_SQL)
+    assert find_template("src-other", "f", question) is None
+
+
+def test_rebinds_several_slots_in_question_order():
+    remember_template("src-multi", "f", "ventas de Argentina en 2024", COUNTRY_SQL)
+    sql, params = find_template("src-multi", "f", "ventas de Chile en 2023")
+    assert sql == "SELECT SUM(total) FROM ventas WHERE pais = :p0 AND anio = :p1"
+    assert params == {"p0": "Chile", "p1": 2023}
+
+
+def test_relative_words_never_become_slots():
+    remember_template("src-relative", "f", "ventas de hoy", "SELECT SUM(total) FROM ventas WHERE dia = 'hoy'")
+    assert find_template("src-relative", "f", "ventas de ayer") is None
+
+
+def test_templates_are_scoped_to_the_schema_fingerprint():
+    remember_template("src-fp", "f1", "ventas de marzo", MONTH_SQL)
+    assert find_template("src-fp", "f2", "ventas de abril") is None
+
+
+def test_empty_rebind_regenerates_with_the_llm(monkeypatch):
+    # run_sql_agent necesita las dependencias completas del backend (LLM, drivers de la DB)
+    sql_service = pytest.importorskip("services.sql_service", exc_type=ImportError)
+
+    remember_template("src-empty", "f", "ventas de marzo", MONTH_SQL)
+    generated = "SELECT SUM(total) FROM ventas WHERE mes = 'Abril'"
+    calls = []
+
+    def fake_execute(engine, sql, params=None):
+        calls.append((sql, params))
+        rows = [] if params else [1500]
+        return {"columns": ["sum"], "data": [rows], "row_count": len(rows), "truncated": False}
+
+    async def fake_run_io(fn, *args):
+        return fn(*args)
+
+    async def fake_generate(question, schema_info, dialect):
+        return generated
+
+    monkeypatch.setattr(sql_service, "execute_bounded", fake_execute)
+    monkeypatch.setattr(sql_service, "run_io", fake_run_io)
+    monkeypatch.setattr(sql_service, "_generate_sql", fake_generate)
+
+    engine = type("Engine", (), {"dialect": type("Dialect", (), {"name": "postgresql"})()})()
+    context = {"source": {"id": "src-empty"}, "engine": engine, "schema": "", "fingerprint": "f", "timings": {}}
+    response = asyncio.run(sql_service.run_sql_agent("ventas de abril", context=context))
+
+    # Primero la plantilla re-bindeada (sin filas), después el SQL del LLM
+    assert calls[0][1] == {"p0": "abril"}
+    assert calls[-1] == (generated, None)
+    assert response["sql"] == generated
+    assert response["result"] == [{"sum": 1500}]
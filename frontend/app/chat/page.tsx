@@ -5,6 +5,7 @@ import axios from "axios"
 import { Canvas } from "@/components/canvas"
 import { AppSidebar } from "@/components/app-sidebar" 
 import { QueryInput } from "@/components/query-input"
+import { waitForIngestJob } from "@/lib/ingest-jobs"
 
 const API_URL = "http://localhost:8000"
 const USER_ID = "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11" 
@@ -35,7 +36,8 @@ export default function Home() {
         const formData = new FormData()
         formData.append("file", file)
         formData.append("user_id", USER_ID)
-        await axios.post(`${API_URL}/ingest/upload-file`, formData)
+        const upload = await axios.post(`${API_URL}/ingest/upload-file`, formData)
+        await waitForIngestJob(upload.data.job_id)
         
         setMessages((prev) => [...prev, { 
           role: "system", 
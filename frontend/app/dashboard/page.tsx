@@ -55,6 +55,20 @@ export default function DashboardPage() {
     }
   }
 
+  // Un solo request: el backend corre todas las consultas en paralelo (una por SQL repetido)
+  const handleRefreshAll = async () => {
+    setRefreshingId("all")
+    try {
+        const res = await axios.post("http://localhost:8000/dashboard/refresh-all?user_id=a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11")
+        setWidgets(res.data.widgets)
+    } catch (error) {
+        console.error(error)
+        alert("Error al actualizar datos.")
+    } finally {
+        setRefreshingId(null)
+    }
+  }
+
   return (
     <div className="flex min-h-screen bg-background font-sans">
       <AppSidebar />
@@ -69,10 +83,11 @@ export default function DashboardPage() {
                 <p className="text-gray-500 mt-2">Tus métricas clave y visualizaciones guardadas.</p>
             </div>
             <button 
-                onClick={fetchWidgets} 
+                onClick={handleRefreshAll} 
+                disabled={refreshingId === "all"}
                 className="text-sm text-gray-500 hover:text-gray-900 flex items-center gap-2"
             >
-                <RefreshCw size={14} /> Recargar Todo
+                <RefreshCw size={14} className={refreshingId === "all" ? "animate-spin" : ""} /> Recargar Todo
             </button>
         </header>
 
@@ -10,6 +10,7 @@ import {
 import { UploadModal } from "@/components/upload-modal";
 import { DataProfileModal } from "@/components/data-profile-modal"; // <--- 2. NUEVO COMPONENTE
 import { triggerSourcesUpdate } from "@/lib/events";
+import { waitForIngestJob } from "@/lib/ingest-jobs";
 
 const API_URL = "http://localhost:8000";
 
@@ -201,7 +202,8 @@ function AddSheetModal({ onClose, onSuccess }: { onClose: () => void, onSuccess:
     const handleSubmit = async (e: React.FormEvent) => {
         e.preventDefault(); setStatus("loading");
         try {
-            await axios.post(`${API_URL}/ingest/connection`, { name: formData.name, type: "gsheet", host: formData.url, port: "0", user: "", password: "", dbname: "" });
+            const res = await axios.post(`${API_URL}/ingest/connection`, { name: formData.name, type: "gsheet", host: formData.url, port: "0", user: "", password: "", dbname: "" });
+            await waitForIngestJob(res.data.job_id);
             onSuccess();
         } catch (error) { console.error(error); setStatus("error"); }
     };
@@ -33,10 +33,11 @@ export function AiChart({ data, title, type = 'bar', sql }: AiChartProps) {
   const yKey = keys[1];
 
   const totalItems = data.length;
-  const displayData = data.slice(0, MAX_ITEMS_DISPLAY);
-  const hiddenCount = totalItems - MAX_ITEMS_DISPLAY;
+  // Las líneas ya llegan muestreadas (LTTB) desde el backend: se dibujan completas y sin scroll
+  const displayData = type === 'line' ? data : data.slice(0, MAX_ITEMS_DISPLAY);
+  const hiddenCount = totalItems - displayData.length;
 
-  const isScrollable = type !== 'pie' && displayData.length > 4; 
+  const isScrollable = type === 'bar' && displayData.length > 4; 
   const chartWidth = isScrollable ? Math.max(1000, displayData.length * ITEM_WIDTH) : '100%';
 
   // --- ACTIONS ---
@@ -91,7 +92,7 @@ export function AiChart({ data, title, type = 'bar', sql }: AiChartProps) {
         return (
           <LineChart data={displayData}>
             <CartesianGrid strokeDasharray="3 3" vertical={false} stroke="#E5E7EB" />
-            <XAxis dataKey={xKey} axisLine={false} tickLine={false} tick={{fill: '#6B7280', fontSize: 12}} dy={10} interval={0} angle={-45} textAnchor="end" height={60} />
+            <XAxis dataKey={xKey} axisLine={false} tickLine={false} tick={{fill: '#6B7280', fontSize: 12}} dy={10} interval="preserveStartEnd" angle={-45} textAnchor="end" height={60} />
             <YAxis axisLine={false} tickLine={false} tick={{fill: '#6B7280', fontSize: 12}} />
             <Tooltip contentStyle={{borderRadius: '8px', border: 'none', boxShadow: '0 4px 6px -1px rgb(0 0 0 / 0.1)'}} cursor={{stroke: '#E5E7EB', strokeWidth: 2}} />
             <Line type="monotone" dataKey={yKey} stroke="#2563EB" strokeWidth={3} dot={{r: 4, fill: '#2563EB', strokeWidth: 2, stroke: '#fff'}} />
@@ -40,6 +40,7 @@ export function Canvas({ messages, isThinking }: CanvasProps) {
             title: customTitle,
             chart_type: pinData.data.chart_type || "bar",
             sql: pinData.data.sql,
+            source_id: pinData.data.source_id,
             data: pinData.data.result
         })
         alert("📌 ¡Guardado en Dashboard!")
@@ -87,9 +88,15 @@ export function Canvas({ messages, isThinking }: CanvasProps) {
                   <div className="mt-8 w-full bg-gray-50 rounded-lg p-2 border border-gray-200 animate-in zoom-in-95 duration-300">
                     <AiChart
                       data={msg.data.result}
-                      type={msg.data.chart_type || "bar"} 
+                      type={msg.data.chart_type || "bar"}
                     />
-                    
+
+                    {msg.data.truncated && (
+                        <p className="text-[11px] text-amber-600 mt-2 px-2">
+                            Resultado recortado: la consulta devolvió más filas de las que se muestran.
+                        </p>
+                    )}
+
                     <div className="flex justify-between items-center mt-3 pt-2 border-t border-gray-200/50 px-2">
                         <details className="text-[10px] text-gray-400 font-mono cursor-pointer relative group">
                             <summary className="hover:text-gray-600">Ver Query SQL</summary>
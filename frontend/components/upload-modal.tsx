@@ -4,6 +4,7 @@ import { useState, useRef } from "react";
 import axios from "axios";
 import { UploadCloud, FileText, X, CheckCircle2, Loader2, FileSpreadsheet } from "lucide-react";
 import clsx from "clsx";
+import { waitForIngestJob } from "@/lib/ingest-jobs";
 
 const API_URL = "http://localhost:8000"; // Ajusta si tu backend corre en otro puerto
 
@@ -16,6 +17,7 @@ export function UploadModal({ onClose, onSuccess }: UploadModalProps) {
   const [isDragging, setIsDragging] = useState(false);
   const [file, setFile] = useState<File | null>(null);
   const [status, setStatus] = useState<"idle" | "uploading" | "success" | "error">("idle");
+  const [progress, setProgress] = useState<string | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
 
   const handleDrag = (e: React.DragEvent) => {
@@ -64,9 +66,13 @@ export function UploadModal({ onClose, onSuccess }: UploadModalProps) {
     formData.append("user_id", "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11");
 
     try {
-      await axios.post(`${API_URL}/ingest/upload-file`, formData, {
+      const res = await axios.post(`${API_URL}/ingest/upload-file`, formData, {
         headers: { "Content-Type": "multipart/form-data" },
       });
+      // El backend encola la ingesta y devuelve el job: seguimos su progreso
+      await waitForIngestJob(res.data.job_id, (job) => {
+        setProgress(job.rows_loaded ? `${job.stage ?? "..."} · ${job.rows_loaded.toLocaleString()} filas` : job.stage);
+      });
       setStatus("success");
       setTimeout(() => {
         onSuccess();
@@ -161,7 +167,7 @@ export function UploadModal({ onClose, onSuccess }: UploadModalProps) {
               >
                 {status === "uploading" ? (
                   <>
-                    <Loader2 className="w-5 h-5 animate-spin" /> Procesando con IA...
+                    <Loader2 className="w-5 h-5 animate-spin" /> {progress ? `Procesando (${progress})` : "Procesando con IA..."}
                   </>
                 ) : (
                   "Analizar Documento"
@@ -0,0 +1,27 @@
+import axios from "axios";
+
+const API_URL = "http://localhost:8000";
+
+export interface IngestJob {
+    id: string;
+    status: "PENDING" | "RUNNING" | "DONE" | "FAILED";
+    stage: string | null;
+    stages: { name: string; status: string; seconds?: number; error?: string }[];
+    rows_loaded: number;
+    error: string | null;
+}
+
+// La ingesta corre en segundo plano: consultamos el job hasta que termine (o falle)
+export async function waitForIngestJob(
+    jobId: string,
+    onProgress?: (job: IngestJob) => void,
+    intervalMs = 1500
+): Promise<IngestJob> {
+    while (true) {
+        const { data } = await axios.get<IngestJob>(`${API_URL}/ingest/jobs/${jobId}`);
+        onProgress?.(data);
+        if (data.status === "DONE") return data;
+        if (data.status === "FAILED") throw new Error(data.error || "La ingesta falló");
+        await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+}